@@ -9,37 +9,291 @@ Routes:
     - GET /songs/<song_id>: Retrieve song metadata by song ID.
     - POST /change_key: Modify the musical key of a song.
     - POST /change_bpm: Modify the BPM (tempo) of a song.
+    - POST /harmonize: Generate harmony voices for a song on demand.
     - POST /reset: Reset modifications made to a song.
     - POST /get_lyrics: Extract lyrics from a song.
+    - GET /jobs/<job_id>: Retrieve the status and result of a queued job.
+    - GET /scheduler: Running and waiting requests per scheduling class.
+    - POST /migrate_stems: Convert WAV songs and stems to STEM_FORMAT in the background.
+    - GET /separation_tiers: Separation models and their measured real-time factors.
+    - GET /warmup: Warm-up state of this process and first-request latencies, cold and warm.
+
+Renders, lyrics and uploads go through a priority scheduler (see scheduler.py):
+interactive requests are admitted before uploads, and uploads before background renders.
+Requests of a saturated class are refused with 429 and a Retry-After header.
+
+Long-running work is cancelled cooperatively when the client that requested it
+disconnects from its Socket.IO room, when a newer upload of the same song supersedes it,
+or when its deadline (RENDER_DEADLINE_SECONDS, INGEST_DEADLINE_SECONDS) passes.
+
+When JOB_QUEUE is enabled, uploads and renders are enqueued for worker.py processes and
+the routes answer 202 with a job ID instead of doing the work in the request. When
+CPU_POOL_WORKERS is set, they run in a local process pool instead (see cpu_pool.py).
+`python app.py` starts the development server; use serve.py in production.
 
 Dependencies:
     - Flask, Flask-CORS, Flask-PyMongo, and MongoDB.
 """
 
 import os
+import json
+import math
 import time
-from flask import Flask, request, jsonify, send_from_directory
+import functools
+import contextlib
+import mimetypes
+from datetime import datetime, timezone
+from flask import Flask, Response, request, jsonify, send_file, g
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from controllers.song_controller import SongController 
-from flask_socketio import SocketIO, emit
+from cpu_pool import CpuPool
+from models.job_model import JobModel
+from models.first_request_model import FirstRequestModel
+from utils.harmony import parse_voices
+from utils.mixdown import MIX_FORMATS
+from utils.audio_processing import choose_separation_tier, FAST_TIER, SEPARATION_UPGRADE
+from tasks import run_task, INGEST_DEADLINE_SECONDS, RENDER_DEADLINE_SECONDS
+from scheduler import Scheduler, Saturated, PRIORITIES, INTERACTIVE, INGEST, BACKGROUND, job_class
+from utils.progress import notify_complete
+from utils.cancellation import Cancelled, cancel_scope, cancel
+from utils.stream_engine import stream_transform
+from flask_socketio import SocketIO, emit, join_room
+from werkzeug.security import safe_join
+from werkzeug.http import http_date, quote_etag, is_resource_modified
+from utils.storage import get_storage, parse_range
+from utils.warmup import configure_jit_cache, warm_up, warmup_status, first_request, WARMUP
+from utils.fft_backend import fft_workers
+
+# Before anything imports numba (librosa is loaded on first use), so compiled kernels
+# are kept on disk and shared with the process pool
+configure_jit_cache()
 
 # Application configuration
 app = Flask(__name__)
-app.config["MONGO_URI"] = "mongodb://localhost:27017/musicnalyzer"
-app.config["UPLOAD_FOLDER"] = "uploads"  # Ensure you have an "uploads" folder
+app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/musicnalyzer")
+app.config["UPLOAD_FOLDER"] = os.getenv("UPLOAD_FOLDER", "uploads")  # Ensure you have an "uploads" folder
 app.config["ALLOWED_EXTENSIONS"] = {"mp3", "wav"}  # Allow both mp3 and wav
 mongo = PyMongo(app)
 app.config['mongo'] = mongo
+app.config["JOB_QUEUE"] = os.getenv("JOB_QUEUE", "false").lower() == "true"
+app.config["CPU_POOL_WORKERS"] = int(os.getenv("CPU_POOL_WORKERS", "0"))
+app.config["SOCKETIO_MESSAGE_QUEUE"] = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+app.config["RENDER_DEADLINE_SECONDS"] = RENDER_DEADLINE_SECONDS
+app.config["INGEST_DEADLINE_SECONDS"] = INGEST_DEADLINE_SECONDS
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading",
+                    message_queue=app.config["SOCKETIO_MESSAGE_QUEUE"])
 
 # Initialize application controller
-song_controller = SongController(mongo)
+job_model = JobModel(mongo)
+cpu_pool = None
+if app.config["CPU_POOL_WORKERS"] > 0:
+    cpu_pool = CpuPool(app.config["CPU_POOL_WORKERS"], app.config["MONGO_URI"], app.config["SOCKETIO_MESSAGE_QUEUE"])
+song_controller = SongController(mongo, job_model if app.config["JOB_QUEUE"] else None, cpu_pool)
+scheduler = Scheduler()
+first_request_model = FirstRequestModel(mongo)
+
+# Socket.IO session ID -> job rooms it joined, cancelled when the session disconnects
+client_rooms = {}
+
+
+@socketio.on("join")
+def join_job_room(data):
+    """
+    Subscribe the client to the progress events of one job.
+
+    Parameters:
+        data (dict): Contains 'job_id', the room to join.
+    """
+    job_id = (data or {}).get("job_id")
+    if job_id:
+        join_room(job_id)
+        client_rooms.setdefault(request.sid, set()).add(job_id)
+
+
+@socketio.on("disconnect")
+def cancel_client_jobs(*args):
+    """
+    Cancel the jobs of a client that disconnected; nobody is left to receive their results.
+    """
+    for room in client_rooms.pop(request.sid, ()):
+        cancel(room, "client disconnected")
+        if app.config["JOB_QUEUE"]:
+            job_model.request_cancel(room=room, reason="client disconnected")
+
+
+@app.errorhandler(Saturated)
+def refuse_saturated(e):
+    """
+    Answer a request refused by the scheduler with 429 and a Retry-After header.
+    """
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 429
+
+
+def warm_up_on_render():
+    """
+    Start this process's warm-up in the background when it first renders audio itself.
+
+    Web processes serving only metadata and audio never load librosa; with JOB_QUEUE or
+    a CPU pool, only previews, mixes and streams render here.
+    """
+    if WARMUP and warmup_status()["state"] == "cold":
+        socketio.start_background_task(warm_up)
+
+
+def scheduled(job_type, queued=True):
+    """
+    Run a route under the scheduling class of its task handler.
+
+    Work done in this process (inline, in the process pool, or a preview) holds a slot
+    of its class. Work handed to the job queue is only admitted while the queue holds
+    fewer jobs of its class than the class allows; routes that never enqueue (queued
+    False) take a slot in queue mode too. Work holding a slot runs its FFTs on the
+    slot's thread budget. The first request of each job type (and of its previews) in
+    this process is timed once it holds its slot.
+
+    A view that renders while its response is sent sets `g.render_stream`; its slot is
+    then held until the response is closed instead of until the view returns.
+
+    Parameters:
+        job_type (str): Task handler name of the route.
+        queued (bool): Whether the route hands its work to the job queue in queue mode.
+    """
+    request_class = job_class(job_type)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            preview = request.is_json and (request.get_json(silent=True) or {}).get("preview")
+            if queued and app.config["JOB_QUEUE"] and not preview:
+                scheduler.admit_queued(job_model, request_class)
+                return view(*args, **kwargs)
+            slot = contextlib.ExitStack()
+            slot.enter_context(scheduler.slot(request_class))
+            if preview or not queued or cpu_pool is None:
+                warm_up_on_render()
+            try:
+                with fft_workers(scheduler.thread_budget()), \
+                        first_request(f"{job_type}:preview" if preview else job_type, first_request_model):
+                    response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                slot.close()
+                raise
+            if g.get("render_stream"):
+                response.call_on_close(slot.close)
+            else:
+                slot.close()
+            return response
+        return wrapper
+    return decorator
+
+
+def stream_with_budget(chunks):
+    """
+    Run a streamed render on the thread budget of the request's slot.
+
+    Parameters:
+        chunks (iterable): Chunks of the response body, rendered as they are consumed.
+
+    Returns:
+        generator: The same chunks.
+    """
+    workers = scheduler.thread_budget()
+    with fft_workers(workers):
+        yield from chunks
+
+
+def enqueue_job(job_type, payload):
+    """
+    Hand a request to the worker pool instead of processing it in this process.
+
+    Parameters:
+        job_type (str): Task handler name.
+        payload (dict): Arguments for the task handler.
+
+    Returns:
+        Response: 202 JSON response with the job ID to poll at /jobs/<job_id>.
+    """
+    job_id = job_model.enqueue(job_type, payload, PRIORITIES[job_class(job_type)])
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+def offload(job_type, payload):
+    """
+    Run a CPU-heavy handler in the process pool and wait for its result.
+
+    Parameters:
+        job_type (str): Task handler name.
+        payload (dict): Arguments for the task handler.
+
+    Returns:
+        Response: JSON response with the handler result and its status code.
+    """
+    result = cpu_pool.run(job_type, payload)
+    return jsonify(result), result.get("status_code", 200) if isinstance(result, dict) else 200
+
 
+def run_background(job_type, payload):
+    """
+    Run a background render once the scheduler admits it.
+
+    Parameters:
+        job_type (str): Task handler name.
+        payload (dict): Arguments for the task handler.
+    """
+    try:
+        with scheduler.slot(BACKGROUND):
+            if cpu_pool is not None:
+                cpu_pool.run(job_type, payload)
+            else:
+                warm_up_on_render()
+                with fft_workers(scheduler.thread_budget()):
+                    run_task(song_controller, job_type, payload, socketio)
+    except Saturated as e:
+        notify_complete(socketio, payload.get("jobId"), job_type, {"error": str(e), "status_code": 429})
+
+
+def render_in_background(job_type, payload):
+    """
+    Run the full-quality render behind a preview without blocking the request.
+
+    The result is pushed to the payload's 'jobId' room as a 'job_complete' event by
+    tasks.run_task, wherever the render runs: a queue worker, the process pool or a
+    background thread of this process. Background renders have the lowest priority; if
+    they are refused, the refusal is pushed instead and the client keeps the preview.
+
+    Parameters:
+        job_type (str): Task handler name ('change_key' or 'change_bpm').
+        payload (dict): Arguments for the task handler.
+    """
+    payload = {**payload, "preview": False}
+    if app.config["JOB_QUEUE"]:
+        try:
+            scheduler.admit_queued(job_model, BACKGROUND)
+            job_model.enqueue(job_type, payload, PRIORITIES[BACKGROUND])
+        except Saturated as e:
+            notify_complete(socketio, payload.get("jobId"), job_type, {"error": str(e), "status_code": 429})
+    else:
+        socketio.start_background_task(run_background, job_type, payload)
+
+
+def ingest_backlog():
+    """
+    Number of uploads waiting for processing, used to pick the separation tier.
+
+    Returns:
+        int: Queued ingest jobs in queue mode, otherwise uploads waiting for a slot.
+    """
+    if app.config["JOB_QUEUE"]:
+        return job_model.queue_depth(PRIORITIES[INGEST])
+    return scheduler.stats()[INGEST]["waiting"]
 
 
 @app.route("/insert", methods=["POST"])
+@scheduled("ingest")
 def insert_song():
     """
     Insert a new song into the database with uploaded audio, artist details, and duration.
@@ -49,6 +303,16 @@ def insert_song():
         - isSolo (str): Whether the song is a solo performance.
         - artist (str): Name of the artist.
         - duration (str): Duration of the song in seconds.
+        - voices (str, optional): JSON list of {"name", "interval"} harmony voices for solo songs.
+        - diatonic (str, optional): Whether to keep the harmony voices within the detected key.
+        - jobId (str, optional): Socket.IO room the client joined to receive this upload's progress.
+        - duplicate (str, optional): 'reuse' to reuse the stems and analysis of a near-duplicate
+          found by fingerprint, 'ignore' to process the upload anyway. Without it, a
+          near-duplicate is answered with 409 and the candidate; with JOB_QUEUE, the 409
+          and the candidate are the result of the queued job.
+        - tier (str, optional): Separation tier, 'fast', 'hq' or 'auto' (SEPARATION_TIER by
+          default). 'auto' uses the fast model while other uploads are waiting; songs
+          separated with it are re-separated with the high-quality model in the background.
 
     Returns:
         Response: JSON response indicating success or failure of the operation.
@@ -61,25 +325,176 @@ def insert_song():
     is_solo = request.form.get('isSolo').capitalize()
     artist = request.form.get('artist', "")
     duration = request.form.get('duration', "0")
+    diatonic = request.form.get('diatonic', "false").lower() == "true"
+    duplicate = request.form.get('duplicate')
+    if duplicate not in (None, "reuse", "ignore"):
+        return jsonify({"error": "duplicate must be 'reuse' or 'ignore'"}), 400
 
-    response = song_controller.insert_song(app, socketio, emit, file, is_solo, artist, duration)
+    try:
+        voices = parse_voices(json.loads(request.form['voices'])) if request.form.get('voices') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid voices: {e}"}), 400
 
-    return jsonify(response), response.get("status_code", 200)
+    try:
+        separation_tier = choose_separation_tier(request.form.get('tier'), ingest_backlog())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = song_controller.insert_song(app, socketio, emit, file, is_solo, artist, duration,
+                                           voices=voices, diatonic=diatonic, job_id=request.form.get('jobId'),
+                                           duplicate=duplicate, separation_tier=separation_tier)
+
+    status_code = response.get("status_code", 200)
+    # Queue workers enqueue the upgrade themselves; without a jobId, a disconnect of the
+    # uploading client does not cancel it
+    if (status_code == 200 and not app.config["JOB_QUEUE"] and SEPARATION_UPGRADE
+            and response.get("separation_tier") == FAST_TIER):
+        render_in_background("upgrade_separation", {"song_id": response["song_id"]})
+    return jsonify(response), status_code
 
 
 @app.route('/uploads/<song_id>/<path:filename>', methods=['GET'])
 def serve_audio(song_id, filename):
     """
-    Serve an uploaded audio file from the server.
+    Serve an uploaded audio file from the storage backend in chunks.
+
+    Single byte ranges are answered with 206 Partial Content, so players can seek
+    without downloading the whole file, on any node sharing the storage. Responses carry
+    an ETag (the GridFS revision, or the file's mtime and size) and Last-Modified, and
+    revalidations that still match are answered with 304; an If-Range that no longer
+    matches gets the whole file. The file is looked up once per request. Harmony voices
+    recorded as virtual at upload are rendered on their first request.
 
     Parameters:
         song_id (str): ID of the song to retrieve.
         filename (str): Name of the file within the song's directory.
 
     Returns:
-        Response: Audio file to be sent to the client.
+        Response: Audio file (or the requested range of it) to be sent to the client.
     """
-    return send_from_directory(os.path.join(app.config["UPLOAD_FOLDER"], song_id), filename)
+    storage = get_storage()
+    path = safe_join(app.config["UPLOAD_FOLDER"], song_id, filename)
+    info = storage.stat(path) if path is not None else None
+    if path is not None and info is None and song_controller.virtual_part(path):
+        warm_up_on_render()
+        try:
+            with scheduler.slot(INTERACTIVE), \
+                    cancel_scope([], app.config["RENDER_DEADLINE_SECONDS"]) as token:
+                song_controller.materialize_stem(path, token)
+        except Cancelled as e:
+            return jsonify({"error": f"Rendering {filename} cancelled: {e.reason}"}), e.status_code
+        info = storage.stat(path)
+    if info is None:
+        return jsonify({"error": "File not found"}), 404
+
+    size, etag = info["size"], info["etag"]
+    # HTTP dates have whole seconds
+    last_modified = datetime.fromtimestamp(int(info["mtime"]), timezone.utc)
+    headers = {"Accept-Ranges": "bytes", "ETag": quote_etag(etag), "Last-Modified": http_date(last_modified),
+               "Cache-Control": "no-cache"}
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    range_header = request.headers.get("Range")
+    if_range = request.if_range
+    if range_header and (if_range.etag or if_range.date):
+        # A range of another revision must not be combined with this one
+        if if_range.etag != etag and (if_range.date is None or last_modified > if_range.date):
+            range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+
+    start, end, status = 0, size - 1, 200
+    if byte_range is not None:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return Response(storage.read_range(path, start, end, info=info), status, headers=headers,
+                    mimetype=mimetype, direct_passthrough=True)
+
+
+@app.route('/mix/<song_id>', methods=['GET'])
+@scheduled("mix", queued=False)
+def mix_song(song_id):
+    """
+    Serve a song's stems mixed into a single compressed stream.
+
+    Query parameters:
+        - <stem> (float, optional): Linear gain per stem (e.g. soprano=0.5&instrumental=1.2),
+          quantized to steps of 0.05 between 0 and 2. Stems without a gain play at 1.0.
+        - key (int, optional): Semitones to shift the mix by.
+        - bpm (int, optional): Target BPM of the mix.
+        - format (str, optional): 'ogg' (default) or 'mp3'.
+
+    Returns:
+        Response: Encoded mix, cacheable by clients since its URL identifies its content.
+    """
+    try:
+        params = request.args.to_dict()
+        fmt = params.pop("format", "ogg").lower()
+        key_shift = int(params.pop("key", 0))
+        bpm = int(params.pop("bpm")) if params.get("bpm") else None
+        params.pop("bpm", None)
+        gains = {name.lower(): float(gain) for name, gain in params.items()}
+        invalid = [name for name, gain in gains.items() if not math.isfinite(gain)]
+        if invalid:
+            raise ValueError(f"gain of {', '.join(invalid)} is not a finite number")
+    except ValueError as e:
+        return jsonify({"error": f"Invalid mix parameters: {e}"}), 400
+
+    try:
+        result = song_controller.mix(song_id, gains, key_shift, bpm, fmt)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return send_file(os.path.abspath(result), mimetype=MIX_FORMATS[fmt][2], conditional=True, max_age=86400)
+    except Exception as e:
+        print(f"Error in /mix endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/stream/<song_id>/<stem>', methods=['GET'])
+@scheduled("stream", queued=False)
+def stream_variant(song_id, stem):
+    """
+    Stream a key- and/or tempo-changed stem while it is being rendered.
+
+    A variant that is already in the render cache (a full-quality change_key/change_bpm
+    render, or an earlier stream) is served from disk. Otherwise the stem is transformed
+    block by block and sent as a chunked WAV response, and the completed render is saved
+    to the stream cache for later requests. The render holds an interactive slot until
+    the response is closed.
+
+    Query parameters:
+        - key (int, optional): Semitones to shift the stem by.
+        - bpm (int, optional): Target BPM.
+
+    Returns:
+        Response: WAV audio of the variant.
+    """
+    try:
+        key_shift = int(request.args.get("key", 0))
+        bpm = int(request.args["bpm"]) if request.args.get("bpm") else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid stream parameters: {e}"}), 400
+
+    try:
+        variant = song_controller.stream_variant(song_id, stem.lower(), key_shift, bpm)
+        if isinstance(variant, tuple):
+            return jsonify(variant[0]), variant[1]
+        for cached in (variant["path"], variant["stream_path"]):
+            if get_storage().ensure_local(cached):
+                return send_file(os.path.abspath(cached), conditional=True,
+                                 mimetype=mimetypes.guess_type(cached)[0] or "audio/wav")
+        chunks = stream_transform(variant["source"], variant["stream_path"], variant["n_steps"],
+                                  variant["tempo_rate"])
+        g.render_stream = True
+        return Response(stream_with_budget(chunks), mimetype="audio/wav", direct_passthrough=True)
+    except Exception as e:
+        print(f"Error in /stream endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route("/songs/<song_id>", methods=["GET"])
@@ -102,20 +517,57 @@ def get_song_by_id(song_id):
         return jsonify({"error": f"Error fetching song: {e}"}), 500
 
 
+@app.route("/songs/<song_id>/features", methods=["GET"])
+def get_song_features(song_id):
+    """
+    Retrieve the spectral feature summaries of a song (chroma, loudness, centroid,
+    rolloff, onset strength, MFCCs) and the time each feature took to compute.
+
+    Parameters:
+        song_id (str): Unique identifier of the song.
+
+    Returns:
+        Response: JSON feature document, or an error message if none exists.
+    """
+    try:
+        result = song_controller.get_features(song_id)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"error": f"Error fetching features: {e}"}), 500
+
+
 @app.route('/change_key', methods=['POST'])
+@scheduled("change_key")
 def modify_key():
     """
     Modify the musical key of a song and store the updated version.
 
     Request data:
-        - JSON object containing song ID and key modification details.
+        - JSON object containing song ID and key modification details. With 'preview'
+          set, a short region (around 'playhead', if given) is rendered quickly and
+          returned, and the full render is pushed to the 'jobId' room when done.
 
     Returns:
         Response: JSON object with updated song key data or error information.
     """
     try:
         data = request.get_json()
-        new_key_data = song_controller.change_key(data)
+        if data.get('preview'):
+            preview = song_controller.preview_key(data)
+            if isinstance(preview, tuple):
+                return jsonify(preview[0]), preview[1]
+            render_in_background("change_key", data)
+            return jsonify(preview)
+        if app.config["JOB_QUEUE"]:
+            return enqueue_job("change_key", data)
+        if cpu_pool is not None:
+            return offload("change_key", data)
+        with cancel_scope([data.get('jobId')], app.config["RENDER_DEADLINE_SECONDS"]) as token:
+            new_key_data = song_controller.change_key(data, token)
+        if isinstance(new_key_data, tuple):
+            return jsonify(new_key_data[0]), new_key_data[1]
         return jsonify(new_key_data)
     except Exception as e:
         print(f"Error: {e}")
@@ -123,25 +575,70 @@ def modify_key():
 
 
 @app.route('/change_bpm', methods=['POST'])
+@scheduled("change_bpm")
 def modify_bpm():
     """
     Modify the BPM (tempo) of a song and store the updated version.
 
     Request data:
-        - JSON object containing song ID and BPM modification details.
+        - JSON object containing song ID and BPM modification details. With 'preview'
+          set, a short region (around 'playhead', if given) is rendered quickly and
+          returned, and the full render is pushed to the 'jobId' room when done.
 
     Returns:
         Response: JSON object with updated song BPM data or error information.
     """
     try:
         data = request.get_json()
-        new_bpm_data = song_controller.change_bpm(data)
+        if data.get('preview'):
+            preview = song_controller.preview_bpm(data)
+            if isinstance(preview, tuple):
+                return jsonify(preview[0]), preview[1]
+            render_in_background("change_bpm", data)
+            return jsonify(preview)
+        if app.config["JOB_QUEUE"]:
+            return enqueue_job("change_bpm", data)
+        if cpu_pool is not None:
+            return offload("change_bpm", data)
+        with cancel_scope([data.get('jobId')], app.config["RENDER_DEADLINE_SECONDS"]) as token:
+            new_bpm_data = song_controller.change_bpm(data, token)
+        if isinstance(new_bpm_data, tuple):
+            return jsonify(new_bpm_data[0]), new_bpm_data[1]
         return jsonify(new_bpm_data)
     except Exception as e:
         print(f"Error in /change_bpm endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/harmonize', methods=['POST'])
+@scheduled("harmonize")
+def harmonize():
+    """
+    Generate harmony voices for a song from its Soprano stem.
+
+    Request data:
+        - JSON object containing song ID, a list of voices ({"name", "interval"} in semitones)
+          and an optional 'diatonic' flag to keep voices within the song's key.
+
+    Returns:
+        Response: JSON object with paths to the generated voices or error information.
+    """
+    try:
+        data = request.get_json()
+        if app.config["JOB_QUEUE"]:
+            return enqueue_job("harmonize", data)
+        if cpu_pool is not None:
+            return offload("harmonize", data)
+        with cancel_scope([data.get('jobId')], app.config["RENDER_DEADLINE_SECONDS"]) as token:
+            result = song_controller.harmonize(data, token)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error in /harmonize endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/reset', methods=['POST'])
 def reset_modifications():
     """
@@ -164,12 +661,13 @@ def reset_modifications():
 
 
 @app.route('/get_lyrics', methods=['POST'])
+@scheduled("get_lyrics")
 def get_lyrics():
     """
     Extract lyrics from a song and return them as text.
 
     Request data:
-        - JSON object containing song ID.
+        - JSON object containing song ID and optionally the jobId room for transcription progress.
 
     Returns:
         Response: JSON object with lyrics or error information.
@@ -177,12 +675,109 @@ def get_lyrics():
     try:
         data = request.get_json()
         song_id = data.get('songId')
-        result = song_controller.get_lyrics(song_id)
+        if app.config["JOB_QUEUE"]:
+            return enqueue_job("get_lyrics", {"songId": song_id, "jobId": data.get('jobId')})
+        if cpu_pool is not None:
+            return offload("get_lyrics", {"songId": song_id, "jobId": data.get('jobId')})
+        with cancel_scope([data.get('jobId')], app.config["RENDER_DEADLINE_SECONDS"]) as token:
+            result = song_controller.get_lyrics(song_id, socketio, data.get('jobId'), token)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
         return jsonify(result)
     except Exception as e:
         print(f"Error in /get_lyrics endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Retrieve the status of a queued job and its result once finished.
+
+    Parameters:
+        job_id (str): ID returned when the job was enqueued.
+
+    Returns:
+        Response: JSON object with job status, attempts, result and error.
+    """
+    job = job_model.find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "job_id": str(job["_id"]),
+        "type": job["type"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+    }), 200
+
+
+@app.route('/migrate_stems', methods=['POST'])
+def migrate_stems():
+    """
+    Convert the WAV files of one song or of the whole library to STEM_FORMAT.
+
+    The migration runs as a background job (lowest priority). Its report, with the bytes
+    saved and the decode time of the converted files against the WAVs, is pushed to the
+    'jobId' room as a 'job_complete' event and, in queue mode, stored on the job.
+
+    Request data:
+        - JSON object with an optional songId (all songs by default) and jobId room.
+
+    Returns:
+        Response: 202 JSON response with the job ID or room to follow.
+    """
+    data = request.get_json(silent=True) or {}
+    payload = {"songId": data.get('songId'), "jobId": data.get('jobId')}
+    if app.config["JOB_QUEUE"]:
+        scheduler.admit_queued(job_model, BACKGROUND)
+        return enqueue_job("migrate_stems", payload)
+    socketio.start_background_task(run_background, "migrate_stems", payload)
+    return jsonify({"status": "migration started", "jobId": payload["jobId"]}), 202
+
+
+@app.route('/separation_tiers', methods=['GET'])
+def separation_tiers():
+    """
+    Report the separation model of every tier with its measured real-time factor.
+
+    Returns:
+        Response: JSON object with the tiers, the default tier and whether fast-tier
+                  songs are upgraded in the background.
+    """
+    return jsonify(song_controller.separation_tiers()), 200
+
+
+@app.route('/warmup', methods=['GET'])
+def warmup():
+    """
+    Report the warm-up of this process and first-request latencies of all processes.
+
+    Returns:
+        Response: JSON object with this process's warm-up state, step timings and
+                  first-request seconds, and the stored first-request latencies per
+                  process kind and job type, split into cold and warmed processes.
+    """
+    return jsonify({"process": warmup_status(), "first_requests": first_request_model.summary()}), 200
+
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler_stats():
+    """
+    Report running and waiting requests, slot limits and average run times per class.
+
+    Returns:
+        Response: JSON object keyed by scheduling class, with the job queue depth per
+                  class when JOB_QUEUE is enabled.
+    """
+    stats = scheduler.stats()
+    if app.config["JOB_QUEUE"]:
+        for name, priority in PRIORITIES.items():
+            stats[name]["queued_jobs"] = job_model.queue_depth(priority)
+    return jsonify(stats), 200
+
+
 if __name__ == '__main__':
+    # Development server only; see serve.py for the production entry point
     socketio.run(app, debug=True, allow_unsafe_werkzeug=True)
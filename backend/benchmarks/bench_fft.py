@@ -0,0 +1,105 @@
+"""
+Benchmark of librosa's FFT-heavy operations with numpy.fft against scipy.fft on
+several thread counts.
+
+Runs STFT/ISTFT, pitch shift, time stretch, HPSS and constant-Q chroma on a synthetic
+signal (or a given file) under every backend, after one untimed run so JIT compilation
+and FFT planning are not counted. Reports the median seconds and throughput (seconds of
+audio per second) of every operation, and the speed-up against numpy.fft.
+
+Usage:
+    python benchmarks/bench_fft.py [--file song.wav] [--seconds 30] [--repeats 3] [--workers 1 2 4]
+
+Dependencies:
+    - numpy: Timings.
+    - librosa: Operations under test.
+    - utils.fft_backend: scipy.fft view with per-thread worker counts.
+    - utils.warmup.synthetic_signal: Test signal when no file is given.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import librosa  # noqa: E402
+from utils.fft_backend import ScipyFFT, fft_workers  # noqa: E402
+from utils.warmup import synthetic_signal  # noqa: E402
+
+
+def operations(audio, sample_rate):
+    """
+    FFT-heavy operations of the render and analysis paths.
+
+    Returns:
+        list: (name, callable) pairs.
+    """
+    stft = librosa.stft(audio)
+    return [
+        ("stft", lambda: librosa.stft(audio)),
+        ("istft", lambda: librosa.istft(stft, length=len(audio))),
+        ("pitch_shift", lambda: librosa.effects.pitch_shift(y=audio, sr=sample_rate, n_steps=2)),
+        ("time_stretch", lambda: librosa.effects.time_stretch(audio, rate=1.1)),
+        ("hpss", lambda: librosa.effects.hpss(audio)),
+        ("chroma_cqt", lambda: librosa.feature.chroma_cqt(y=audio, sr=sample_rate, bins_per_octave=24)),
+    ]
+
+
+def measure(operation, repeats):
+    """
+    Median wall-clock time of an operation, after one untimed run.
+
+    Returns:
+        float: Median seconds.
+    """
+    operation()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare FFT backends on librosa operations.")
+    parser.add_argument("--file", help="Audio file to process instead of a synthetic signal.")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the signal.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, os.cpu_count() or 1}), help="scipy.fft thread counts.")
+    args = parser.parse_args(argv)
+
+    if args.file:
+        audio, sample_rate = librosa.load(args.file, sr=None, duration=args.seconds)
+    else:
+        sample_rate = 44100
+        audio = synthetic_signal(args.seconds, sample_rate)
+    audio_seconds = len(audio) / sample_rate
+
+    backends = [("numpy", None, 1)] + [(f"scipy x{workers}", ScipyFFT(), workers) for workers in args.workers]
+    results = {}
+    for label, lib, workers in backends:
+        with fft_workers(workers):
+            librosa.set_fftlib(lib)
+            results[label] = {name: measure(operation, args.repeats)
+                              for name, operation in operations(audio, sample_rate)}
+    librosa.set_fftlib(None)
+
+    names = list(results["numpy"])
+    print(f"Signal: {audio_seconds:.1f}s at {sample_rate} Hz, median of {args.repeats} runs\n")
+    print(f"{'operation':<14} {'backend':<10} {'seconds':>8} {'x realtime':>11} {'speed-up':>9}")
+    for name in names:
+        baseline = results["numpy"][name]
+        for label, _, _ in backends:
+            seconds = results[label][name]
+            print(f"{name:<14} {label:<10} {seconds:>8.3f} {audio_seconds / seconds:>11.1f} "
+                  f"{baseline / seconds:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
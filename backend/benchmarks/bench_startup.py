@@ -0,0 +1,83 @@
+"""
+Startup benchmark for the Flask app: import time and time-to-first-request.
+
+Starts fresh interpreters that import `app`, serve one request through Flask's test
+client, and report how long each step took and which heavy ML modules ended up loaded.
+Serving metadata and audio must never load them; they are imported lazily by the
+processing code on first use.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--path /uploads/startup/missing.wav]
+
+Exits with status 1 when any heavy module was loaded, so it can run as a CI check.
+
+Dependencies:
+    - subprocess: Fresh interpreter per run, so import caches do not carry over.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["librosa", "madmom", "audio_separator", "whisper", "ffmpeg", "torch",
+                 "onnxruntime", "numba", "scipy"]
+
+# Runs in the child interpreter; lazily loaded modules sit in sys.modules as
+# importlib's _LazyModule until an attribute is first accessed
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+heavy = json.loads(sys.argv[2])
+loaded = [name for name in heavy
+          if name in sys.modules and type(sys.modules[name]).__name__ != "_LazyModule"]
+print(json.dumps({"import_s": imported - started, "first_request_s": served - started,
+                  "status": response.status_code, "loaded": loaded}))
+"""
+
+
+def probe(path):
+    """
+    Import the app and serve one request in a fresh interpreter.
+
+    Parameters:
+        path (str): Request path to serve.
+
+    Returns:
+        dict: Import and first-request seconds, response status and loaded heavy modules.
+    """
+    result = subprocess.run([sys.executable, "-c", PROBE, path, json.dumps(HEAVY_MODULES)],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app import time and time-to-first-request.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/uploads/startup/missing.wav",
+                        help="Request path served by the first request (should not need MongoDB).")
+    args = parser.parse_args(argv)
+
+    runs = [probe(args.path) for _ in range(args.runs)]
+    import_s = statistics.median(run["import_s"] for run in runs)
+    first_request_s = statistics.median(run["first_request_s"] for run in runs)
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+
+    print(f"Runs: {args.runs}")
+    print(f"Import app (median): {import_s * 1000:.0f} ms")
+    print(f"Time to first request (median): {first_request_s * 1000:.0f} ms "
+          f"(status {runs[-1]['status']})")
+    print(f"Heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+    return 1 if loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
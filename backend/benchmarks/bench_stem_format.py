@@ -0,0 +1,105 @@
+"""
+Benchmark of stem storage formats: bytes on disk against encode and decode cost.
+
+Writes every audio file of a folder as float WAV (the separator's default), 16-bit WAV,
+16-bit and 24-bit FLAC, and its decoded analysis sidecar as float32 and float16. Reports
+per format the total size, the bytes saved against float WAV, the time to encode and to
+decode everything, and the largest sample error.
+
+Usage:
+    python benchmarks/bench_stem_format.py <folder> [--sample-rate 22050]
+
+Dependencies:
+    - numpy, soundfile: Encoding and decoding.
+    - librosa: Decoding the sources and resampling for the sidecars.
+    - utils.stem_format: Container and subtype selection of the stored stems.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import librosa  # noqa: E402
+from utils.stem_format import write_audio  # noqa: E402
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+# (label, extension, subtype) of every stored variant; the first is the baseline
+FORMATS = [
+    ("wav float", ".wav", "FLOAT"),
+    ("wav pcm16", ".wav", "PCM_16"),
+    ("flac pcm16", ".flac", "PCM_16"),
+    ("flac pcm24", ".flac", "PCM_24"),
+]
+SIDECAR_DTYPES = ["float32", "float16"]
+
+
+def timed(function, *args, **kwargs):
+    """
+    Call a function and measure its wall-clock time.
+
+    Returns:
+        tuple: The function's result and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare stem storage formats.")
+    parser.add_argument("folder", help="Folder with audio files (e.g. separated stems).")
+    parser.add_argument("--sample-rate", type=int, default=22050, help="Sampling rate of the analysis sidecars.")
+    args = parser.parse_args(argv)
+
+    files = sorted(os.path.join(args.folder, name) for name in os.listdir(args.folder)
+                   if name.lower().endswith(AUDIO_EXTENSIONS))
+    if not files:
+        print(f"No audio files in {args.folder}")
+        return 1
+
+    results = {label: {"bytes": 0, "encode": 0.0, "decode": 0.0, "error": 0.0}
+               for label in [label for label, _, _ in FORMATS] + [f"sidecar {dtype}" for dtype in SIDECAR_DTYPES]}
+    with tempfile.TemporaryDirectory() as folder:
+        for index, path in enumerate(files):
+            audio, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+            for label, extension, subtype in FORMATS:
+                output = os.path.join(folder, f"{index}{extension}")
+                _, encode_seconds = timed(write_audio, output, audio, sample_rate, subtype)
+                decoded, decode_seconds = timed(sf.read, output, dtype="float32", always_2d=True)
+                result = results[label]
+                result["bytes"] += os.path.getsize(output)
+                result["encode"] += encode_seconds
+                result["decode"] += decode_seconds
+                result["error"] = max(result["error"], float(np.max(np.abs(decoded - audio))))
+                os.remove(output)
+
+            mono, _ = librosa.load(path, sr=args.sample_rate)
+            for dtype in SIDECAR_DTYPES:
+                output = os.path.join(folder, f"{index}.{dtype}.npy")
+                _, encode_seconds = timed(np.save, output, mono.astype(dtype))
+                loaded, decode_seconds = timed(lambda: np.asarray(np.load(output, mmap_mode="r"), dtype=np.float32))
+                result = results[f"sidecar {dtype}"]
+                result["bytes"] += os.path.getsize(output)
+                result["encode"] += encode_seconds
+                result["decode"] += decode_seconds
+                result["error"] = max(result["error"], float(np.max(np.abs(loaded - mono))))
+                os.remove(output)
+
+    baseline = results[FORMATS[0][0]]["bytes"]
+    print(f"Files: {len(files)}\n")
+    print(f"{'format':<16} {'MB':>9} {'saved':>7} {'encode s':>9} {'decode s':>9} {'max error':>10}")
+    for label, result in results.items():
+        saved = "" if label.startswith("sidecar") else f"{1 - result['bytes'] / baseline:>6.0%}"
+        print(f"{label:<16} {result['bytes'] / 1e6:>9.1f} {saved:>7} {result['encode']:>9.2f} "
+              f"{result['decode']:>9.2f} {result['error']:>10.2e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Benchmark of the fast, excerpt-based tempo mode against the full-track analysis.
+
+Runs both analyses on every audio file of a folder and reports, per file and overall,
+the speedup of the fast mode, its confidence, how often it fell back to the full
+analysis and whether its BPM agrees with the full-track BPM.
+
+Usage:
+    python benchmarks/bench_tempo.py <folder> [--threads 4] [--tolerance 0.04]
+
+Dependencies:
+    - utils.beat_analysis: Full and fast tempo analyses.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.beat_analysis import analyze_beats, analyze_beats_fast, AGREEMENT_TOLERANCE  # noqa: E402
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+
+
+def timed(function, *args, **kwargs):
+    """
+    Call a function and measure its wall-clock time.
+
+    Returns:
+        tuple: The function's result and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare fast and full tempo estimation.")
+    parser.add_argument("folder", help="Folder with audio files to analyze.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1,
+                        help="Threads used by the full analysis.")
+    parser.add_argument("--tolerance", type=float, default=AGREEMENT_TOLERANCE,
+                        help="Relative BPM difference counted as agreement.")
+    args = parser.parse_args(argv)
+
+    files = sorted(os.path.join(args.folder, name) for name in os.listdir(args.folder)
+                   if name.lower().endswith(AUDIO_EXTENSIONS))
+    if not files:
+        print(f"No audio files in {args.folder}")
+        return 1
+
+    print(f"{'file':<40} {'full bpm':>9} {'fast bpm':>9} {'conf':>6} {'mode':>5} {'speedup':>8}")
+    full_total = fast_total = 0.0
+    agreed = fallbacks = 0
+    for path in files:
+        full, full_seconds = timed(analyze_beats, path, num_threads=args.threads)
+        fast, fast_seconds = timed(analyze_beats_fast, path, num_threads=args.threads)
+        full_total += full_seconds
+        fast_total += fast_seconds
+        fallbacks += fast["mode"] == "full"
+        agreed += abs(fast["bpm"] - full["bpm"]) <= args.tolerance * full["bpm"]
+        print(f"{os.path.basename(path)[:40]:<40} {full['bpm']:>9} {fast['bpm']:>9} "
+              f"{fast['confidence']:>6.2f} {fast['mode']:>5} {full_seconds / fast_seconds:>7.1f}x")
+
+    print(f"\nFiles: {len(files)}")
+    print(f"Full analysis: {full_total:.1f}s, fast mode: {fast_total:.1f}s, "
+          f"speedup {full_total / fast_total:.1f}x")
+    print(f"Fell back to full analysis: {fallbacks}/{len(files)}")
+    print(f"BPM agreement with full track: {agreed}/{len(files)} ({agreed / len(files):.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Benchmark of first-request latency in fresh processes, with and without warm-up and
+with an empty or a filled JIT cache.
+
+Every run starts a fresh interpreter that optionally runs utils.warmup.warm_up and then
+times the first and second call of the render and analysis paths (pitch shift, time
+stretch, HPSS, constant-Q chroma) on a longer synthetic signal. The scenarios:
+- cold, empty cache: a new deploy without warm-up.
+- cold, cached: a restarted process without warm-up whose kernels are on disk.
+- warm, empty cache / warm, cached: the same with warm-up at start, which also reports
+  how long the warm-up itself took.
+
+Usage:
+    python benchmarks/bench_warmup.py [--runs 3] [--seconds 10]
+
+Dependencies:
+    - subprocess: Fresh interpreter per run, so no compiled kernel carries over in memory.
+    - tempfile: Empty JIT cache folders.
+    - utils.warmup: Warm-up routine and synthetic signal (in the child interpreters).
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter: argv[1] is 'warm' or 'cold', argv[2] the signal length
+PROBE = """
+import sys, json, time
+from utils.warmup import configure_jit_cache, warm_up, synthetic_signal, WARMUP_SAMPLE_RATE
+configure_jit_cache()
+started = time.perf_counter()
+report = warm_up() if sys.argv[1] == "warm" else {"seconds": 0.0}
+import librosa
+audio = synthetic_signal(float(sys.argv[2]))
+sr = WARMUP_SAMPLE_RATE
+paths = {
+    "pitch_shift": lambda: librosa.effects.pitch_shift(y=audio, sr=sr, n_steps=2, bins_per_octave=12),
+    "time_stretch": lambda: librosa.effects.time_stretch(audio, rate=1.1),
+    "hpss": lambda: librosa.effects.hpss(audio),
+    "chroma_cqt": lambda: librosa.feature.chroma_cqt(y=audio, sr=sr, bins_per_octave=24),
+}
+timings = {}
+for name, path in paths.items():
+    calls = []
+    for _ in range(2):
+        call_started = time.perf_counter()
+        path()
+        calls.append(time.perf_counter() - call_started)
+    timings[name] = calls
+print(json.dumps({"warmup_s": report["seconds"], "timings": timings}))
+"""
+
+
+def probe(mode, seconds, cache_dir):
+    """
+    Time the first and second calls of each path in a fresh interpreter.
+
+    Parameters:
+        mode (str): 'warm' to run the warm-up first, 'cold' not to.
+        seconds (float): Length of the synthetic signal of the timed calls.
+        cache_dir (str): NUMBA_CACHE_DIR of the child.
+
+    Returns:
+        dict: Warm-up seconds and [first, second] call seconds per path.
+    """
+    env = {**os.environ, "NUMBA_CACHE_DIR": cache_dir, "WARMUP": "true"}
+    result = subprocess.run([sys.executable, "-c", PROBE, mode, str(seconds)],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, check=True, env=env)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure first-request latency with and without warm-up.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=10.0, help="Length of the timed signal.")
+    args = parser.parse_args(argv)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as shared_cache:
+        # Fill the shared cache once, as a previous deploy would have
+        probe("warm", args.seconds, shared_cache)
+        for mode in ("cold", "warm"):
+            for cache in ("empty", "cached"):
+                runs = []
+                for _ in range(args.runs):
+                    if cache == "empty":
+                        with tempfile.TemporaryDirectory() as empty_cache:
+                            runs.append(probe(mode, args.seconds, empty_cache))
+                    else:
+                        runs.append(probe(mode, args.seconds, shared_cache))
+                rows.append((f"{mode}, {cache} cache", runs))
+
+    names = list(rows[0][1][0]["timings"])
+    print(f"Runs: {args.runs}, signal: {args.seconds:.0f}s, median seconds\n")
+    print(f"{'scenario':<20} {'warm-up':>8} " + " ".join(f"{name + ' 1st/2nd':>22}" for name in names))
+    for label, runs in rows:
+        warmup_s = statistics.median(run["warmup_s"] for run in runs)
+        cells = []
+        for name in names:
+            first = statistics.median(run["timings"][name][0] for run in runs)
+            second = statistics.median(run["timings"][name][1] for run in runs)
+            cells.append(f"{first:>10.2f} / {second:<9.2f}")
+        print(f"{label:<20} {warmup_s:>8.2f} " + " ".join(f"{cell:>22}" for cell in cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Load test for the metadata and audio routes of the Musicnalyzer API.
+
+Hammers GET /songs/<song_id> and GET /uploads/<song_id>/<file> from a pool of client
+threads for a fixed duration and reports requests per second and latency percentiles
+per route. Pass several base URLs to compare setups side by side, e.g. the development
+server (`python app.py`) against the production server (`python serve.py`).
+
+Usage:
+    python benchmarks/load_test.py --song-id <id> --audio <file name> \\
+        --targets dev=http://localhost:5000 prod=http://localhost:8000
+
+Dependencies:
+    - requests: HTTP client.
+    - concurrent.futures: Client threads.
+"""
+
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+def percentile(values, fraction):
+    """
+    Return the value at the given fraction of a sorted list.
+
+    Parameters:
+        values (list): Sorted values.
+        fraction (float): Fraction between 0 and 1.
+
+    Returns:
+        float: Value at that percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_load(url, concurrency, duration):
+    """
+    Request one URL from many threads until the duration elapses.
+
+    Parameters:
+        url (str): URL to request.
+        concurrency (int): Number of client threads.
+        duration (float): Test duration in seconds.
+
+    Returns:
+        dict: Requests per second, error count and p50/p99 latency in milliseconds.
+    """
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = session.get(url, timeout=60)
+                # Read the whole body so audio downloads are timed end to end
+                _ = response.content
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - started)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": errors[0],
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the metadata and audio routes.")
+    parser.add_argument("--song-id", required=True)
+    parser.add_argument("--audio", required=True, help="File name inside uploads/<song-id>/ to download.")
+    parser.add_argument("--targets", nargs="+", default=["dev=http://localhost:5000"],
+                        help="label=base_url pairs to compare.")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    routes = {
+        "metadata": f"/songs/{args.song_id}",
+        "audio": f"/uploads/{args.song_id}/{args.audio}",
+    }
+
+    print(f"{'target':<10} {'route':<10} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for target in args.targets:
+        label, base_url = target.split("=", 1)
+        for route, path in routes.items():
+            stats = run_load(base_url.rstrip("/") + path, args.concurrency, args.duration)
+            print(f"{label:<10} {route:<10} {stats['rps']:>10.1f} {stats['p50_ms']:>10.1f} "
+                  f"{stats['p99_ms']:>10.1f} {stats['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,22 +8,46 @@ Classes:
 
 Dependencies:
     - SongModel: Data model class for MongoDB song document interactions.
+    - FingerprintModel: Landmark index used to find near-duplicate uploads.
+    - IngestCheckpointModel: Completed stages of unfinished ingests, for resuming them.
     - Various utilities for file handling, audio processing, key/BPM adjustments, 
       path cleaning, and lyrics extraction.
 """
 
 
 import os
+import re
 import json
 import time
+import shutil
+import soundfile as sf
 from bson import ObjectId
 from models.song_model import SongModel
+from models.stage_timing_model import StageTimingModel
+from models.feature_model import FeatureModel
+from models.fingerprint_model import FingerprintModel
+from models.ingest_checkpoint_model import IngestCheckpointModel
 from werkzeug.utils import secure_filename
+from utils.harmony import harmonize, parse_voices, materialize_voice, DEFAULT_VOICES
 from utils.lyrics_utils import extract_lyrics
-from utils.path_utils import clean_audio_paths, encode_special_chars
-from utils.audio_processing import analyze_and_process_audio, load_song
-from utils.key_bpm_utils import calculate_new_key, change_key, change_bpm
-from utils.file_operations import allowed_file, save_song_file, delete_unwanted_files
+from utils.progress import ProgressReporter, INGEST_STAGES, LYRICS_STAGES, DEFAULT_STAGE_RATES
+from utils.path_utils import clean_audio_paths, encode_special_chars, update_key_in_path, update_bpm_in_path
+from utils.audio_processing import (analyze_and_process_audio, load_song, separate_and_rename_stems,
+                                    choose_separation_tier, LAZY_HARMONY, HQ_TIER, SEPARATION_MODELS,
+                                    SEPARATION_TIER, SEPARATION_UPGRADE)
+from utils.audio_cache import invalidate_decoded, ANALYSIS_DTYPE
+from utils.stem_format import convert_audio, STEM_EXTENSION, AUDIO_EXTENSIONS
+from utils.key_bpm_utils import (calculate_new_key, change_key, change_bpm, change_key_preview,
+                                 change_bpm_preview, preview_window, preview_length, PREVIEW_DIR)
+from utils.file_operations import (allowed_file, save_song_file, delete_unwanted_files, discard_song_file,
+                                   upload_digest)
+from utils.fingerprint import landmarks
+from utils.checkpoint import IngestCheckpoint, NullCheckpoint
+from utils.storage import get_storage
+from utils.mixdown import MIX_FORMATS, MIX_DIR, quantize_gain, mix_cache_path, render_mix
+from utils.stream_engine import STREAM_DIR, stream_cache_path
+from utils.cancellation import Cancelled, CancelToken, cancel_scope
+from scheduler import PRIORITIES, INGEST
 
 
 class SongController:
@@ -33,16 +57,34 @@ class SongController:
     
     Attributes:
         song_model (SongModel): Instance of the SongModel class for database operations.
+        timing_model (StageTimingModel): Historical stage durations used for progress ETAs.
+        feature_model (FeatureModel): Per-song feature documents.
+        fingerprint_model (FingerprintModel): Landmark index of every uploaded song.
+        checkpoint_model (IngestCheckpointModel): Stage checkpoints of unfinished ingests.
+        job_model (JobModel): Job queue used to hand ingest work (and the background
+            re-separation of fast-tier songs) to workers, or None to process uploads
+            inside the request.
+        cpu_pool (CpuPool): Process pool running the ingest pipeline outside the web
+            process, or None to run it in the request thread.
     """
 
-    def __init__(self, mongo):
+    def __init__(self, mongo, job_model=None, cpu_pool=None):
         """
         Initialize the SongController with a MongoDB client.
 
         Parameters:
             mongo: MongoDB client instance for database connections.
+            job_model (JobModel): Optional job queue; when set, uploads are enqueued
+                instead of being processed in the request.
+            cpu_pool (CpuPool): Optional process pool for the ingest pipeline.
         """
         self.song_model = SongModel(mongo)
+        self.timing_model = StageTimingModel(mongo)
+        self.feature_model = FeatureModel(mongo)
+        self.fingerprint_model = FingerprintModel(mongo)
+        self.checkpoint_model = IngestCheckpointModel(mongo)
+        self.job_model = job_model
+        self.cpu_pool = cpu_pool
 
     def get_song_by_id(self, song_id):
         """
@@ -75,14 +117,31 @@ class SongController:
                 "duration": song_details.get("duration"),
                 "musical_key": song_details.get("musical_key"),
                 "song_tempo": song_details.get("song_tempo"),
+                "loudness": song_details.get("loudness"),
                 "lyrics": song_details.get("lyrics"),
-                "musical_parts": song_details.get("musical_parts")
+                "musical_parts": song_details.get("musical_parts"),
+                "harmony_parts": song_details.get("harmony_parts", {})
             }
             return filtered_song  # Return the filtered song details
         else:
             return {"error": "Song not found"}, 404
     
 
+    def get_features(self, song_id):
+        """
+        Retrieve the stored feature summaries of a song.
+
+        Parameters:
+            song_id (str): Unique identifier of the song.
+
+        Returns:
+            dict: Feature document, or an error message and HTTP status code if none exists.
+        """
+        features = self.feature_model.find_features(song_id)
+        if features is None:
+            return {"error": "Features not found"}, 404
+        return features
+
     def update_song_by_id(self, song_id, song_obj):
         """
         Update song metadata for a specified song ID in the database.
@@ -96,7 +155,196 @@ class SongController:
         """
         return self.song_model.update_song(song_id, song_obj)
     
-    def insert_song(self, app, socketio, emit, file, is_solo, artist, duration, lyrics=""):
+    @staticmethod
+    def process_song(song_id, file_path, original_filename, is_solo, artist, duration, lyrics="",
+                     voices=None, diatonic=False, progress=None, token=None, separation_tier=None, checkpoint=None):
+        """
+        Run the ingest pipeline on a saved audio file and build its database document.
+
+        This does not touch the database, so it can run in worker processes while the
+        caller decides how and when the document is written.
+
+        Parameters:
+            song_id (str): Unique identifier of the song; the file must live in its upload folder.
+            file_path (str): Path to the saved WAV or FLAC file.
+            original_filename (str): Sanitized name of the uploaded file.
+            is_solo (str): Specifies if the song is a solo performance ("True" or "False").
+            artist (str): Name of the artist associated with the song.
+            duration (str): Duration of the song in seconds.
+            lyrics (str): Lyrics associated with the song.
+            voices (list): Harmony voices to generate for solo songs. Defaults to Alto and Tenor.
+            diatonic (bool): Whether to keep the harmony voices within the detected key.
+            progress (ProgressReporter): Optional reporter for the pipeline stages.
+            token (CancelToken): Optional token checked between pipeline stages.
+            separation_tier (str): 'fast' or 'hq' separation model; by default the
+                configured SEPARATION_TIER.
+            checkpoint (IngestCheckpoint): Optional stage checkpoint to resume from and
+                record into; its recorded tier takes precedence over separation_tier.
+
+        Returns:
+            dict: Song document ready to be inserted or updated. Its 'features' entry is
+                  the feature document, which is stored separately by store_song. With
+                  LAZY_HARMONY, the harmony voices of solo songs are recorded in
+                  'virtual_parts' and rendered on first request (see materialize_stem).
+        """
+        file_base_name = os.path.splitext(original_filename)[0]
+        song_folder = os.path.dirname(file_path)
+        checkpoint = checkpoint or NullCheckpoint()
+        separation_tier = checkpoint.separation_tier or separation_tier or choose_separation_tier()
+
+        (key, bpm, soprano, alto, tenor, instrumental, modified_file_path,
+         harmony_parts, beat_grid, features) = analyze_and_process_audio(
+            file_path, file_base_name, song_folder, is_solo, voices, diatonic, progress, token, LAZY_HARMONY,
+            separation_tier, checkpoint
+        )
+        virtual_parts = {}
+        if is_solo == "True" and LAZY_HARMONY:
+            virtual_parts = {name: {"interval": interval, "diatonic": diatonic}
+                             for name, interval in voices or DEFAULT_VOICES}
+
+        return {
+            "_id": ObjectId(song_id),
+            "song": original_filename,
+            "artist": artist,
+            "paths": modified_file_path,
+            "duration": float(duration),
+            "musical_key": key,
+            "song_tempo": bpm,
+            "lyrics": lyrics,
+            "musical_parts": {
+                "soprano_path": soprano,
+                "alto_path": alto,
+                "tenor_path": tenor,
+                "instrumental_path": instrumental
+            },
+            "harmony_parts": harmony_parts,
+            "virtual_parts": virtual_parts,
+            "separation_tier": separation_tier,
+            "beat_grid": beat_grid,
+            "loudness": features["loudness_lufs"],
+            "features": features
+        }
+
+    def store_song(self, song_data, existing):
+        """
+        Write a processed song document to the database.
+
+        Parameters:
+            song_data (dict): Song document built by process_song.
+            existing (bool): Whether a song with this ID already exists. A document
+                written by an earlier attempt of a resumed ingest is updated as well.
+
+        Returns:
+            str: Message describing the database operation.
+        """
+        features = song_data.pop("features", None)
+        if features is not None:
+            self.feature_model.save_features(song_data["_id"], features)
+        if existing or self.song_model.find_song_document(song_data["_id"]) is not None:
+            self.song_model.update_song(song_data["_id"], song_data)
+            return "Song re-uploaded and database updated"
+        self.song_model.insert_song(song_data)
+        return "Song uploaded and database entry created"
+
+    def find_duplicate(self, song_landmarks, song_id):
+        """
+        Find an existing song that the landmarks of an upload match.
+
+        Parameters:
+            song_landmarks (list): (hash, frame) landmarks of the upload.
+            song_id (str): ID the upload will be stored under, excluded from the search.
+
+        Returns:
+            dict: Best candidate with 'song_id', 'song', 'artist', 'matches', 'score' and
+                  'offset_seconds', or None if no indexed song matches.
+        """
+        for candidate in self.fingerprint_model.find_matches(song_landmarks, exclude=song_id):
+            # Landmarks of uploads that never finished processing have no song document
+            document = self.song_model.find_song_document(candidate["song_id"])
+            if document is not None:
+                return {**candidate, "song": document.get("song"), "artist": document.get("artist")}
+        return None
+
+    def fingerprint_upload(self, song_id, file_path, original_filename, artist, lyrics, existing, duplicate,
+                           checkpoint, progress):
+        """
+        Fingerprint a saved upload and handle a near-duplicate of an existing song.
+
+        Runs wherever the ingest runs (the request thread, a pool process or a queue
+        worker), and only once per ingest: the stage is recorded in the checkpoint.
+
+        Parameters:
+            song_id (str): ID the upload is stored under.
+            file_path (str): Path of the saved upload.
+            original_filename (str): Sanitized name of the uploaded file.
+            artist (str): Name of the artist.
+            lyrics (str): Lyrics associated with the song.
+            existing (bool): Whether a song with this ID already exists.
+            duplicate (str): None, 'reuse' or 'ignore', as for insert_song.
+            checkpoint (IngestCheckpoint): Checkpoint of the ingest.
+            progress (ProgressReporter): Reporter of the ingest stages.
+
+        Returns:
+            dict: None if the ingest goes on (the fingerprint is saved); otherwise the
+                  result of the upload: 409 with the candidate, or the reused song. The
+                  checkpoint is dropped in that case.
+        """
+        if checkpoint.result("fingerprint") is not None:
+            progress.skip("fingerprint")
+            return None
+
+        with progress.stage("fingerprint"):
+            audio, sample_rate = load_song(file_path, ANALYSIS_DTYPE)
+            song_landmarks = landmarks(audio, sample_rate)
+            candidate = None if duplicate == "ignore" else self.find_duplicate(song_landmarks, song_id)
+
+        if candidate is None:
+            self.fingerprint_model.save_fingerprint(song_id, song_landmarks)
+            checkpoint.complete("fingerprint")
+            return None
+
+        print(f"Near-duplicate of {candidate['song']} ({candidate['song_id']}), score {candidate['score']}")
+        checkpoint.finish()
+        discard_song_file(file_path, remove_folder=not existing and duplicate != "reuse")
+        if duplicate != "reuse":
+            return {"error": "A near-duplicate of this song already exists", "candidate": candidate,
+                    "song_id": song_id, "status_code": 409}
+        with progress.stage("persist"):
+            message = self.reuse_song(song_id, candidate["song_id"], original_filename, artist, lyrics, existing)
+            self.fingerprint_model.save_fingerprint(song_id, song_landmarks)
+        return {"status": message, "song_id": song_id, "duplicate_of": candidate["song_id"], "status_code": 200}
+
+    def reuse_song(self, song_id, duplicate_of, original_filename, artist, lyrics, existing):
+        """
+        Store an upload as a new song sharing the stems and analysis of a near-duplicate.
+
+        Parameters:
+            song_id (str): ID of the new song.
+            duplicate_of (str): ID of the existing song whose stems and analysis are reused.
+            original_filename (str): Sanitized name of the uploaded file.
+            artist (str): Name of the artist, or empty to keep the existing one.
+            lyrics (str): Lyrics of the upload, or empty to keep the existing ones.
+            existing (bool): Whether a song with song_id already exists.
+
+        Returns:
+            str: Message describing the database operation.
+        """
+        source = self.song_model.find_song_document(duplicate_of)
+        song_data = {name: value for name, value in source.items() if name not in ("_id", "song", "artist", "lyrics")}
+        song_data.update({
+            "_id": ObjectId(song_id),
+            "song": original_filename,
+            "artist": artist or source.get("artist", ""),
+            "lyrics": lyrics or source.get("lyrics", ""),
+            "duplicate_of": source["_id"],
+        })
+        features = self.feature_model.find_features(duplicate_of)
+        if features is not None:
+            song_data["features"] = features
+        return self.store_song(song_data, existing)
+
+    def insert_song(self, app, socketio, emit, file, is_solo, artist, duration, lyrics="", voices=None, diatonic=False,
+                    job_id=None, duplicate=None, separation_tier=None):
         """
         Insert a new song into the database, saving the audio file and metadata.
 
@@ -107,105 +355,212 @@ class SongController:
             artist (str): Name of the artist associated with the song.
             duration (str): Duration of the song in seconds.
             lyrics (str): Lyrics associated with the song.
+            voices (list): Harmony voices to generate for solo songs. Defaults to Alto and Tenor.
+            diatonic (bool): Whether to keep the harmony voices within the detected key.
+            job_id (str): ID of the upload job; progress is emitted to the Socket.IO room of this name.
+            duplicate (str): What to do when the upload matches the fingerprint of an existing
+                song: None to answer 409 with the candidate, 'reuse' to store the upload with
+                the candidate's stems and analysis, 'ignore' to process it anyway. The check
+                runs with the ingest (fingerprint_upload), so with a job queue the 409 is
+                the result of the queued job.
+            separation_tier (str): 'fast' or 'hq' separation model, chosen by the route from
+                the request or the upload backlog; by default the configured SEPARATION_TIER.
+
+        An upload whose earlier ingest did not finish (a crash, a failed job) resumes it:
+        the song keeps the ID of the unfinished ingest, found by file name when the song
+        never reached the database, and the pipeline skips the stages its checkpoint
+        records. Only an upload with the same bytes (SHA-256 digest) resumes; a different
+        file of the same name starts a fresh ingest, under a new ID unless the song
+        already has a document.
 
         Returns:
-            dict: JSON response with song ID and success or error message, including status code.
+            dict: JSON response with song ID and success or error message, including status
+                  code and, for processed songs, the separation tier.
         """
 
         if not allowed_file(file.filename):
             return {"error": "File type not allowed", "status_code": 400}
-        
-        socketio.emit("progress", 10)
-        print("Emitted progress 10")
 
+        job_id = job_id or str(ObjectId())
         original_filename = secure_filename(file.filename)
         file_base_name = os.path.splitext(original_filename)[0]
         file_extension = os.path.splitext(original_filename)[1].lower()
-        wav_filename = f"{file_base_name}.wav"
+        audio_filename = f"{file_base_name}{STEM_EXTENSION}"
 
         print(f"Processing file: {file.filename}")
 
-        # Emit progress message to the client
-        socketio.emit("progress", 20)
-        print("Emitted progress 20")
-
         # Check if song exists
         existing_song = self.song_model.find_song_by_name(original_filename)
 
         print(f"Existing song: {existing_song}")
 
-        song_id = str(existing_song["_id"]) if existing_song else str(ObjectId())
+        # An ingest that crashed before writing the document is only known by its checkpoint
+        digest = upload_digest(file)
+        if existing_song:
+            pending = self.checkpoint_model.find(str(existing_song["_id"]))
+        else:
+            pending = self.checkpoint_model.find_by_name(original_filename)
+        # A song whose ingest did not finish is processed again, even by a different file
+        unfinished = existing_song is not None and pending is not None
+        if pending is not None and pending.get("digest") != digest:
+            print(f"Unfinished ingest of {original_filename} ({pending['_id']}) was another file, starting over")
+            pending = None
+        song_id = str(existing_song["_id"]) if existing_song else (pending["_id"] if pending else str(ObjectId()))
+        if pending is not None:
+            analysis = pending["stages"].get("analyze", {})
+            upload = analysis.get("modified_file_path", pending["file_path"])
+            if not (get_storage().exists(pending["file_path"]) or get_storage().exists(upload)):
+                print(f"Unfinished ingest of {original_filename} lost its upload, starting over")
+                pending = None
         song_folder = os.path.join(app.config["UPLOAD_FOLDER"], song_id)
         os.makedirs(song_folder, exist_ok=True)
 
+        # A resumed ingest keeps the tier its stems (or planned stems) were separated with
+        separation_tier = (pending or {}).get("separation_tier") or separation_tier or choose_separation_tier()
+        progress = ProgressReporter(socketio, job_id, INGEST_STAGES, float(duration or 0), self.timing_model,
+                                    stage_keys={"separate": f"separate:{separation_tier}"})
+
         print(f"Original filename: {original_filename}")
 
-        socketio.emit("progress", 50)
-        print("Emitted progress 50")
+        # Check for existing files; only a song with a finished ingest skips the upload
+        existing_files = [file for file in get_storage().list(song_folder)
+                          if file.startswith(file_base_name) and file.endswith(AUDIO_EXTENSIONS)]
 
-        # Check for existing files
-        existing_files = [file for file in os.listdir(song_folder) if file.startswith(file_base_name) and file.endswith('.wav')]
-        
-        if not existing_files:
-            file_path = save_song_file(file, song_folder, wav_filename, file_extension)
-
-            print(f"WAV file saved: {wav_filename}, {file_path}")
-
-            # Analyze and extract parts
-            key, bpm, soprano, alto, tenor, instrumental, modified_file_path = analyze_and_process_audio(
-                file_path, file_base_name, song_folder, is_solo
-            )
-
-            print(f"Modified file path: {modified_file_path}")
-
-            socketio.emit("progress", 75)
-            print("Emitted progress 75")
-
-            # Prepare data for database
-            song_data = {
-                "_id": existing_song["_id"] if existing_song else ObjectId(song_id),
-                "song": original_filename,
-                "artist": artist,
-                "paths": modified_file_path,
-                "duration": float(duration),
-                "musical_key": key,
-                "song_tempo": bpm,
-                "lyrics": lyrics,
-                "musical_parts": {
-                    "soprano_path": soprano,
-                    "alto_path": alto,
-                    "tenor_path": tenor,
-                    "instrumental_path": instrumental
-                }
-            }
+        if existing_files and existing_song is not None and not unfinished:
+            progress.finish()
+            return {"message": "Song file already exists on the server, upload skipped", "song_id": song_id, "status_code": 200}
 
-            socketio.emit("progress", 85)
-            print("Emitted progress 85")
+        if pending is not None:
+            file_path = pending["file_path"]
+            progress.skip("save")
+            print(f"Resuming unfinished ingest of {original_filename} ({song_id}), "
+                  f"completed stages: {sorted(pending['stages'])}")
+        else:
+            with progress.stage("save"):
+                file_path = save_song_file(file, song_folder, audio_filename, file_extension)
+
+            print(f"Audio file saved: {audio_filename}, {file_path}")
+            self.checkpoint_model.start(song_id, original_filename, file_path, separation_tier, digest)
+
+        ingest_payload = {
+            "song_id": song_id,
+            "file_path": file_path,
+            "original_filename": original_filename,
+            "is_solo": is_solo,
+            "artist": artist,
+            "duration": duration,
+            "lyrics": lyrics,
+            "voices": voices,
+            "diatonic": diatonic,
+            "existing": existing_song is not None,
+            "separation_tier": separation_tier,
+            "duplicate": duplicate,
+            "progress_room": job_id,
+        }
+
+        # Queue workers and the process pool fingerprint the upload themselves, so the
+        # web node only saves it; a near-duplicate is reported in the job result
+
+        if self.job_model is not None:
+            # A re-upload supersedes any ingest of the same song still queued or running
+            self.job_model.request_cancel(song_id=song_id, reason="superseded by a newer upload")
+            queue_job_id = self.job_model.enqueue("ingest", ingest_payload, PRIORITIES[INGEST])
+            return {"status": "Song queued for processing", "song_id": song_id,
+                    "job_id": queue_job_id, "status_code": 202}
+
+        if self.cpu_pool is not None:
+            result = self.cpu_pool.run("ingest", ingest_payload)
+            return {"job_id": job_id, "status_code": 200, **result}
+
+        # Decoding here also warms the decoded-audio cache for the decode stage
+        checkpoint = IngestCheckpoint(self.checkpoint_model, song_id)
+        duplicate_result = self.fingerprint_upload(song_id, file_path, original_filename, artist, lyrics,
+                                                   existing_song is not None, duplicate, checkpoint, progress)
+        if duplicate_result is not None:
+            progress.finish()
+            return {**duplicate_result, "job_id": job_id}
+
+        # Analyze, extract parts and prepare data for database; a newer upload of the
+        # same song or a disconnect of the uploading client abandons this one
+        try:
+            with cancel_scope([job_id, f"ingest:{song_id}"], app.config.get("INGEST_DEADLINE_SECONDS"),
+                              supersede=True) as token:
+                song_data = self.process_song(
+                    song_id, file_path, original_filename, is_solo, artist, duration, lyrics, voices,
+                    diatonic, progress, token, separation_tier, checkpoint
+                )
+        except Cancelled as e:
+            print(f"Ingest of {original_filename} cancelled: {e.reason}")
+            return {"error": f"Processing cancelled: {e.reason}", "song_id": song_id, "status_code": e.status_code}
+
+        print(f"Modified file path: {song_data['paths']}")
+
+        # Insert/update in database
+        with progress.stage("persist"):
+            message = self.store_song(song_data, existing_song is not None)
+            checkpoint.finish()
+
+        progress.finish()
+        return {"status": message, "song_id": song_id, "job_id": job_id, "separation_tier": separation_tier,
+                "status_code": 200}
+
+    def harmonize(self, data, token=None):
+        """
+        Generate harmony voices on demand from the song's Soprano stem.
 
-            # Insert/update in database
-            if existing_song:
-                self.song_model.update_song(existing_song["_id"], song_data)
-                message = "Song re-uploaded and database updated"
-            else:
-                self.song_model.insert_song(song_data)
-                message = "Song uploaded and database entry created"
+        Parameters:
+            data (dict): Contains 'songId', 'voices' (list of {"name", "interval"} items) and
+                         optionally 'diatonic' to keep the voices within the song's key.
+            token (CancelToken): Optional token checked between voices.
 
-            socketio.emit("progress", 100)
-            print("Emitted progress 100")
-            return {"status": message, "song_id": song_id, "status_code": 200}
-        else:
-            return {"message": "Song file already exists on the server, upload skipped", "song_id": song_id, "status_code": 200}
-        
-    def change_key(self, data):
+        Returns:
+            dict: JSON response with paths to the generated voices keyed by name.
+            tuple: Error message and HTTP status code if the song or its Soprano is missing,
+                   or if the render was cancelled.
+        """
+        song_id = data.get('songId')
+        song_details = self.get_song_by_id(song_id)
+        if not isinstance(song_details, dict):
+            return {"error": "Song not found"}, 404
+
+        soprano_path = (song_details.get("musical_parts") or {}).get("soprano_path")
+        if not soprano_path:
+            return {"error": "Soprano path missing for this song"}, 400
+
+        try:
+            voices = parse_voices(data.get('voices') or [])
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+        if not voices:
+            return {"error": "No harmony voices requested"}, 400
+
+        try:
+            paths = harmonize(soprano_path, voices, song_details.get("musical_key"), bool(data.get('diatonic')),
+                              token=token)
+        except Cancelled as e:
+            return {"error": f"Harmonization cancelled: {e.reason}"}, e.status_code
+
+        harmony_parts = {**song_details.get("harmony_parts", {}), **paths}
+        # Voices rendered explicitly replace virtual ones of the same name
+        document = self.song_model.find_song_document(song_id) or {}
+        virtual_parts = {name: recipe for name, recipe in (document.get("virtual_parts") or {}).items()
+                         if name not in paths}
+        self.update_song_by_id(song_id, {"harmony_parts": harmony_parts, "virtual_parts": virtual_parts})
+
+        return {name: encode_special_chars(path) for name, path in paths.items()}
+
+    def change_key(self, data, token=None):
         """
         Change the musical key of the song's audio stems.
 
         Parameters:
             data (dict): Contains 'value' (key change value), 'currentKey' (current key of the song), 
                          and 'currentAudioStems' (paths to audio files for modification).
+            token (CancelToken): Optional token checked between and within stem renders.
 
         Returns:
             dict: JSON response with paths to modified audio stems and new key.
+            tuple: Error message and HTTP status code if the render was cancelled.
         """
         value = data.get('value')
         current_key = data.get('currentKey')
@@ -220,20 +575,25 @@ class SongController:
         overall_data = {"new_key": new_key}
 
         # Process each audio stem
-        for name, path in current_audio_stem.items():
-            audio, sample_rate = load_song(path)
-            file_path = change_key(audio, sample_rate, value, path, new_key)
-            overall_data[name] = file_path
-        
+        try:
+            for name, path in current_audio_stem.items():
+                self.materialize_stem(path, token)
+                audio, sample_rate = load_song(path)
+                file_path = change_key(audio, sample_rate, value, path, new_key, token)
+                overall_data[name] = file_path
+        except Cancelled as e:
+            return {"error": f"Key change cancelled: {e.reason}"}, e.status_code
+
         return overall_data
     
-    def change_bpm(self, data):
+    def change_bpm(self, data, token=None):
         """
         Change the BPM (tempo) of the song's audio stems.
 
         Parameters:
             data (dict): Contains 'value' (BPM change value), 'currentBPM' (current BPM), 
                          and 'currentAudioStems' (paths to audio files for modification).
+            token (CancelToken): Optional token; running ffmpeg renders are killed once it is cancelled.
 
         Returns:
             dict: JSON response with paths to modified audio stems and new BPM.
@@ -251,16 +611,237 @@ class SongController:
 
             overall_data = {"new_bpm": value_bpm}
 
+            # One stem is enough to check the render against the stored beat grid; the
+            # instrumental carries the clearest beats
+            names = list(current_audio_stem)
+            verified = next((name for name in names if "instrumental" in name.lower()), names[0] if names else None)
             for name, path in current_audio_stem.items():
-                file_path = change_bpm(path, current_bpm, value_bpm)
+                self.materialize_stem(path, token)
+                file_path = change_bpm(path, current_bpm, value_bpm, token, verify=name == verified)
                 overall_data[name] = file_path
 
             return overall_data
 
+        except Cancelled as e:
+            return {"error": f"BPM change cancelled: {e.reason}"}, e.status_code
         except Exception as e:
             print(f"Error in modifying BPM: {e}")
             return {"error": str(e)}, 500
 
+    def preview_key(self, data):
+        """
+        Render a short, lower-quality preview of a key change for every stem.
+
+        Parameters:
+            data (dict): Same as change_key, plus optional 'playhead' (seconds) to preview
+                         around and 'previewSeconds' (length of the preview, clamped to
+                         [1, 2 * PREVIEW_SECONDS]).
+
+        Returns:
+            dict: New key, preview start in seconds and the preview path of every stem.
+            tuple: Error message and HTTP status code 400 if 'previewSeconds' is not a number.
+        """
+        try:
+            seconds = preview_length(data.get('previewSeconds'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        value = data.get('value')
+        new_key = calculate_new_key(data.get('currentKey'), value)
+        overall_data = {"new_key": new_key, "preview": True}
+
+        for name, path in clean_audio_paths(data.get('currentAudioStems')).items():
+            self.materialize_stem(path)
+            audio, sample_rate = load_song(path)
+            start, length = preview_window(len(audio) / sample_rate, data.get('playhead'), seconds)
+            overall_data[name] = change_key_preview(audio, sample_rate, value, path, new_key, start, length)
+            overall_data["preview_start"] = start
+
+        return overall_data
+
+    def preview_bpm(self, data):
+        """
+        Render a short preview of a BPM change for every stem.
+
+        Parameters:
+            data (dict): Same as change_bpm, plus optional 'playhead' (seconds) to preview
+                         around and 'previewSeconds' (length of the preview, clamped to
+                         [1, 2 * PREVIEW_SECONDS]).
+
+        Returns:
+            dict: New BPM, preview start in seconds of the original song and the preview
+                  path of every stem.
+            tuple: Error message and HTTP status code 400 if 'previewSeconds' is not a number.
+        """
+        try:
+            seconds = preview_length(data.get('previewSeconds'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        current_bpm = data.get('currentBPM')
+        value_bpm = current_bpm + data.get('value')
+        overall_data = {"new_bpm": value_bpm, "preview": True}
+
+        for name, path in clean_audio_paths(data.get('currentAudioStems')).items():
+            self.materialize_stem(path)
+            duration = sf.info(path.replace("%23", "#")).duration
+            start, length = preview_window(duration, data.get('playhead'), seconds)
+            overall_data[name] = change_bpm_preview(path, current_bpm, value_bpm, start, length)
+            overall_data["preview_start"] = start
+
+        return overall_data
+
+    @staticmethod
+    def stem_paths(song_details):
+        """
+        Collect the stems of a song by lower-case name (soprano, alto, ..., harmony voices).
+
+        Parameters:
+            song_details (dict): Song metadata returned by get_song_by_id.
+
+        Returns:
+            dict: File path of every stem keyed by name.
+        """
+        stems = {name[:-len("_path")]: path.replace("%23", "#")
+                 for name, path in (song_details.get("musical_parts") or {}).items() if path}
+        for name, path in (song_details.get("harmony_parts") or {}).items():
+            stems.setdefault(name.lower(), path.replace("%23", "#"))
+        return stems
+
+    def virtual_part(self, path):
+        """
+        Find the virtual harmony voice stored at a path, if the path is one.
+
+        Parameters:
+            path (str): Path of a stem, possibly with an encoded '#' ('%23').
+
+        Returns:
+            tuple: Soprano path, voice name, voice recipe ({'interval', 'diatonic'}) and the
+                   song's key, or None if the path is not a virtual voice of its song.
+        """
+        path = os.path.normpath(path.replace("%23", "#"))
+        song_id = os.path.basename(os.path.dirname(path))
+        if not ObjectId.is_valid(song_id):
+            return None
+        document = self.song_model.find_song_document(song_id)
+        if document is None:
+            return None
+
+        harmony_parts = document.get("harmony_parts") or {}
+        for name, recipe in (document.get("virtual_parts") or {}).items():
+            voice_path = harmony_parts.get(name)
+            if voice_path and os.path.normpath(voice_path.replace("%23", "#")) == path:
+                return document["musical_parts"]["soprano_path"], name, recipe, document.get("musical_key")
+        return None
+
+    def materialize_stem(self, path, token=None):
+        """
+        Make sure a stem exists, rendering it first if it is a virtual harmony voice.
+
+        Concurrent first requests for the same voice share one render (see
+        harmony.materialize_voice); later requests find the cached file.
+
+        Parameters:
+            path (str): Path of a stem, possibly with an encoded '#' ('%23').
+            token (CancelToken): Optional token checked during the render.
+
+        Returns:
+            bool: True if the stem exists, False if it is missing and not virtual.
+        """
+        if get_storage().exists(path.replace("%23", "#")):
+            return True
+        virtual = self.virtual_part(path)
+        if virtual is None:
+            return False
+        soprano_path, name, recipe, key = virtual
+        materialize_voice(soprano_path, name, recipe["interval"], key, recipe.get("diatonic", False), token)
+        return True
+
+    def stream_variant(self, song_id, stem, key_shift=0, bpm=None):
+        """
+        Resolve a key/BPM variant of one stem for streaming.
+
+        Parameters:
+            song_id (str): Unique identifier of the song.
+            stem (str): Stem name (e.g. 'soprano').
+            key_shift (int): Semitones to shift the stem by.
+            bpm (int): Target BPM, or None to keep the original tempo.
+
+        Returns:
+            dict: 'path' of the full-quality variant in the render cache, 'stream_path' of
+                  the streamed variant, 'source' stem path, 'n_steps' and 'tempo_rate' for
+                  the streaming engine.
+            tuple: Error message and HTTP status code if the song or stem is unknown.
+        """
+        song_details = self.get_song_by_id(song_id)
+        if isinstance(song_details, tuple):
+            return song_details
+        source = self.stem_paths(song_details).get(stem)
+        if not source:
+            return {"error": f"Unknown stem: {stem}"}, 404
+        self.materialize_stem(source)
+
+        output_path = source
+        if key_shift:
+            new_key = calculate_new_key(song_details["musical_key"], key_shift)
+            output_path, _ = update_key_in_path(output_path, new_key)
+        tempo_rate = 1.0
+        if bpm and bpm != song_details.get("song_tempo"):
+            _, output_path = update_bpm_in_path(output_path, bpm)
+            tempo_rate = bpm / song_details["song_tempo"]
+
+        return {"path": output_path, "stream_path": stream_cache_path(output_path), "source": source,
+                "n_steps": key_shift, "tempo_rate": tempo_rate}
+
+    def mix(self, song_id, gains, key_shift=0, bpm=None, fmt="ogg"):
+        """
+        Mix a song's stems with per-stem gains into one compressed file.
+
+        Key and tempo variants of the stems are rendered first (or reused from disk), and
+        the encoded mix is cached by its quantized parameters.
+
+        Parameters:
+            song_id (str): Unique identifier of the song.
+            gains (dict): Requested gain per stem name (e.g. 'soprano', 'instrumental');
+                          stems without a gain play at 1.0.
+            key_shift (int): Semitones to shift every stem by.
+            bpm (int): Target BPM, or None to keep the original tempo.
+            fmt (str): Output format, 'ogg' or 'mp3'.
+
+        Returns:
+            str: Path of the cached mix.
+            tuple: Error message and HTTP status code if the song or a parameter is invalid.
+        """
+        if fmt not in MIX_FORMATS:
+            return {"error": f"Unsupported format '{fmt}', use one of {sorted(MIX_FORMATS)}"}, 400
+
+        song_details = self.get_song_by_id(song_id)
+        if isinstance(song_details, tuple):
+            return song_details
+
+        stems = self.stem_paths(song_details)
+        unknown = set(gains) - set(stems)
+        if unknown:
+            return {"error": f"Unknown stems: {', '.join(sorted(unknown))}"}, 400
+
+        gains = {name: quantize_gain(gains.get(name, 1.0)) for name in stems}
+        bpm = bpm if bpm and bpm != song_details.get("song_tempo") else None
+        output_path = mix_cache_path(os.path.dirname(stems["soprano"]), gains, key_shift, bpm, fmt)
+        if get_storage().ensure_local(output_path):
+            return output_path
+
+        new_key = calculate_new_key(song_details["musical_key"], key_shift) if key_shift else None
+        sources = []
+        for name, path in stems.items():
+            if gains[name] > 0:
+                self.materialize_stem(path)
+                if new_key:
+                    audio, sample_rate = load_song(path)
+                    path = change_key(audio, sample_rate, key_shift, path, new_key).replace("%23", "#")
+                if bpm:
+                    path = change_bpm(path, song_details["song_tempo"], bpm).replace("%23", "#")
+            sources.append((path, gains[name]))
+
+        return render_mix(sources, output_path, fmt)
+
     def reset_modifications(self, song_id):
         """
         Reset song modifications, restoring original versions of audio stems.
@@ -303,13 +884,221 @@ class SongController:
         except Exception as e:
             print(f"Error resetting modifications: {e}")
             return {"error": str(e)}, 500
-        
-    def get_lyrics(self, song_id):
+
+    @staticmethod
+    def migrated_paths(document):
+        """
+        Point the WAV paths of a song document at their converted files, where these exist.
+
+        Parameters:
+            document (dict): Raw song document.
+
+        Returns:
+            dict: Dotted field names and new paths for a $set update; empty if nothing changed.
+        """
+        storage = get_storage()
+        fields = {"paths": document.get("paths")}
+        for group in ("musical_parts", "harmony_parts"):
+            for name, path in (document.get(group) or {}).items():
+                fields[f"{group}.{name}"] = path
+
+        # Virtual voices are rendered next to the Soprano, in its format, once it is converted
+        soprano_path = (document.get("musical_parts") or {}).get("soprano_path") or ""
+        soprano_converted = (soprano_path.lower().endswith(".wav")
+                             and storage.exists(soprano_path[:-len(".wav")] + STEM_EXTENSION))
+        virtual = {path for name, path in (document.get("harmony_parts") or {}).items()
+                   if name in (document.get("virtual_parts") or {})}
+
+        changes = {}
+        for field, path in fields.items():
+            if path and path.lower().endswith(".wav"):
+                converted = path[:-len(".wav")] + STEM_EXTENSION
+                if storage.exists(converted) or (path in virtual and soprano_converted):
+                    changes[field] = converted
+        return changes
+
+    def migrate_stems(self, song_id=None, token=None):
+        """
+        Convert the WAV files of songs to STEM_FORMAT and point their documents at the new files.
+
+        Every WAV in a song's folder is converted: the mix, stems, harmony voices and cached
+        variants, since variants of a converted stem are looked up under its new extension.
+        WAV files are deleted only once every document using the folder (its owner and the
+        songs reusing its stems, which may be the song asked for) refers to the converted
+        files, so an interrupted migration can be run again. Each folder is migrated once.
+
+        Parameters:
+            song_id (str): Song to migrate, or None for the whole library.
+            token (CancelToken): Optional token checked between files.
+
+        Returns:
+            dict: Totals over the migrated songs ('songs', 'files', 'bytes_before',
+                  'bytes_after', 'bytes_saved', 'source_decode_seconds', 'decode_seconds')
+                  and a report per song ID.
+            tuple: Error message and HTTP status code if STEM_FORMAT is WAV or the song is
+                   not found.
+        """
+        if STEM_EXTENSION == ".wav":
+            return {"error": "STEM_FORMAT is wav, there is nothing to migrate to"}, 400
+        token = token or CancelToken()
+        storage = get_storage()
+
+        totals = {"songs": 0, "files": 0, "bytes_before": 0, "bytes_after": 0,
+                  "source_decode_seconds": 0.0, "decode_seconds": 0.0}
+        songs = {}
+        migrated_folders = set()
+        for current_id in [song_id] if song_id else self.song_model.find_song_ids():
+            document = self.song_model.find_song_document(current_id)
+            if document is None or not document.get("paths"):
+                if song_id:
+                    return {"error": "Song not found"}, 404
+                continue
+
+            folder = os.path.dirname(document["paths"].replace("%23", "#"))
+            if folder in migrated_folders:
+                continue
+            migrated_folders.add(folder)
+            wav_files = [os.path.join(folder, name) for name in sorted(storage.list(folder))
+                         if name.lower().endswith(".wav") and not name.startswith(".")]
+            report = {"files": 0, "bytes_before": 0, "bytes_after": 0,
+                      "source_decode_seconds": 0.0, "decode_seconds": 0.0}
+            for wav_path in wav_files:
+                token.check()
+                storage.ensure_local(wav_path)
+                converted = convert_audio(wav_path, os.path.splitext(wav_path)[0] + STEM_EXTENSION)
+                report["files"] += 1
+                for name, value in converted.items():
+                    report[name] += value
+
+            # Songs stored with duplicate=reuse share the files of the folder's owner
+            folder_prefix = re.escape(os.path.join(os.path.dirname(document["paths"]), ""))
+            for document_id in self.song_model.find_song_ids({"paths": {"$regex": f"^{folder_prefix}"}}):
+                changes = self.migrated_paths(self.song_model.find_song_document(document_id))
+                if changes:
+                    self.song_model.update_song(document_id, changes)
+            for wav_path in wav_files:
+                storage.delete(wav_path)
+                invalidate_decoded(wav_path)
+
+            report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+            report["source_decode_seconds"] = round(report["source_decode_seconds"], 3)
+            report["decode_seconds"] = round(report["decode_seconds"], 3)
+            print(f"Migrated {report['files']} files of song {current_id} to {STEM_EXTENSION}, "
+                  f"saved {report['bytes_saved']} bytes")
+            songs[current_id] = report
+            totals["songs"] += 1
+            for name in ("files", "bytes_before", "bytes_after", "source_decode_seconds", "decode_seconds"):
+                totals[name] += report[name]
+
+        totals["bytes_saved"] = totals["bytes_before"] - totals["bytes_after"]
+        totals["source_decode_seconds"] = round(totals["source_decode_seconds"], 3)
+        totals["decode_seconds"] = round(totals["decode_seconds"], 3)
+        return {**totals, "format": STEM_EXTENSION.lstrip("."), "per_song": songs}
+
+    def upgrade_separation(self, song_id, token=None):
+        """
+        Re-separate a song separated with the fast model using the high-quality model.
+
+        The new stems are separated in a work folder and then renamed over the current
+        ones, so players never read a partial file. Variants, mixes and rendered virtual
+        voices derived from the old stems are deleted and re-rendered on demand.
+
+        Parameters:
+            song_id (str): Unique identifier of the song.
+            token (CancelToken): Optional token checked before loading the model and between
+                separation chunks.
+
+        Returns:
+            dict: Status, the song's separation tier, the seconds spent separating and the
+                  real-time factor of the separation.
+            tuple: Error message and HTTP status code if the song is unknown or was
+                   re-uploaded during the separation.
+        """
+        token = token or CancelToken()
+        document = self.song_model.find_song_document(song_id)
+        if document is None:
+            return {"error": "Song not found"}, 404
+        if document.get("separation_tier", HQ_TIER) == HQ_TIER:
+            return {"status": "Song already separated with the high-quality model", "song_id": song_id,
+                    "separation_tier": HQ_TIER}
+
+        storage = get_storage()
+        mix_path = document["paths"].replace("%23", "#")
+        folder = os.path.dirname(mix_path)
+        work_dir = os.path.join(folder, ".separation_hq")
+        storage.ensure_local(mix_path)
+        audio_seconds = float(document.get("duration") or 0) or sf.info(mix_path).duration
+
+        try:
+            started = time.perf_counter()
+            stem_files = separate_and_rename_stems(mix_path, token=token, tier=HQ_TIER, output_dir=work_dir)
+            seconds = time.perf_counter() - started
+            self.timing_model.record(f"separate:{HQ_TIER}", seconds, audio_seconds)
+            token.check()
+
+            current = self.song_model.find_song_document(song_id)
+            if current is None or current.get("paths") != document.get("paths"):
+                return {"error": "Song was re-uploaded during re-separation"}, 409
+
+            changes = {"separation_tier": HQ_TIER}
+            keep = [mix_path]
+            for stem_file in stem_files:
+                field = "soprano_path" if "Soprano" in os.path.basename(stem_file) else "instrumental_path"
+                target = os.path.join(folder, os.path.basename(stem_file))
+                os.replace(stem_file, target)
+                invalidate_decoded(target)
+                storage.publish(target)
+                previous = (current["musical_parts"].get(field) or "").replace("%23", "#")
+                if previous and os.path.normpath(previous) != os.path.normpath(target):
+                    changes[f"musical_parts.{field}"] = target
+                keep.append(target)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        # Voices rendered explicitly stay; virtual voices are rendered again from the new Soprano
+        virtual = current.get("virtual_parts") or {}
+        keep += [path for name, path in (current.get("harmony_parts") or {}).items() if name not in virtual]
+        delete_unwanted_files(folder, *keep)
+        delete_unwanted_files(os.path.join(folder, MIX_DIR))
+        delete_unwanted_files(os.path.join(folder, PREVIEW_DIR))
+        delete_unwanted_files(os.path.join(folder, STREAM_DIR))
+
+        # Songs stored with duplicate=reuse share this song's stems
+        for document_id in [song_id] + self.song_model.find_song_ids({"duplicate_of": document["_id"]}):
+            self.song_model.update_song(document_id, changes)
+
+        print(f"Re-separated song {song_id} with {SEPARATION_MODELS[HQ_TIER]} in {seconds:.1f}s")
+        return {"status": "Stems upgraded to the high-quality model", "song_id": song_id,
+                "separation_tier": HQ_TIER, "seconds": round(seconds, 2),
+                "real_time_factor": round(seconds / audio_seconds, 3) if audio_seconds else None}
+
+    def separation_tiers(self):
+        """
+        Describe the separation tiers and their measured real-time factors.
+
+        Returns:
+            dict: Model and real-time factor (seconds of separation per second of audio)
+                  of every tier, the configured default tier and whether fast songs are
+                  upgraded in the background.
+        """
+        keys = [f"separate:{tier}" for tier in SEPARATION_MODELS]
+        rates = {**DEFAULT_STAGE_RATES, **self.timing_model.get_rates(keys)}
+        return {
+            "tiers": {tier: {"model": model, "real_time_factor": round(rates.get(f"separate:{tier}", 0.0), 3)}
+                      for tier, model in SEPARATION_MODELS.items()},
+            "default": SEPARATION_TIER,
+            "upgrade": SEPARATION_UPGRADE,
+        }
+
+    def get_lyrics(self, song_id, socketio=None, job_id=None, token=None):
         """
         Retrieve or extract lyrics for a specified song ID.
 
         Parameters:
             song_id (str): Unique identifier of the song to retrieve lyrics for.
+            socketio (SocketIO): Optional Socket.IO server for transcription progress.
+            job_id (str): Room receiving the transcription progress.
+            token (CancelToken): Optional token checked between transcription chunks.
 
         Returns:
             dict: JSON response with lyrics text.
@@ -335,7 +1124,12 @@ class SongController:
 
             # Extract lyrics from audio
             try:
-                lyrics = extract_lyrics(soprano_path)
+                progress = ProgressReporter(socketio, job_id or song_id, LYRICS_STAGES,
+                                            song_details.get("duration") or 0, self.timing_model)
+                lyrics = extract_lyrics(soprano_path, progress, token)
+                progress.finish()
+            except Cancelled as e:
+                return {"error": f"Lyrics extraction cancelled: {e.reason}"}, e.status_code
             except Exception as e:
                 return {"error": f"Lyrics extraction failed: {str(e)}"}, 500
 
@@ -0,0 +1,107 @@
+"""
+Process pool that keeps CPU-heavy request handlers out of the web server processes.
+
+In production each web worker serves many requests from threads; running a multi-second
+pitch shift or separation in one of those threads holds the GIL and stalls every other
+request of that worker. Handlers are instead run by tasks.run_task in a pool of spawned
+processes, each with its own database connection and, when a Socket.IO message queue is
+configured, its own emitter for progress events. The request thread only waits on the
+result.
+
+Classes:
+    - CpuPool: Runs task handlers in worker processes and waits for their results.
+
+Dependencies:
+    - concurrent.futures: Process pool.
+    - pymongo: Database connection of each pool process.
+    - flask_socketio.SocketIO: External emitter publishing through the message queue.
+    - tasks.run_task: Task handlers shared with worker.py.
+    - warmup: Warm-up of each pool process and its first-request latencies.
+    - fft_backend.fft_workers: FFT threads of each pool process, the cores divided among them.
+"""
+
+import os
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+
+_controller = None
+_emitter = None
+_first_request_model = None
+_fft_threads = 1
+
+
+def _init_process(mongo_uri, message_queue, fft_threads=1):
+    """
+    Create the controller and Socket.IO emitter of one pool process and warm it up.
+
+    The JIT cache folder is inherited from the web process's environment.
+
+    Parameters:
+        mongo_uri (str): MongoDB connection string.
+        message_queue (str): Socket.IO message queue URL, or None.
+        fft_threads (int): Threads per FFT of this process's jobs.
+    """
+    global _controller, _emitter, _first_request_model, _fft_threads
+    from pymongo import MongoClient
+    from flask_socketio import SocketIO
+    from controllers.song_controller import SongController
+    from models.first_request_model import FirstRequestModel
+    from utils.warmup import warm_up, WARMUP
+
+    mongo = SimpleNamespace(db=MongoClient(mongo_uri).get_default_database())
+    _controller = SongController(mongo)
+    _emitter = SocketIO(message_queue=message_queue) if message_queue else None
+    _first_request_model = FirstRequestModel(mongo)
+    _fft_threads = fft_threads
+    if WARMUP:
+        warm_up()
+
+
+def _run(job_type, payload):
+    from tasks import run_task
+    from utils.warmup import first_request
+    from utils.fft_backend import fft_workers
+    with fft_workers(_fft_threads), first_request(job_type, _first_request_model, "pool"):
+        return run_task(_controller, job_type, payload, _emitter)
+
+
+class CpuPool:
+    """
+    Runs task handlers in a pool of worker processes.
+
+    Attributes:
+        executor (ProcessPoolExecutor): Pool of spawned worker processes.
+    """
+
+    def __init__(self, workers, mongo_uri, message_queue=None):
+        """
+        Start the pool.
+
+        Parameters:
+            workers (int): Number of worker processes.
+            mongo_uri (str): MongoDB connection string for the worker processes.
+            message_queue (str): Socket.IO message queue URL used for progress events.
+        """
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process,
+            initargs=(mongo_uri, message_queue, max(1, (os.cpu_count() or 1) // workers)),
+        )
+
+    def run(self, job_type, payload):
+        """
+        Run a task handler in the pool and wait for its result.
+
+        Parameters:
+            job_type (str): Name of the task handler.
+            payload (dict): Arguments for the handler.
+
+        Returns:
+            dict: Result of the handler.
+        """
+        return self.executor.submit(_run, job_type, payload).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,294 @@
+"""
+Command-line batch ingester for onboarding whole music catalogs.
+
+Runs the same pipeline as the POST /insert route (SongController.process_song) over every
+audio file in a directory or listed in a manifest, using a configurable process pool.
+Finished songs are written to MongoDB in bulk and recorded in a progress manifest, so an
+interrupted run can be restarted and will skip everything that already completed. Every
+song's landmark fingerprint is indexed, so later uploads of the same tracks are found as
+near-duplicates. Songs are identified by their source path (stored as 'source_path'), so
+files with the same name in different catalog folders stay separate songs; their names
+are prefixed with their folders to tell them apart.
+
+Usage:
+    python ingest.py <directory-or-manifest> [--workers N] [--solo] [--artist NAME]
+
+Manifest format:
+    - Plain text: one audio file path per line.
+    - JSON lines: {"path": str, "artist": str, "isSolo": bool, "lyrics": str} per line.
+
+Dependencies:
+    - argparse: Command-line parsing.
+    - concurrent.futures: Process pool for running songs in parallel.
+    - pymongo: Direct database connection outside of Flask.
+    - SongController.process_song: Ingest pipeline shared with the Flask route.
+    - harmony.parse_voices: Validating --voices like the route does.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bson import ObjectId
+from pymongo import MongoClient
+from werkzeug.utils import secure_filename
+from controllers.song_controller import SongController
+from models.song_model import SongModel
+from models.feature_model import FeatureModel
+from models.fingerprint_model import FingerprintModel
+from utils.file_operations import allowed_file, copy_song_file
+from utils.harmony import parse_voices
+from utils.stem_format import STEM_EXTENSION
+
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/musicnalyzer"
+DEFAULT_PROGRESS_MANIFEST = "ingest_progress.jsonl"
+
+
+def collect_sources(source, default_artist, default_solo):
+    """
+    Build the list of songs to ingest from a directory or a manifest file.
+
+    Parameters:
+        source (str): Directory to scan recursively, or path to a manifest file.
+        default_artist (str): Artist used when the manifest does not provide one.
+        default_solo (bool): Solo flag used when the manifest does not provide one.
+
+    Returns:
+        list: Song entries as dicts with path, artist, is_solo and lyrics.
+    """
+    entries = []
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for filename in sorted(files):
+                if allowed_file(filename):
+                    entries.append({"path": os.path.join(root, filename)})
+    else:
+        with open(source, "r") as manifest:
+            for line in manifest:
+                line = line.strip()
+                if not line:
+                    continue
+                entries.append(json.loads(line) if line.startswith("{") else {"path": line})
+
+    return [{
+        "path": os.path.abspath(entry["path"]),
+        "artist": entry.get("artist", default_artist),
+        "is_solo": str(entry.get("isSolo", default_solo)).capitalize(),
+        "lyrics": entry.get("lyrics", ""),
+    } for entry in entries if allowed_file(entry["path"])]
+
+
+def song_names(paths):
+    """
+    Name every source file after its file name, prefixed with its folders where file
+    names collide.
+
+    Parameters:
+        paths (list): Absolute paths of the source files.
+
+    Returns:
+        dict: Sanitized song name per path.
+    """
+    groups = {}
+    for path in paths:
+        groups.setdefault(secure_filename(os.path.basename(path)), []).append(path)
+
+    names = {}
+    for name, group in groups.items():
+        if len(group) == 1:
+            names[group[0]] = name
+            continue
+        # Relative to the folders the colliding files share, e.g. 'rock_song.wav'
+        common = os.path.commonpath([os.path.dirname(path) for path in group])
+        for path in group:
+            names[path] = secure_filename(os.path.relpath(path, common).replace(os.sep, "_"))
+    return names
+
+
+def load_progress(manifest_path):
+    """
+    Read the progress manifest of previous runs.
+
+    Parameters:
+        manifest_path (str): Path to the progress manifest.
+
+    Returns:
+        set: Absolute paths of source files that were fully ingested.
+    """
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+
+    with open(manifest_path, "r") as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A crash can leave a partially written last line
+            if record.get("status") == "done":
+                done.add(record["source"])
+    return done
+
+
+def ingest_one(task):
+    """
+    Copy one source file into its upload folder and run the ingest pipeline on it.
+
+    Runs inside a pool worker; the database write is left to the parent process.
+
+    Parameters:
+        task (dict): Song entry extended with name, song_id and upload_folder.
+
+    Returns:
+        dict: Source path, song document (or error) and processing time in seconds.
+    """
+    started = time.perf_counter()
+    try:
+        import librosa
+        from utils.audio_processing import load_song
+        from utils.audio_cache import ANALYSIS_DTYPE
+        from utils.fingerprint import landmarks
+        from utils.fft_backend import fft_workers
+
+        original_filename = task["name"]
+        file_base_name, file_extension = os.path.splitext(original_filename)
+        song_folder = os.path.join(task["upload_folder"], task["song_id"])
+        os.makedirs(song_folder, exist_ok=True)
+
+        file_path = copy_song_file(task["path"], song_folder, f"{file_base_name}{STEM_EXTENSION}",
+                                   file_extension.lower())
+        duration = librosa.get_duration(path=file_path)
+        audio, sample_rate = load_song(file_path, ANALYSIS_DTYPE)
+        song_landmarks = landmarks(audio, sample_rate)
+
+        with fft_workers(task.get("fft_threads", 1)):
+            song_data = SongController.process_song(
+                task["song_id"], file_path, original_filename, task["is_solo"], task["artist"],
+                duration, task["lyrics"], task.get("voices"), task.get("diatonic", False)
+            )
+        song_data["source_path"] = task["path"]
+        return {"source": task["path"], "song": song_data, "landmarks": song_landmarks, "duration": duration,
+                "seconds": time.perf_counter() - started}
+    except Exception as e:
+        return {"source": task["path"], "error": str(e), "seconds": time.perf_counter() - started}
+
+
+def flush(song_model, feature_model, fingerprint_model, pending, manifest):
+    """
+    Write pending songs to the database in bulk and mark them as done in the manifest.
+
+    Parameters:
+        song_model (SongModel): Model used for the bulk write.
+        feature_model (FeatureModel): Model used for the bulk write of feature documents.
+        fingerprint_model (FingerprintModel): Index receiving the songs' landmarks.
+        pending (list): Results returned by ingest_one.
+        manifest (file): Open progress manifest.
+
+    Returns:
+        None
+    """
+    if not pending:
+        return
+    features = [{"_id": result["song"]["_id"], **result["song"].pop("features")}
+                for result in pending if result["song"].get("features")]
+    song_model.bulk_upsert_songs([result["song"] for result in pending])
+    feature_model.bulk_save_features(features)
+    for result in pending:
+        fingerprint_model.save_fingerprint(result["song"]["_id"], result.pop("landmarks"))
+    for result in pending:
+        manifest.write(json.dumps({
+            "source": result["source"], "status": "done",
+            "song_id": str(result["song"]["_id"]), "seconds": round(result["seconds"], 2),
+        }) + "\n")
+    manifest.flush()
+    os.fsync(manifest.fileno())
+    pending.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-ingest a directory or manifest of songs.")
+    parser.add_argument("source", help="Directory to scan or manifest file (plain paths or JSON lines).")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of songs processed in parallel.")
+    parser.add_argument("--batch-size", type=int, default=20, help="Songs per bulk database write.")
+    parser.add_argument("--upload-folder", default=os.getenv("UPLOAD_FOLDER", "uploads"))
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", DEFAULT_MONGO_URI))
+    parser.add_argument("--progress-manifest", default=DEFAULT_PROGRESS_MANIFEST,
+                        help="Resumable record of finished songs.")
+    parser.add_argument("--artist", default="", help="Artist for entries without one.")
+    parser.add_argument("--solo", action="store_true", help="Generate harmony voices for every song.")
+    parser.add_argument("--voices", help='JSON list of harmony voices, e.g. \'[{"name": "Alto", "interval": 4}]\'.')
+    parser.add_argument("--diatonic", action="store_true", help="Keep harmony voices within the detected key.")
+    args = parser.parse_args(argv)
+    try:
+        voices = parse_voices(json.loads(args.voices)) if args.voices else None
+    except (TypeError, ValueError) as e:
+        parser.error(f"Invalid voices: {e}")
+
+    mongo = SimpleNamespace(db=MongoClient(args.mongo_uri).get_default_database())
+    song_model = SongModel(mongo)
+    feature_model = FeatureModel(mongo)
+    fingerprint_model = FingerprintModel(mongo)
+    fingerprint_model.ensure_indexes()
+
+    entries = collect_sources(args.source, args.artist, args.solo)
+    done = load_progress(args.progress_manifest)
+    pending_entries = [entry for entry in entries if entry["path"] not in done]
+    print(f"Found {len(entries)} songs, {len(entries) - len(pending_entries)} already ingested, "
+          f"{len(pending_entries)} to go.")
+
+    # The cores are split among the songs processed in parallel
+    fft_threads = max(1, (os.cpu_count() or 1) // args.workers)
+    # Names are chosen over the whole catalog so they stay the same across resumed runs
+    names = song_names([entry["path"] for entry in entries])
+    tasks = []
+    for entry in pending_entries:
+        existing_song = song_model.find_song_by_source(entry["path"])
+        song_id = str(existing_song["_id"]) if existing_song else str(ObjectId())
+        tasks.append({**entry, "name": names[entry["path"]], "song_id": song_id, "upload_folder": args.upload_folder,
+                      "voices": voices, "diatonic": args.diatonic, "fft_threads": fft_threads})
+
+    started = time.perf_counter()
+    completed, failed, audio_seconds = 0, 0, 0.0
+    pending = []
+
+    # Spawned workers avoid inheriting model and thread state from the parent
+    context = multiprocessing.get_context("spawn")
+    with open(args.progress_manifest, "a") as manifest, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+        futures = [executor.submit(ingest_one, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            if "error" in result:
+                failed += 1
+                print(f"Failed: {result['source']}: {result['error']}")
+                manifest.write(json.dumps({"source": result["source"], "status": "failed",
+                                           "error": result["error"]}) + "\n")
+                continue
+
+            completed += 1
+            audio_seconds += result["duration"]
+            pending.append(result)
+            print(f"[{completed + failed}/{len(tasks)}] {result['source']} ({result['seconds']:.1f}s)")
+            if len(pending) >= args.batch_size:
+                flush(song_model, feature_model, fingerprint_model, pending, manifest)
+
+        flush(song_model, feature_model, fingerprint_model, pending, manifest)
+
+    elapsed = time.perf_counter() - started
+    songs_per_hour = completed / elapsed * 3600 if elapsed > 0 else 0.0
+    print("\nIngest report")
+    print(f"  Songs ingested:   {completed}")
+    print(f"  Songs failed:     {failed}")
+    print(f"  Wall time:        {elapsed:.1f}s with {args.workers} workers")
+    print(f"  Audio processed:  {audio_seconds / 3600:.2f}h")
+    print(f"  Throughput:       {songs_per_hour:.1f} songs/hour")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
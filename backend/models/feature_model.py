@@ -0,0 +1,75 @@
+"""
+FeatureModel module for storing per-song audio feature summaries in MongoDB.
+
+Feature documents are kept in their own 'features' collection, keyed by the song's ID,
+so the song documents served to the player stay small.
+
+Classes:
+    - FeatureModel: Provides storage and lookup of feature documents.
+
+Dependencies:
+    - bson.ObjectId: MongoDB ObjectId type for identifying records.
+    - pymongo.ReplaceOne: Bulk upserts for batch ingestion.
+"""
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+
+class FeatureModel:
+    """
+    Model class for interacting with the MongoDB 'features' collection.
+
+    Attributes:
+        mongo: MongoDB client instance for database operations.
+    """
+
+    def __init__(self, mongo):
+        """
+        Initialize the FeatureModel with a MongoDB client.
+
+        Parameters:
+            mongo: MongoDB client instance for accessing the features collection.
+        """
+        self.mongo = mongo
+
+    def save_features(self, song_id, features):
+        """
+        Insert or replace the feature document of a song.
+
+        Parameters:
+            song_id (str or ObjectId): ID of the song.
+            features (dict): Feature summaries and per-feature costs.
+
+        Returns:
+            None
+        """
+        self.mongo.db.features.replace_one({"_id": ObjectId(song_id)}, features, upsert=True)
+
+    def bulk_save_features(self, documents):
+        """
+        Insert or replace many feature documents in a single round trip.
+
+        Parameters:
+            documents (list): Feature documents, each with the song's '_id'.
+
+        Returns:
+            None
+        """
+        if documents:
+            self.mongo.db.features.bulk_write(
+                [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents],
+                ordered=False,
+            )
+
+    def find_features(self, song_id):
+        """
+        Retrieve the feature document of a song.
+
+        Parameters:
+            song_id (str): ID of the song.
+
+        Returns:
+            dict: Feature document without its '_id', or None if the song has none.
+        """
+        return self.mongo.db.features.find_one({"_id": ObjectId(song_id)}, {"_id": 0})
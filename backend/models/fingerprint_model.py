@@ -0,0 +1,108 @@
+"""
+FingerprintModel module for the inverted index of audio landmarks in MongoDB.
+
+Each landmark of a song is one small document in the 'fingerprints' collection holding
+its hash, the song's ID and the landmark's frame offset. A compound index on
+(hash, song_id, offset) makes every lookup an index-only scan, so finding the songs that
+share landmarks with a query stays fast as the library grows.
+
+Classes:
+    - FingerprintModel: Provides indexing, removal and near-duplicate lookup of songs.
+
+Dependencies:
+    - bson.ObjectId: MongoDB ObjectId type for identifying songs.
+    - pymongo.ASCENDING: Index definition.
+    - fingerprint.rank_matches: Offset-histogram ranking of candidates.
+"""
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from utils.fingerprint import rank_matches
+
+INSERT_BATCH = 5000
+
+
+class FingerprintModel:
+    """
+    Model class for interacting with the MongoDB 'fingerprints' collection.
+
+    Attributes:
+        mongo: MongoDB client instance for database operations.
+    """
+
+    def __init__(self, mongo):
+        """
+        Initialize the FingerprintModel with a MongoDB client.
+
+        Parameters:
+            mongo: MongoDB client instance for accessing the fingerprints collection.
+        """
+        self.mongo = mongo
+        self._indexed = False
+
+    @property
+    def fingerprints(self):
+        return self.mongo.db.fingerprints
+
+    def ensure_indexes(self):
+        """
+        Create the hash index used by lookups and the song index used by removals.
+
+        Returns:
+            None
+        """
+        self.fingerprints.create_index([("hash", ASCENDING), ("song_id", ASCENDING), ("offset", ASCENDING)])
+        self.fingerprints.create_index([("song_id", ASCENDING)])
+        self._indexed = True
+
+    def save_fingerprint(self, song_id, landmarks):
+        """
+        Replace the indexed landmarks of a song, creating the indexes on first use.
+
+        Parameters:
+            song_id (str or ObjectId): ID of the song.
+            landmarks (list): (hash, frame) tuples computed by fingerprint.landmarks.
+
+        Returns:
+            None
+        """
+        if not self._indexed:
+            self.ensure_indexes()
+        song_id = ObjectId(song_id)
+        self.fingerprints.delete_many({"song_id": song_id})
+        documents = [{"hash": fingerprint_hash, "song_id": song_id, "offset": frame}
+                     for fingerprint_hash, frame in landmarks]
+        for start in range(0, len(documents), INSERT_BATCH):
+            self.fingerprints.insert_many(documents[start:start + INSERT_BATCH], ordered=False)
+
+    def delete_fingerprint(self, song_id):
+        """
+        Remove the indexed landmarks of a song.
+
+        Parameters:
+            song_id (str or ObjectId): ID of the song.
+
+        Returns:
+            None
+        """
+        self.fingerprints.delete_many({"song_id": ObjectId(song_id)})
+
+    def find_matches(self, landmarks, exclude=None):
+        """
+        Find indexed songs sharing offset-consistent landmarks with a query.
+
+        Parameters:
+            landmarks (list): (hash, frame) tuples of the query.
+            exclude (str): ID of a song to leave out, e.g. the song being re-uploaded.
+
+        Returns:
+            list: Candidates ranked by fingerprint.rank_matches, best first.
+        """
+        hashes = list({fingerprint_hash for fingerprint_hash, _ in landmarks})
+        if not hashes:
+            return []
+        query = {"hash": {"$in": hashes}}
+        if exclude:
+            query["song_id"] = {"$ne": ObjectId(exclude)}
+        postings = self.fingerprints.find(query, {"_id": 0, "hash": 1, "song_id": 1, "offset": 1})
+        return rank_matches(landmarks, postings)
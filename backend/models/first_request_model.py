@@ -0,0 +1,79 @@
+"""
+FirstRequestModel module for keeping the latency of the first request of fresh processes.
+
+Every web, pool and queue worker process records how long its first request of each job
+type took and whether the process had been warmed up before, so cold and warm starts
+can be compared across deploys.
+
+Classes:
+    - FirstRequestModel: Provides recording and per-job-type summaries of first requests.
+"""
+
+import time
+
+
+class FirstRequestModel:
+    """
+    Model class for interacting with the MongoDB 'first_requests' collection.
+
+    Attributes:
+        mongo: MongoDB client instance for database operations.
+    """
+
+    def __init__(self, mongo):
+        """
+        Initialize the FirstRequestModel with a MongoDB client.
+
+        Parameters:
+            mongo: MongoDB client instance for accessing the first_requests collection.
+        """
+        self.mongo = mongo
+
+    def record(self, job_type, seconds, warmed, process="web"):
+        """
+        Store the latency of a process's first request of a job type.
+
+        Parameters:
+            job_type (str): Task handler name of the request.
+            seconds (float): Measured latency.
+            warmed (bool): Whether the process finished its warm-up before the request.
+            process (str): Kind of process that served it ('web', 'pool' or 'worker').
+
+        Returns:
+            None
+        """
+        try:
+            self.mongo.db.first_requests.insert_one(
+                {"job_type": job_type, "process": process, "seconds": seconds, "warmed": warmed,
+                 "recorded_at": time.time()}
+            )
+        except Exception as e:
+            print(f"Error recording first request: {e}")
+
+    def summary(self):
+        """
+        Summarize first-request latencies per process kind and job type, for cold and
+        warmed processes.
+
+        Returns:
+            dict: {process: {job_type: {"cold"|"warm": {"count", "mean_seconds", "max_seconds"}}}}.
+        """
+        pipeline = [{"$group": {
+            "_id": {"process": "$process", "job_type": "$job_type", "warmed": "$warmed"},
+            "count": {"$sum": 1},
+            "mean_seconds": {"$avg": "$seconds"},
+            "max_seconds": {"$max": "$seconds"},
+        }}]
+        summary = {}
+        try:
+            for group in self.mongo.db.first_requests.aggregate(pipeline):
+                start = "warm" if group["_id"]["warmed"] else "cold"
+                process = summary.setdefault(group["_id"].get("process", "web"), {})
+                process.setdefault(group["_id"]["job_type"], {})[start] = {
+                    "count": group["count"],
+                    "mean_seconds": round(group["mean_seconds"], 3),
+                    "max_seconds": round(group["max_seconds"], 3),
+                }
+        except Exception as e:
+            print(f"Error reading first requests: {e}")
+        return summary
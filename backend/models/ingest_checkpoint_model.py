@@ -0,0 +1,113 @@
+"""
+IngestCheckpointModel module for recording the completed stages of song ingests.
+
+An ingest (fingerprint, decode, analyze, separate, harmonize, persist) records the
+result of every completed stage under the song's ID. When the ingest crashes or its job
+is retried, the next attempt finds the checkpoint, by song ID or, for an upload that
+never reached the database, by file name, and resumes after the last completed stage.
+A re-upload resumes only if its digest matches the one recorded with the checkpoint.
+The checkpoint is removed once the song document is written.
+
+Classes:
+    - IngestCheckpointModel: Provides creation, lookup, stage completion and removal of
+      ingest checkpoints.
+
+Dependencies:
+    - time: Checkpoint timestamps.
+"""
+
+import time
+
+
+class IngestCheckpointModel:
+    """
+    Model class for interacting with the MongoDB 'ingest_checkpoints' collection.
+
+    Attributes:
+        mongo: MongoDB client instance for database operations.
+    """
+
+    def __init__(self, mongo):
+        """
+        Initialize the IngestCheckpointModel with a MongoDB client.
+
+        Parameters:
+            mongo: MongoDB client instance for accessing the ingest_checkpoints collection.
+        """
+        self.mongo = mongo
+
+    @property
+    def checkpoints(self):
+        return self.mongo.db.ingest_checkpoints
+
+    def start(self, song_id, song, file_path, separation_tier, digest=None):
+        """
+        Create the checkpoint of a new ingest, replacing any earlier one of the song.
+
+        Parameters:
+            song_id (str): ID of the song being ingested.
+            song (str): Sanitized file name of the upload.
+            file_path (str): Path of the saved upload.
+            separation_tier (str): Separation model tier of the ingest, kept for resumes.
+            digest (str): SHA-256 digest of the uploaded bytes, compared with re-uploads.
+
+        Returns:
+            dict: The new checkpoint.
+        """
+        checkpoint = {"_id": song_id, "song": song, "file_path": file_path, "digest": digest,
+                      "separation_tier": separation_tier, "stages": {}, "updated_at": time.time()}
+        self.checkpoints.replace_one({"_id": song_id}, checkpoint, upsert=True)
+        return checkpoint
+
+    def find(self, song_id):
+        """
+        Retrieve the checkpoint of a song.
+
+        Parameters:
+            song_id (str): ID of the song.
+
+        Returns:
+            dict: Checkpoint, or None if the song has no unfinished ingest.
+        """
+        return self.checkpoints.find_one({"_id": song_id})
+
+    def find_by_name(self, song):
+        """
+        Retrieve the latest unfinished ingest of an upload by its file name.
+
+        Parameters:
+            song (str): Sanitized file name of the upload.
+
+        Returns:
+            dict: Checkpoint, or None.
+        """
+        return self.checkpoints.find_one({"song": song}, sort=[("updated_at", -1)])
+
+    def complete_stage(self, song_id, stage, result=None):
+        """
+        Record a completed stage and its result.
+
+        Parameters:
+            song_id (str): ID of the song.
+            stage (str): Name of the stage.
+            result (dict): What later stages and resumes need from it.
+
+        Returns:
+            None
+        """
+        self.checkpoints.update_one(
+            {"_id": song_id},
+            {"$set": {f"stages.{stage}": result or {}, "updated_at": time.time()}},
+        )
+
+    def clear(self, song_id):
+        """
+        Remove the checkpoint of a song, once its document is written.
+
+        Parameters:
+            song_id (str): ID of the song.
+
+        Returns:
+            None
+        """
+        self.checkpoints.delete_one({"_id": song_id})
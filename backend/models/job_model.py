@@ -0,0 +1,305 @@
+"""
+JobModel module for the MongoDB-backed work queue shared by Flask nodes and workers.
+
+Flask nodes only enqueue jobs; standalone workers (see worker.py) claim them with an
+atomic `find_one_and_update`, which hands each job to exactly one worker under a lease.
+Workers extend their lease with heartbeats while they run, and a job whose lease expires
+(because its worker crashed or stalled) becomes claimable again until it runs out of
+attempts. Jobs can be cancelled: queued jobs are never claimed, and running jobs are
+flagged so their worker abandons them at its next heartbeat.
+
+Classes:
+    - JobModel: Provides enqueue, claim, heartbeat, completion, cancellation, queue depth
+      and lookup of jobs.
+
+Dependencies:
+    - time: Lease timestamps (injectable clock for tests).
+    - bson.ObjectId: MongoDB ObjectId type for identifying jobs.
+    - pymongo.ReturnDocument: Returning the claimed job from find_one_and_update.
+
+Any object exposing `db.jobs` with the pymongo collection API works as the client, so the
+model runs against a local mongod or an in-memory stand-in such as mongomock.
+"""
+
+import time
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobModel:
+    """
+    Model class for interacting with the MongoDB 'jobs' collection.
+
+    Attributes:
+        mongo: MongoDB client instance for database operations.
+        clock (callable): Returns the current time in seconds.
+        max_attempts (int): Number of claims after which a job is marked failed.
+    """
+
+    def __init__(self, mongo, clock=time.time, max_attempts=3):
+        """
+        Initialize the JobModel with a MongoDB client.
+
+        Parameters:
+            mongo: MongoDB client instance for accessing the jobs collection.
+            clock (callable): Returns the current time in seconds.
+            max_attempts (int): Number of claims after which a job is marked failed.
+        """
+        self.mongo = mongo
+        self.clock = clock
+        self.max_attempts = max_attempts
+
+    @property
+    def jobs(self):
+        return self.mongo.db.jobs
+
+    def ensure_indexes(self):
+        """
+        Create the indexes used by claim queries.
+
+        Returns:
+            None
+        """
+        self.jobs.create_index([("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)])
+        self.jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+
+    def enqueue(self, job_type, payload, priority=0):
+        """
+        Add a job to the queue.
+
+        Parameters:
+            job_type (str): Name of the task handler that should run the job.
+            payload (dict): Arguments for the task handler.
+            priority (int): Higher priorities are claimed first.
+
+        Returns:
+            str: ID of the new job.
+        """
+        job = {
+            "_id": ObjectId(),
+            "type": job_type,
+            "payload": payload,
+            "priority": priority,
+            "status": QUEUED,
+            "attempts": 0,
+            "created_at": self.clock(),
+            "worker_id": None,
+            "lease_expires_at": None,
+            "result": None,
+            "error": None,
+        }
+        self.jobs.insert_one(job)
+        return str(job["_id"])
+
+    def claim(self, worker_id, lease_seconds, job_types=None):
+        """
+        Atomically claim the next queued job, or a running job whose lease has expired.
+
+        Parameters:
+            worker_id (str): Identifier of the claiming worker.
+            lease_seconds (float): Duration of the lease before the job can be reclaimed.
+            job_types (list): Restrict claims to these job types, or None for any.
+
+        Returns:
+            dict: The claimed job document, or None if nothing is claimable.
+        """
+        now = self.clock()
+        query = {
+            "$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+            ],
+            "attempts": {"$lt": self.max_attempts},
+        }
+        if job_types:
+            query["type"] = {"$in": list(job_types)}
+
+        return self.jobs.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "started_at": now,
+                    "lease_expires_at": now + lease_seconds,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """
+        Extend the lease of a running job held by this worker.
+
+        Parameters:
+            job_id (ObjectId): ID of the job.
+            worker_id (str): Identifier of the worker holding the lease.
+            lease_seconds (float): New lease duration from now.
+
+        Returns:
+            bool: True if the lease was extended, False if the worker no longer holds it.
+        """
+        result = self.jobs.update_one(
+            {"_id": ObjectId(job_id), "status": RUNNING, "worker_id": worker_id},
+            {"$set": {"lease_expires_at": self.clock() + lease_seconds}},
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        """
+        Mark a job as done and store its result.
+
+        Parameters:
+            job_id (ObjectId): ID of the job.
+            worker_id (str): Identifier of the worker holding the lease.
+            result (dict): Result returned by the task handler.
+
+        Returns:
+            bool: True if the job was still held by this worker.
+        """
+        update = self.jobs.update_one(
+            {"_id": ObjectId(job_id), "status": RUNNING, "worker_id": worker_id},
+            {"$set": {"status": DONE, "result": result, "finished_at": self.clock()}},
+        )
+        return update.matched_count == 1
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Record a failed attempt, requeueing the job while it has attempts left.
+
+        Parameters:
+            job_id (ObjectId): ID of the job.
+            worker_id (str): Identifier of the worker holding the lease.
+            error (str): Description of the failure.
+
+        Returns:
+            bool: True if the job was still held by this worker.
+        """
+        job = self.jobs.find_one({"_id": ObjectId(job_id), "worker_id": worker_id})
+        if job is None:
+            return False
+
+        status = QUEUED if job.get("attempts", 0) < self.max_attempts else FAILED
+        update = self.jobs.update_one(
+            {"_id": ObjectId(job_id), "status": RUNNING, "worker_id": worker_id},
+            {"$set": {"status": status, "error": error, "worker_id": None,
+                      "lease_expires_at": None, "finished_at": self.clock()}},
+        )
+        return update.matched_count == 1
+
+    def request_cancel(self, room=None, song_id=None, reason="cancelled"):
+        """
+        Cancel the queued and running jobs of a Socket.IO room or of a song.
+
+        Queued jobs are marked cancelled right away; running jobs are flagged and their
+        worker abandons them (see cancel_reason).
+
+        Parameters:
+            room (str): Progress room recorded in the payload ('jobId' or 'progress_room').
+            song_id (str): Song ID recorded in the payload of ingest jobs.
+            reason (str): Why the jobs are cancelled.
+
+        Returns:
+            int: Number of jobs cancelled or flagged.
+        """
+        if room:
+            match = {"$or": [{"payload.jobId": room}, {"payload.progress_room": room}]}
+        elif song_id:
+            match = {"payload.song_id": song_id}
+        else:
+            return 0
+
+        queued = self.jobs.update_many(
+            {**match, "status": QUEUED},
+            {"$set": {"status": CANCELLED, "error": reason, "finished_at": self.clock()}},
+        )
+        running = self.jobs.update_many(
+            {**match, "status": RUNNING},
+            {"$set": {"cancel_requested": reason}},
+        )
+        return queued.modified_count + running.modified_count
+
+    def cancel_reason(self, job_id):
+        """
+        Return why a running job should be abandoned, if it should.
+
+        Parameters:
+            job_id (ObjectId): ID of the job.
+
+        Returns:
+            str: Cancellation reason, or None if the job should keep running.
+        """
+        job = self.jobs.find_one({"_id": ObjectId(job_id)}, {"cancel_requested": 1})
+        return job.get("cancel_requested") if job else None
+
+    def cancel(self, job_id, worker_id, reason):
+        """
+        Mark a job abandoned by its worker as cancelled; it is not retried.
+
+        Parameters:
+            job_id (ObjectId): ID of the job.
+            worker_id (str): Identifier of the worker holding the lease.
+            reason (str): Why the job was abandoned.
+
+        Returns:
+            bool: True if the job was still held by this worker.
+        """
+        update = self.jobs.update_one(
+            {"_id": ObjectId(job_id), "status": RUNNING, "worker_id": worker_id},
+            {"$set": {"status": CANCELLED, "error": reason, "lease_expires_at": None,
+                      "finished_at": self.clock()}},
+        )
+        return update.matched_count == 1
+
+    def expire_exhausted(self):
+        """
+        Mark running jobs with expired leases and no attempts left as failed.
+
+        Returns:
+            int: Number of jobs marked as failed.
+        """
+        result = self.jobs.update_many(
+            {"status": RUNNING, "lease_expires_at": {"$lt": self.clock()},
+             "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": FAILED, "error": "Lease expired too many times"}},
+        )
+        return result.modified_count
+
+    def queue_depth(self, priority=None):
+        """
+        Count the jobs waiting to be claimed.
+
+        Parameters:
+            priority (int): Only count jobs of this priority, or None for all.
+
+        Returns:
+            int: Number of queued jobs.
+        """
+        query = {"status": QUEUED}
+        if priority is not None:
+            query["priority"] = priority
+        return self.jobs.count_documents(query)
+
+    def find_job(self, job_id):
+        """
+        Retrieve a job document by its unique ID.
+
+        Parameters:
+            job_id (str): String representation of the job's ObjectId.
+
+        Returns:
+            dict: Job document if found, or None.
+        """
+        try:
+            return self.jobs.find_one({"_id": ObjectId(job_id)})
+        except Exception as e:
+            print(f"Error finding job: {e}")
+            return None
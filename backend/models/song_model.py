@@ -8,9 +8,11 @@ Classes:
 Dependencies:
     - bson.ObjectId: MongoDB ObjectId type for identifying records.
     - bson.json_util: Utility for converting MongoDB BSON to JSON.
+    - pymongo.ReplaceOne: Bulk upsert operations for batch ingestion.
 """
 
 from bson import ObjectId, json_util
+from pymongo import ReplaceOne
 
 class SongModel:
     """
@@ -43,6 +45,18 @@ class SongModel:
         print(f"Searching for song: {song_name}")
         return self.mongo.db.songs.find_one({"song": song_name})
 
+    def find_song_by_source(self, source_path):
+        """
+        Retrieve a batch-ingested song document by the catalog file it was ingested from.
+
+        Parameters:
+            source_path (str): Absolute path of the source file.
+
+        Returns:
+            dict: Song document if found, or None.
+        """
+        return self.mongo.db.songs.find_one({"source_path": source_path})
+
     def find_song(self, song_id):
         """
         Retrieve a song document by its unique ID.
@@ -66,6 +80,34 @@ class SongModel:
             print(f"Error finding song: {e}")
             return None
 
+    def find_song_document(self, song_id):
+        """
+        Retrieve a song document by its unique ID without converting it to JSON.
+
+        Parameters:
+            song_id (str): String representation of the MongoDB ObjectId for the song.
+
+        Returns:
+            dict: Song document if found, or None.
+        """
+        try:
+            return self.mongo.db.songs.find_one({'_id': ObjectId(song_id)})
+        except Exception as e:
+            print(f"Error finding song: {e}")
+            return None
+
+    def find_song_ids(self, query=None):
+        """
+        Retrieve the IDs of songs, e.g. for library-wide maintenance jobs.
+
+        Parameters:
+            query (dict): Optional filter; all songs by default.
+
+        Returns:
+            list: String IDs of the matching song documents.
+        """
+        return [str(song["_id"]) for song in self.mongo.db.songs.find(query or {}, {"_id": 1})]
+
     def insert_song(self, song_data):
         """
         Insert a new song document into the database.
@@ -78,6 +120,21 @@ class SongModel:
         """
         return self.mongo.db.songs.insert_one(song_data)
 
+    def bulk_upsert_songs(self, songs):
+        """
+        Insert or replace many song documents in a single round trip.
+
+        Parameters:
+            songs (list): Song documents, each with its '_id' set.
+
+        Returns:
+            BulkWriteResult: Result object of the bulk write, or None if there was nothing to write.
+        """
+        if not songs:
+            return None
+        operations = [ReplaceOne({"_id": song["_id"]}, song, upsert=True) for song in songs]
+        return self.mongo.db.songs.bulk_write(operations, ordered=False)
+
     def update_song(self, song_id, song_data):
         """
         Update an existing song document by its ID with new data.
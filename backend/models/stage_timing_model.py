@@ -0,0 +1,75 @@
+"""
+StageTimingModel module for keeping historical pipeline stage durations in MongoDB.
+
+Durations are stored as a moving average of seconds spent per second of audio, so an
+estimate for a new song is the stored rate multiplied by the song's length.
+
+Classes:
+    - StageTimingModel: Provides recording and lookup of per-stage processing rates.
+"""
+
+# Weight of the newest sample in the moving average
+SMOOTHING = 0.2
+
+
+class StageTimingModel:
+    """
+    Model class for interacting with the MongoDB 'stage_timings' collection.
+
+    Attributes:
+        mongo: MongoDB client instance for database operations.
+    """
+
+    def __init__(self, mongo):
+        """
+        Initialize the StageTimingModel with a MongoDB client.
+
+        Parameters:
+            mongo: MongoDB client instance for accessing the stage_timings collection.
+        """
+        self.mongo = mongo
+
+    def get_rates(self, stages):
+        """
+        Retrieve the stored processing rates of the given stages.
+
+        Parameters:
+            stages (list): Names of the stages.
+
+        Returns:
+            dict: Seconds of processing per second of audio, keyed by stage name.
+        """
+        try:
+            documents = self.mongo.db.stage_timings.find({"_id": {"$in": list(stages)}})
+            return {document["_id"]: document["rate"] for document in documents}
+        except Exception as e:
+            print(f"Error reading stage timings: {e}")
+            return {}
+
+    def record(self, stage, seconds, audio_seconds):
+        """
+        Fold a measured stage duration into the stored moving average.
+
+        Parameters:
+            stage (str): Name of the stage.
+            seconds (float): Measured duration of the stage.
+            audio_seconds (float): Length of the processed audio.
+
+        Returns:
+            None
+        """
+        if audio_seconds <= 0:
+            return
+        rate = seconds / audio_seconds
+        try:
+            collection = self.mongo.db.stage_timings
+            current = collection.find_one({"_id": stage})
+            if current:
+                rate = (1 - SMOOTHING) * current["rate"] + SMOOTHING * rate
+            collection.update_one(
+                {"_id": stage},
+                {"$set": {"rate": rate}, "$inc": {"samples": 1}},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Error recording stage timing: {e}")
@@ -0,0 +1,254 @@
+"""
+Priority scheduler with admission control for request handlers of the web process.
+
+Requests fall into three classes:
+- interactive: key and BPM changes, harmonies and lyrics a listener is waiting for;
+- ingest: uploads running the separation pipeline for minutes;
+- background: full-quality renders behind a preview and library maintenance (stem
+  format migration, high-quality re-separation), which nobody blocks on.
+
+Each class has its own concurrency limit, and all classes share a total limit. When a
+slot frees up, waiting interactive work is admitted before ingest, and ingest before
+background work, so a transpose never waits behind a queue of uploads. Each class also
+has a maximum number of waiting requests; beyond it (or after waiting too long for a
+slot) a request is refused with Saturated, which the routes turn into 429 with a
+Retry-After estimated from recent run times of the class.
+
+Running requests share the cores: thread_budget gives a request holding a slot its share,
+which it uses for multithreaded FFTs (see utils.fft_backend).
+
+Slot limits and cores are per node. Every web worker process has its own Scheduler, so
+under serve.py (which exports WEB_WORKERS) each one gets an equal part of the node's slots
+and cores, at least one slot per class.
+
+With JOB_QUEUE enabled the web process only enqueues: the class sets the job's priority
+and admission is based on the number of queued jobs of the class (see admit_queued).
+
+Classes:
+    - Saturated: Raised when a request is refused.
+    - Scheduler: Per-class slots with priority admission.
+
+Functions:
+    - job_class: Scheduling class of a task handler.
+    - per_worker: Share of a node-wide slot limit for one web worker.
+"""
+
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"
+INGEST = "ingest"
+BACKGROUND = "background"
+# Higher priorities are admitted (and claimed from the job queue) first
+PRIORITIES = {INTERACTIVE: 2, INGEST: 1, BACKGROUND: 0}
+
+CPU_COUNT = os.cpu_count() or 2
+# Web worker processes sharing this node's slots and cores (set by serve.py)
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", "1")))
+WORKER_CORES = max(1, CPU_COUNT // WEB_WORKERS)
+
+
+def per_worker(node_slots):
+    """
+    Share of a node-wide slot limit for one web worker process.
+
+    Parameters:
+        node_slots (int): Slots of the whole node.
+
+    Returns:
+        int: Slots of this process, at least 1.
+    """
+    return max(1, node_slots // WEB_WORKERS)
+
+
+DEFAULT_LIMITS = {
+    INTERACTIVE: per_worker(int(os.getenv("SCHED_INTERACTIVE_SLOTS", str(CPU_COUNT)))),
+    INGEST: per_worker(int(os.getenv("SCHED_INGEST_SLOTS", "1"))),
+    BACKGROUND: per_worker(int(os.getenv("SCHED_BACKGROUND_SLOTS", "1"))),
+}
+DEFAULT_TOTAL = per_worker(int(os.getenv("SCHED_TOTAL_SLOTS", str(CPU_COUNT))))
+DEFAULT_MAX_WAITING = {
+    INTERACTIVE: int(os.getenv("SCHED_INTERACTIVE_QUEUE", "16")),
+    INGEST: int(os.getenv("SCHED_INGEST_QUEUE", "4")),
+    BACKGROUND: int(os.getenv("SCHED_BACKGROUND_QUEUE", "8")),
+}
+# Longest time a request may wait for a slot before it is refused
+DEFAULT_MAX_WAIT = {
+    INTERACTIVE: float(os.getenv("SCHED_INTERACTIVE_WAIT_SECONDS", "30")),
+    INGEST: float(os.getenv("SCHED_INGEST_WAIT_SECONDS", "600")),
+    BACKGROUND: float(os.getenv("SCHED_BACKGROUND_WAIT_SECONDS", "600")),
+}
+# Run time assumed for a class before any of its requests finished
+DEFAULT_RUN_SECONDS = {INTERACTIVE: 5.0, INGEST: 180.0, BACKGROUND: 20.0}
+# Weight of the latest run time in the moving average
+EWMA_ALPHA = 0.2
+
+INGEST_TASKS = {"ingest"}
+BACKGROUND_TASKS = {"migrate_stems", "upgrade_separation"}
+
+
+def job_class(job_type, background=False):
+    """
+    Scheduling class of a task handler.
+
+    Parameters:
+        job_type (str): Task handler name.
+        background (bool): Whether the job renders behind a preview.
+
+    Returns:
+        str: INTERACTIVE, INGEST or BACKGROUND.
+    """
+    if background or job_type in BACKGROUND_TASKS:
+        return BACKGROUND
+    return INGEST if job_type in INGEST_TASKS else INTERACTIVE
+
+
+class Saturated(Exception):
+    """
+    Raised when a request is refused because its class is saturated.
+
+    Attributes:
+        job_class (str): Class of the refused request.
+        retry_after (int): Seconds after which the client should retry.
+    """
+
+    def __init__(self, job_class, retry_after):
+        super().__init__(f"Server busy with {job_class} work, retry in {retry_after} seconds")
+        self.job_class = job_class
+        self.retry_after = retry_after
+
+
+class Scheduler:
+    """
+    Admits work of priority classes into a bounded number of concurrent slots.
+
+    Attributes:
+        limits (dict): Concurrent slots per class.
+        total (int): Concurrent slots shared by all classes.
+        max_waiting (dict): Requests per class allowed to wait for a slot.
+        max_wait (dict): Seconds a request of a class may wait for a slot.
+        running (dict): Requests per class holding a slot.
+        waiting (dict): Requests per class waiting for a slot.
+        run_seconds (dict): Moving average of run times per class.
+    """
+
+    def __init__(self, limits=None, total=None, max_waiting=None, max_wait=None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.total = total or DEFAULT_TOTAL
+        self.max_waiting = {**DEFAULT_MAX_WAITING, **(max_waiting or {})}
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self.running = {name: 0 for name in PRIORITIES}
+        self.waiting = {name: 0 for name in PRIORITIES}
+        self.run_seconds = dict(DEFAULT_RUN_SECONDS)
+        self._condition = threading.Condition()
+
+    def _can_run(self, job_class):
+        if self.running[job_class] >= self.limits[job_class]:
+            return False
+        if sum(self.running.values()) >= self.total:
+            return False
+        # A free shared slot goes to the highest class that is waiting and has room
+        return not any(
+            self.waiting[other] and self.running[other] < self.limits[other]
+            for other, priority in PRIORITIES.items() if priority > PRIORITIES[job_class]
+        )
+
+    def retry_after(self, job_class, queued=None):
+        """
+        Estimate when a refused request of a class could be admitted.
+
+        Parameters:
+            job_class (str): Class of the request.
+            queued (int): Requests ahead of it, or None for those waiting in this process.
+
+        Returns:
+            int: Seconds, at least 1.
+        """
+        queued = self.waiting[job_class] if queued is None else queued
+        rounds = (queued + 1) / max(1, self.limits[job_class])
+        return max(1, int(math.ceil(rounds * self.run_seconds[job_class])))
+
+    @contextmanager
+    def slot(self, job_class):
+        """
+        Hold a slot of a class for the duration of the block.
+
+        Parameters:
+            job_class (str): INTERACTIVE, INGEST or BACKGROUND.
+
+        Raises:
+            Saturated: If too many requests of the class are already waiting, or no slot
+                       freed up within the class's maximum wait.
+        """
+        with self._condition:
+            if not self._can_run(job_class):
+                if self.waiting[job_class] >= self.max_waiting[job_class]:
+                    raise Saturated(job_class, self.retry_after(job_class))
+                self.waiting[job_class] += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self._can_run(job_class),
+                                                        self.max_wait[job_class])
+                finally:
+                    self.waiting[job_class] -= 1
+                if not admitted:
+                    # Lower classes may have been held back while this one waited
+                    self._condition.notify_all()
+                    raise Saturated(job_class, self.retry_after(job_class))
+            self.running[job_class] += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._condition:
+                self.running[job_class] -= 1
+                self.run_seconds[job_class] += EWMA_ALPHA * (elapsed - self.run_seconds[job_class])
+                self._condition.notify_all()
+
+    def thread_budget(self):
+        """
+        Threads a request holding a slot may use: this worker's share of the cores divided
+        among its running requests.
+
+        Returns:
+            int: At least 1.
+        """
+        with self._condition:
+            return max(1, WORKER_CORES // max(1, sum(self.running.values())))
+
+    def admit_queued(self, job_model, job_class):
+        """
+        Admission control for the job queue: refuse a class whose queued jobs reached its limit.
+
+        Parameters:
+            job_model (JobModel): Job queue of the workers.
+            job_class (str): Class of the job about to be enqueued.
+
+        Raises:
+            Saturated: If the queue already holds max_waiting jobs of the class.
+        """
+        queued = job_model.queue_depth(PRIORITIES[job_class])
+        if queued >= self.max_waiting[job_class]:
+            raise Saturated(job_class, self.retry_after(job_class, queued))
+
+    def stats(self):
+        """
+        Snapshot of running and waiting requests and average run time per class.
+
+        Returns:
+            dict: Per-class counters.
+        """
+        with self._condition:
+            return {
+                name: {
+                    "running": self.running[name],
+                    "waiting": self.waiting[name],
+                    "limit": self.limits[name],
+                    "run_seconds": round(self.run_seconds[name], 2),
+                }
+                for name in PRIORITIES
+            }
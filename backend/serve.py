@@ -0,0 +1,78 @@
+"""
+Production entry point for the Musicnalyzer API.
+
+Runs the Flask/Socket.IO application under gunicorn with several worker processes
+instead of the single-process Werkzeug development server started by `python app.py`.
+
+- Every web worker runs in threading mode (`--threads`), so slow clients and file
+  downloads do not block each other.
+- Socket.IO events are published through a shared message queue (SOCKETIO_MESSAGE_QUEUE,
+  e.g. redis://localhost:6379/0), so an event emitted by any worker, CPU pool process or
+  queue worker reaches clients connected to any other worker. Clients connect with the
+  websocket transport only, so no sticky sessions are needed between workers.
+- CPU-heavy handlers run in a per-worker process pool (CPU_POOL_WORKERS) or, with
+  JOB_QUEUE=true, in worker.py processes, keeping web threads free for I/O.
+
+Usage:
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python serve.py --workers 4
+
+Dependencies:
+    - gunicorn: Pre-fork WSGI server.
+"""
+
+import os
+import sys
+import argparse
+from gunicorn.app.base import BaseApplication
+
+
+class MusicnalyzerServer(BaseApplication):
+    """
+    Gunicorn application that loads the Flask app separately in every worker.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported per worker so each gets its own MongoDB client and CPU pool
+        from app import app
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Musicnalyzer API with gunicorn.")
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:5000"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 2)))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "32")))
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WEB_TIMEOUT", "600")),
+                        help="Seconds before a silent worker is restarted; renders can be long.")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 and not os.getenv("SOCKETIO_MESSAGE_QUEUE"):
+        print("SOCKETIO_MESSAGE_QUEUE must be set when running more than one worker, "
+              "otherwise progress events only reach clients of the emitting worker.")
+        return 1
+
+    os.environ.setdefault("FLASK_DEBUG", "false")
+    # Each worker's scheduler takes its share of the node's slots and cores
+    os.environ["WEB_WORKERS"] = str(args.workers)
+    MusicnalyzerServer({
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread",
+        "timeout": args.timeout,
+        "preload_app": False,
+        "accesslog": "-",
+    }).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Task handlers for jobs taken from the work queue.
+
+Each handler receives the SongController of the running process, the job payload
+stored by the Flask node that enqueued it, an optional Socket.IO emitter for progress and
+a CancelToken, and returns a JSON-serializable result that is saved on the job document.
+
+Functions:
+    - run_task: Dispatch a job to its handler by job type.
+
+Dependencies:
+    - SongController: Song pipeline and database operations.
+    - harmony.parse_voices: Restoring harmony voices from a stored payload.
+    - progress.ProgressReporter: Progress events for the room recorded in the payload.
+    - cancellation.cancel_scope: Per-job tokens with a deadline, cancellable by room.
+    - checkpoint.IngestCheckpoint: Stage checkpoints, so a retried ingest resumes.
+"""
+
+import os
+from controllers.song_controller import SongController
+from utils.harmony import parse_voices
+from utils.progress import ProgressReporter, INGEST_STAGES, notify_complete
+from utils.cancellation import cancel_scope
+from utils.checkpoint import IngestCheckpoint
+from utils.audio_processing import FAST_TIER, SEPARATION_UPGRADE
+from scheduler import PRIORITIES, BACKGROUND
+
+INGEST_DEADLINE_SECONDS = float(os.getenv("INGEST_DEADLINE_SECONDS", "3600"))
+RENDER_DEADLINE_SECONDS = float(os.getenv("RENDER_DEADLINE_SECONDS", "300"))
+
+
+def run_ingest(controller, payload, socketio=None, token=None):
+    """
+    Process an uploaded song that was saved by a Flask node and store its document.
+
+    Songs separated with the fast model get a high-quality re-separation job when the
+    controller has a job queue (queue workers); otherwise the web process schedules it.
+    A retried job resumes after the last stage its checkpoint records, on any worker.
+    The upload is fingerprinted here, off the web node; a near-duplicate ends the job
+    with the 409 result (or the reused song) of SongController.fingerprint_upload.
+
+    Parameters:
+        controller (SongController): Controller of the running process.
+        payload (dict): Arguments recorded by SongController.insert_song.
+        socketio: Optional Socket.IO emitter for progress events.
+        token (CancelToken): Optional token checked between pipeline stages.
+
+    Returns:
+        dict: Song ID, database message and separation tier, or the near-duplicate result.
+    """
+    voices = parse_voices(payload["voices"]) if payload.get("voices") else None
+    checkpoint = IngestCheckpoint(controller.checkpoint_model, payload["song_id"])
+    separation_tier = checkpoint.separation_tier or payload.get("separation_tier")
+    progress = ProgressReporter(socketio, payload.get("progress_room"), INGEST_STAGES,
+                                float(payload["duration"] or 0), controller.timing_model,
+                                stage_keys={"separate": f"separate:{separation_tier}"} if separation_tier else None)
+    progress.skip("save")
+    duplicate_result = controller.fingerprint_upload(
+        payload["song_id"], payload["file_path"], payload["original_filename"], payload["artist"],
+        payload.get("lyrics", ""), payload.get("existing", False), payload.get("duplicate"), checkpoint, progress
+    )
+    if duplicate_result is not None:
+        progress.finish()
+        return duplicate_result
+
+    song_data = SongController.process_song(
+        payload["song_id"], payload["file_path"], payload["original_filename"], payload["is_solo"],
+        payload["artist"], payload["duration"], payload.get("lyrics", ""), voices, payload.get("diatonic", False),
+        progress, token, separation_tier, checkpoint
+    )
+    with progress.stage("persist"):
+        message = controller.store_song(song_data, payload.get("existing", False))
+        checkpoint.finish()
+    progress.finish()
+    if song_data["separation_tier"] == FAST_TIER and SEPARATION_UPGRADE and controller.job_model is not None:
+        controller.job_model.enqueue("upgrade_separation", {"song_id": payload["song_id"]}, PRIORITIES[BACKGROUND])
+    return {"status": message, "song_id": payload["song_id"], "separation_tier": song_data["separation_tier"]}
+
+
+def run_change_key(controller, payload, socketio=None, token=None):
+    return controller.change_key(payload, token)
+
+
+def run_change_bpm(controller, payload, socketio=None, token=None):
+    return controller.change_bpm(payload, token)
+
+
+def run_harmonize(controller, payload, socketio=None, token=None):
+    return controller.harmonize(payload, token)
+
+
+def run_get_lyrics(controller, payload, socketio=None, token=None):
+    return controller.get_lyrics(payload.get("songId"), socketio, payload.get("jobId"), token)
+
+
+def run_migrate_stems(controller, payload, socketio=None, token=None):
+    return controller.migrate_stems(payload.get("songId"), token)
+
+
+def run_upgrade_separation(controller, payload, socketio=None, token=None):
+    return controller.upgrade_separation(payload["song_id"], token)
+
+
+TASKS = {
+    "ingest": run_ingest,
+    "change_key": run_change_key,
+    "change_bpm": run_change_bpm,
+    "harmonize": run_harmonize,
+    "get_lyrics": run_get_lyrics,
+    "migrate_stems": run_migrate_stems,
+    "upgrade_separation": run_upgrade_separation,
+}
+
+# Job types whose result is pushed to the client's room, e.g. full renders replacing a preview
+NOTIFY_TASKS = {"change_key", "change_bpm", "migrate_stems"}
+# Job types running under the ingest deadline instead of the render deadline
+LONG_TASKS = {"ingest", "migrate_stems", "upgrade_separation"}
+# Job types cancelled by a newer upload of their song ('song_id' in the payload)
+SONG_TASKS = {"upgrade_separation"}
+
+
+def run_task(controller, job_type, payload, socketio=None, token=None):
+    """
+    Run a job with the handler registered for its type.
+
+    Controller methods report handled errors as (body, status code) tuples; these are
+    folded into the result so they are stored instead of being retried. Results of render
+    and migration jobs are also emitted to the 'jobId' room of the payload, if any; when
+    such a job raises, an error result is emitted before the exception propagates, so
+    the waiting client does not wait forever.
+
+    Without a token, the job gets one registered under its room ('jobId' or
+    'progress_room') with the deadline of its job type, so a disconnect of its client
+    in this process cancels it. Jobs of SONG_TASKS are also registered under their
+    song's ingest key, so a re-upload of the song cancels them.
+
+    Parameters:
+        controller (SongController): Controller of the running process.
+        job_type (str): Type of the job.
+        payload (dict): Arguments for the handler.
+        socketio: Optional Socket.IO emitter for progress events.
+        token (CancelToken): Token of the job, or None to create one.
+
+    Returns:
+        dict: Result of the handler.
+
+    Raises:
+        Cancelled: If an ingest job was cancelled.
+    """
+    if job_type not in TASKS:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    if token is None:
+        deadline = INGEST_DEADLINE_SECONDS if job_type in LONG_TASKS else RENDER_DEADLINE_SECONDS
+        keys = [payload.get("jobId") or payload.get("progress_room")]
+        if job_type in SONG_TASKS:
+            keys.append(f"ingest:{payload['song_id']}")
+        with cancel_scope(keys, deadline) as token:
+            return run_task(controller, job_type, payload, socketio, token)
+
+    try:
+        result = TASKS[job_type](controller, payload, socketio, token)
+    except Exception as e:
+        if job_type in NOTIFY_TASKS:
+            notify_complete(socketio, payload.get("jobId"), job_type, {"error": str(e), "status_code": 500})
+        raise
+    if isinstance(result, tuple):
+        body, status_code = result
+        result = {**body, "status_code": status_code}
+    if job_type in NOTIFY_TASKS:
+        notify_complete(socketio, payload.get("jobId"), job_type, result)
+    return result
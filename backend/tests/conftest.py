@@ -0,0 +1,48 @@
+"""
+Shared fixtures for the backend tests.
+
+Tests run against an in-memory mongomock database by default; set MONGO_TEST_URI to run
+them against a real mongod instead (a throwaway database is created and dropped).
+"""
+
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mongo():
+    uri = os.getenv("MONGO_TEST_URI")
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+        name = f"musicnalyzer_test_{uuid.uuid4().hex[:8]}"
+        yield SimpleNamespace(db=client[name])
+        client.drop_database(name)
+        client.close()
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        yield SimpleNamespace(db=mongomock.MongoClient().db)
+
+
+class FakeClock:
+    """Settable clock for lease timestamps."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
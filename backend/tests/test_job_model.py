@@ -0,0 +1,153 @@
+import threading
+
+from models.job_model import JobModel, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+LEASE = 60
+
+
+def test_claim_hands_a_job_to_one_worker(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    job_id = jobs.enqueue("change_key", {"songId": "s1"})
+
+    job = jobs.claim("w1", LEASE)
+    assert str(job["_id"]) == job_id
+    assert job["status"] == RUNNING
+    assert job["worker_id"] == "w1"
+    assert job["attempts"] == 1
+    assert job["lease_expires_at"] == clock.now + LEASE
+    assert jobs.claim("w2", LEASE) is None
+
+
+def test_concurrent_claims_never_share_a_job(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    job_ids = {jobs.enqueue("change_key", {"n": n}) for n in range(20)}
+    claimed = []
+    lock = threading.Lock()
+
+    def claim_all(worker_id):
+        while True:
+            job = jobs.claim(worker_id, LEASE)
+            if job is None:
+                return
+            with lock:
+                claimed.append(str(job["_id"]))
+
+    workers = [threading.Thread(target=claim_all, args=(f"w{n}",)) for n in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+    assert all(job["attempts"] == 1 for job in mongo.db.jobs.find())
+
+
+def test_claim_order_and_job_types(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    low = jobs.enqueue("ingest", {}, priority=0)
+    clock.advance(1)
+    high = jobs.enqueue("change_key", {}, priority=2)
+
+    assert jobs.claim("w1", LEASE, ["ingest"])["_id"] == mongo.db.jobs.find_one({"type": "ingest"})["_id"]
+    assert str(jobs.claim("w2", LEASE)["_id"]) == high
+    assert jobs.claim("w3", LEASE) is None
+    assert jobs.find_job(low)["worker_id"] == "w1"
+
+
+def test_heartbeat_renews_the_lease_of_its_holder_only(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    job_id = jobs.enqueue("ingest", {})
+    job = jobs.claim("w1", LEASE)
+
+    clock.advance(LEASE - 1)
+    assert jobs.heartbeat(job["_id"], "w1", LEASE)
+    assert jobs.find_job(job_id)["lease_expires_at"] == clock.now + LEASE
+    assert not jobs.heartbeat(job["_id"], "w2", LEASE)
+
+    # The renewed lease keeps the job from being reclaimed
+    clock.advance(LEASE - 1)
+    assert jobs.claim("w2", LEASE) is None
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    job_id = jobs.enqueue("ingest", {})
+    job = jobs.claim("w1", LEASE)
+
+    clock.advance(LEASE + 1)
+    reclaimed = jobs.claim("w2", LEASE)
+    assert reclaimed["_id"] == job["_id"]
+    assert reclaimed["worker_id"] == "w2"
+    assert reclaimed["attempts"] == 2
+
+    # The stalled worker lost the job: its heartbeat, result and failure are ignored
+    assert not jobs.heartbeat(job["_id"], "w1", LEASE)
+    assert not jobs.complete(job["_id"], "w1", {"stale": True})
+    assert not jobs.fail(job["_id"], "w1", "stale")
+    assert jobs.complete(job["_id"], "w2", {"ok": True})
+    done = jobs.find_job(job_id)
+    assert done["status"] == DONE
+    assert done["result"] == {"ok": True}
+
+
+def test_failures_requeue_until_max_attempts(mongo, clock):
+    jobs = JobModel(mongo, clock=clock, max_attempts=2)
+    job_id = jobs.enqueue("ingest", {})
+
+    job = jobs.claim("w1", LEASE)
+    assert jobs.fail(job["_id"], "w1", "boom")
+    assert jobs.find_job(job_id)["status"] == QUEUED
+
+    job = jobs.claim("w2", LEASE)
+    assert job["attempts"] == 2
+    assert jobs.fail(job["_id"], "w2", "boom again")
+    failed = jobs.find_job(job_id)
+    assert failed["status"] == FAILED
+    assert failed["error"] == "boom again"
+    assert jobs.claim("w3", LEASE) is None
+
+
+def test_expired_leases_are_failed_after_max_attempts(mongo, clock):
+    jobs = JobModel(mongo, clock=clock, max_attempts=2)
+    job_id = jobs.enqueue("ingest", {})
+
+    jobs.claim("w1", LEASE)
+    clock.advance(LEASE + 1)
+    jobs.claim("w2", LEASE)
+    clock.advance(LEASE + 1)
+
+    assert jobs.claim("w3", LEASE) is None
+    assert jobs.expire_exhausted() == 1
+    assert jobs.find_job(job_id)["status"] == FAILED
+
+
+def test_request_cancel_of_queued_and_running_jobs(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    running_id = jobs.enqueue("change_key", {"jobId": "room1"})
+    job = jobs.claim("w1", LEASE)
+    queued_id = jobs.enqueue("change_bpm", {"progress_room": "room1"})
+    other_id = jobs.enqueue("change_bpm", {"jobId": "room2"})
+
+    assert jobs.request_cancel(room="room1", reason="client disconnected") == 2
+
+    queued = jobs.find_job(queued_id)
+    assert queued["status"] == CANCELLED
+    assert queued["error"] == "client disconnected"
+    # The running job keeps its lease; its worker learns about the cancellation
+    assert jobs.find_job(running_id)["status"] == RUNNING
+    assert jobs.cancel_reason(job["_id"]) == "client disconnected"
+    assert jobs.cancel(job["_id"], "w1", "client disconnected")
+    assert jobs.find_job(running_id)["status"] == CANCELLED
+
+    assert str(jobs.claim("w2", LEASE)["_id"]) == other_id
+    assert jobs.claim("w3", LEASE) is None
+
+
+def test_request_cancel_by_song(mongo, clock):
+    jobs = JobModel(mongo, clock=clock)
+    job_id = jobs.enqueue("upgrade_separation", {"song_id": "s1"})
+
+    assert jobs.request_cancel(song_id="s2") == 0
+    assert jobs.request_cancel() == 0
+    assert jobs.request_cancel(song_id="s1", reason="superseded") == 1
+    assert jobs.find_job(job_id)["status"] == CANCELLED
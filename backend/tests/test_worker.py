@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask_socketio")
+
+import tasks
+import worker
+from models.job_model import JobModel, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from utils.cancellation import CancelToken
+
+# Short enough for the heartbeat thread (a beat every third of the lease) to run in tests
+LEASE = 0.3
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    def register(job_type, handler):
+        monkeypatch.setitem(tasks.TASKS, job_type, handler)
+    return register
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_process_next_runs_and_completes_a_job(mongo, handlers):
+    jobs = JobModel(mongo)
+    handlers("echo", lambda controller, payload, socketio, token: {"echo": payload["value"]})
+    job_id = jobs.enqueue("echo", {"value": 42})
+
+    assert worker.process_next(jobs, None, "w1", LEASE)
+    job = jobs.find_job(job_id)
+    assert job["status"] == DONE
+    assert job["result"] == {"echo": 42}
+    assert not worker.process_next(jobs, None, "w1", LEASE)
+
+
+def test_failing_job_is_retried_until_max_attempts(mongo, handlers):
+    jobs = JobModel(mongo, max_attempts=2)
+    calls = []
+
+    def explode(controller, payload, socketio, token):
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    handlers("explode", explode)
+    job_id = jobs.enqueue("explode", {})
+
+    assert worker.process_next(jobs, None, "w1", LEASE)
+    assert jobs.find_job(job_id)["status"] == QUEUED
+    assert worker.process_next(jobs, None, "w2", LEASE)
+    job = jobs.find_job(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "boom"
+    assert not worker.process_next(jobs, None, "w3", LEASE)
+    assert len(calls) == 2
+
+
+def test_heartbeat_keeps_a_long_job_leased(mongo, handlers):
+    jobs = JobModel(mongo)
+    reclaimed = []
+
+    def slow(controller, payload, socketio, token):
+        # Runs for several lease lengths; the heartbeat must keep other workers away
+        for _ in range(4):
+            time.sleep(LEASE)
+            reclaimed.append(jobs.claim("w2", LEASE))
+        return {"ok": True}
+
+    handlers("slow", slow)
+    job_id = jobs.enqueue("slow", {})
+
+    assert worker.process_next(jobs, None, "w1", LEASE)
+    assert reclaimed == [None] * 4
+    job = jobs.find_job(job_id)
+    assert job["status"] == DONE
+    assert job["attempts"] == 1
+
+
+def test_heartbeat_cancels_the_token_when_the_lease_is_lost(mongo):
+    clock_now = [1000.0]
+    jobs = JobModel(mongo, clock=lambda: clock_now[0])
+    jobs.enqueue("ingest", {})
+    job = jobs.claim("w1", LEASE)
+
+    # Another worker takes over after the lease expired (e.g. w1 stalled)
+    clock_now[0] += LEASE + 1
+    assert jobs.claim("w2", LEASE)["worker_id"] == "w2"
+
+    heartbeat = worker.Heartbeat(jobs, job["_id"], "w1", LEASE, CancelToken())
+    heartbeat.start()
+    try:
+        assert wait_for(heartbeat.lost.is_set)
+        assert heartbeat.token.cancelled
+        assert heartbeat.token.reason == "lease lost"
+    finally:
+        heartbeat.stop()
+    assert jobs.find_job(job["_id"])["worker_id"] == "w2"
+
+
+def test_request_cancel_stops_a_running_job(mongo, handlers):
+    jobs = JobModel(mongo)
+    started = threading.Event()
+
+    def wait_for_cancel(controller, payload, socketio, token):
+        started.set()
+        assert wait_for(lambda: token.cancelled)
+        token.check()
+
+    handlers("wait_for_cancel", wait_for_cancel)
+    job_id = jobs.enqueue("wait_for_cancel", {"jobId": "room1"})
+
+    runner = threading.Thread(target=worker.process_next, args=(jobs, None, "w1", LEASE))
+    runner.start()
+    assert started.wait(5)
+    assert jobs.find_job(job_id)["status"] == RUNNING
+    assert jobs.request_cancel(room="room1", reason="client disconnected") == 1
+    runner.join(5)
+
+    job = jobs.find_job(job_id)
+    assert job["status"] == CANCELLED
+    assert job["error"] == "client disconnected"
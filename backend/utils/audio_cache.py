@@ -0,0 +1,167 @@
+"""
+Decoded-audio store for keeping stems and variants as memory-mapped sidecar arrays.
+
+Decoding and resampling a WAV through librosa is repeated by every analysis and render
+step. This module decodes a source file once, stores the resulting samples in a `.npy`
+sidecar next to it and serves later loads as zero-copy `np.memmap` views, so repeat loads
+become page-cache reads instead of full decodes.
+
+Sidecars live in a hidden `.decoded` directory inside the source file's folder and are
+invalidated automatically whenever the source file's size or modification time changes.
+
+Loads for analysis only (key, tempo, features, fingerprints) use ANALYSIS_DTYPE, which
+can be float16 to halve their sidecars; renders keep DECODE_DTYPE.
+
+Dependencies:
+    - os: File and directory path operations.
+    - json: Reading and writing sidecar metadata.
+    - numpy: Memory-mapped array storage.
+    - librosa: Audio decoding and resampling on a cache miss, imported on first use.
+
+Functions:
+    - load_decoded: Return a memory-mapped view of the decoded audio for a source file.
+    - invalidate_decoded: Remove the sidecar for a source file.
+"""
+
+import os
+import json
+import numpy as np
+import lazy_loader as lazy
+
+librosa = lazy.load("librosa")
+
+SIDECAR_DIR = ".decoded"
+DEFAULT_SAMPLE_RATE = 22050
+DECODE_DTYPE = np.dtype(os.getenv("DECODE_DTYPE", "float32"))
+ANALYSIS_DTYPE = np.dtype(os.getenv("ANALYSIS_DTYPE", DECODE_DTYPE.name))
+
+
+def _sidecar_paths(source_path, sample_rate, dtype):
+    """
+    Build the sidecar array and metadata paths for a source file.
+
+    Parameters:
+        source_path (str): Path to the source audio file.
+        sample_rate (int): Sample rate of the decoded audio.
+        dtype (numpy.dtype): Sample type of the decoded audio.
+
+    Returns:
+        tuple: Paths to the `.npy` array and its `.json` metadata.
+    """
+    folder, filename = os.path.split(source_path)
+    base = os.path.join(folder, SIDECAR_DIR, f"{filename}.{sample_rate}.{dtype.name}")
+    return f"{base}.npy", f"{base}.json"
+
+
+def _source_signature(source_path):
+    """
+    Describe the current state of a source file for sidecar invalidation.
+
+    Parameters:
+        source_path (str): Path to the source audio file.
+
+    Returns:
+        dict: Size and nanosecond modification time of the file.
+    """
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_metadata(meta_path):
+    """
+    Read sidecar metadata, tolerating missing or partially written files.
+
+    Parameters:
+        meta_path (str): Path to the sidecar metadata file.
+
+    Returns:
+        dict: Stored metadata, or None if unavailable.
+    """
+    try:
+        with open(meta_path, "r") as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_sidecar(source_path, array_path, meta_path, sample_rate, dtype):
+    """
+    Decode a source file and write its sidecar array and metadata atomically.
+
+    Parameters:
+        source_path (str): Path to the source audio file.
+        array_path (str): Destination path of the `.npy` array.
+        meta_path (str): Destination path of the `.json` metadata.
+        sample_rate (int): Sample rate to decode to.
+        dtype (numpy.dtype): Sample type to store.
+    """
+    signature = _source_signature(source_path)
+    audio, _ = librosa.load(source_path, sr=sample_rate)
+
+    os.makedirs(os.path.dirname(array_path), exist_ok=True)
+    tmp_array_path = f"{array_path}.{os.getpid()}.tmp"
+    tmp_meta_path = f"{meta_path}.{os.getpid()}.tmp"
+
+    stored = np.lib.format.open_memmap(tmp_array_path, mode="w+", dtype=dtype, shape=audio.shape)
+    stored[:] = audio
+    stored.flush()
+    del stored
+
+    with open(tmp_meta_path, "w") as meta_file:
+        json.dump({**signature, "sample_rate": sample_rate, "dtype": dtype.name}, meta_file)
+
+    # Array first, then metadata: a reader only trusts the array once the metadata matches
+    os.replace(tmp_array_path, array_path)
+    os.replace(tmp_meta_path, meta_path)
+
+
+def load_decoded(source_path, sample_rate=DEFAULT_SAMPLE_RATE, dtype=DECODE_DTYPE):
+    """
+    Load decoded audio for a source file, decoding it only when no valid sidecar exists.
+
+    Parameters:
+        source_path (str): Path to the source audio file.
+        sample_rate (int): Sample rate to decode to.
+        dtype (numpy.dtype): Sample type of the stored array (float32 or float16).
+
+    Returns:
+        tuple: Read-only memory-mapped audio array (ndarray) and sample rate (int).
+    """
+    dtype = np.dtype(dtype)
+    array_path, meta_path = _sidecar_paths(source_path, sample_rate, dtype)
+
+    metadata = _read_metadata(meta_path)
+    signature = _source_signature(source_path)
+    if (
+        metadata is None
+        or metadata.get("size") != signature["size"]
+        or metadata.get("mtime_ns") != signature["mtime_ns"]
+        or not os.path.exists(array_path)
+    ):
+        _write_sidecar(source_path, array_path, meta_path, sample_rate, dtype)
+
+    audio = np.load(array_path, mmap_mode="r")
+    return audio, sample_rate
+
+
+def invalidate_decoded(source_path):
+    """
+    Remove every sidecar stored for a source file.
+
+    Parameters:
+        source_path (str): Path to the source audio file.
+
+    Returns:
+        None
+    """
+    folder, filename = os.path.split(source_path)
+    sidecar_folder = os.path.join(folder, SIDECAR_DIR)
+    if not os.path.isdir(sidecar_folder):
+        return
+
+    for sidecar in os.listdir(sidecar_folder):
+        if sidecar.startswith(f"{filename}."):
+            try:
+                os.remove(os.path.join(sidecar_folder, sidecar))
+            except OSError as e:
+                print(f"Error deleting sidecar {sidecar}: {e}")
@@ -3,85 +3,313 @@ Audio processing module for analyzing songs, separating stems, and generating vo
 
 This module provides functionality to:
 - Load and analyze audio files for musical attributes like key and BPM.
-- Separate audio into vocal and instrumental stems.
+- Separate audio into vocal and instrumental stems, chunk by chunk for long songs.
 - Generate additional vocal parts (e.g., Alto, Tenor) based on an existing part.
 - Process and rename audio files based on analysis results.
 
 Dependencies:
     - os: Interacting with the file system.
+    - shutil: Removing the working directory of chunked separation.
     - re: Regular expression operations for file name cleaning.
-    - librosa: Audio analysis and manipulation.
-    - soundfile (sf): Audio file I/O.
-    - audio_separator.Separator: External module for stem separation.
+    - numpy: Crossfading chunk boundaries of chunked separation.
+    - soundfile (sf): Chunked reading and writing of audio files.
+    - audio_separator.Separator: External module for stem separation, imported when a song is
+      separated so processes that never separate do not load torch and onnxruntime.
+    - audio_cache.load_decoded: Memory-mapped decoded-audio store used by load_song.
+    - stem_format: Container of the separated stems (STEM_FORMAT).
+    - storage.get_storage: Fetching sources from and publishing results to the storage backend.
     - file_operations.move_stem_files: Helper function to move separated files.
-    - key_bpm_utils.get_key, get_bpm: Helper functions for key and BPM calculation.
+    - harmony.harmonize, voice_path_for: Harmony engine used to generate additional vocal parts,
+      and the paths of voices left virtual.
+    - beat_analysis: BPM estimation and persistence of beat activations and beat grid.
+    - key_bpm_utils.get_key: Helper function for key calculation.
+    - feature_engine.extract_features: Spectral features from a single STFT, whose harmonic
+      part also feeds key detection.
     - path_utils.update_key_in_path, update_bpm_in_path: Helpers for updating file paths based on key and BPM.
+    - cancellation.CancelToken: Checked between stages and separation chunks.
+    - shared_audio: Key detection in the audio process pool on the decoded song, passed
+      through shared memory.
+    - checkpoint.NullCheckpoint: Default when the caller keeps no stage checkpoints.
 """
 
 import os
 import re
-import librosa
+import shutil
+import numpy as np
 import soundfile as sf
-from audio_separator.separator import Separator
+from .audio_cache import load_decoded, invalidate_decoded, ANALYSIS_DTYPE, DECODE_DTYPE
+from .stem_format import open_writer, STEM_EXTENSION, SEPARATOR_FORMAT
 from .file_operations import move_stem_files  # Import only needed functions
-from .key_bpm_utils import get_key, get_bpm
+from .harmony import harmonize, voice_path_for, DEFAULT_VOICES
+from .beat_analysis import analyze_tempo, beat_analysis_path, save_beat_analysis
+from .key_bpm_utils import get_key
+from .feature_engine import extract_features
 from .path_utils import update_key_in_path, update_bpm_in_path  # Use path helpers for consistency
+from .progress import NullProgress
+from .checkpoint import NullCheckpoint
+from .cancellation import CancelToken
+from .storage import get_storage
+from .shared_audio import SharedAudio, TransferReport, audio_pool, submit_shared
+
+# Songs longer than 1.5 chunks are separated chunk by chunk. Opt-in (0 disables chunking):
+# the model sees each chunk without the rest of the song, so chunked stems differ from
+# whole-song stems around every boundary
+SEPARATION_CHUNK_SECONDS = float(os.getenv("SEPARATION_CHUNK_SECONDS", "0"))
+SEPARATION_OVERLAP_SECONDS = 1.0
+# Working directory of chunked separation, next to the separated file
+SEPARATION_DIR = ".separation"
+# Separation quality tiers: a fast model for usable stems right away, and a high-quality
+# model, also used to re-separate fast songs in the background
+FAST_TIER = "fast"
+HQ_TIER = "hq"
+SEPARATION_MODELS = {
+    FAST_TIER: os.getenv("SEPARATION_FAST_MODEL", "UVR-MDX-NET-Inst_HQ_3.onnx"),
+    HQ_TIER: os.getenv("SEPARATION_HQ_MODEL", "model_bs_roformer_ep_317_sdr_12.9755.ckpt"),
+}
+# 'fast', 'hq', or 'auto' to pick the fast tier while uploads are waiting
+SEPARATION_TIER = os.getenv("SEPARATION_TIER", "auto").lower()
+# Waiting uploads from which the auto tier separates with the fast model
+SEPARATION_FAST_BACKLOG = int(os.getenv("SEPARATION_FAST_BACKLOG", "1"))
+# Whether songs separated with the fast model are re-separated in the background
+SEPARATION_UPGRADE = os.getenv("SEPARATION_UPGRADE", "true").lower() == "true"
+# Harmony voices of solo songs are only recorded at upload and rendered on first request
+LAZY_HARMONY = os.getenv("LAZY_HARMONY", "true").lower() == "true"
+
+def choose_separation_tier(requested=None, backlog=0):
+    """
+    Choose the separation tier of an upload.
+
+    Parameters:
+        requested (str): Tier asked for by the client ('fast' or 'hq'), or None.
+        backlog (int): Uploads waiting for separation ahead of this one.
+
+    Returns:
+        str: FAST_TIER or HQ_TIER.
 
-def load_song(source_audio):
+    Raises:
+        ValueError: If the requested tier is unknown.
+    """
+    tier = (requested or SEPARATION_TIER).lower()
+    if tier == "auto":
+        return FAST_TIER if backlog >= SEPARATION_FAST_BACKLOG else HQ_TIER
+    if tier not in SEPARATION_MODELS:
+        raise ValueError(f"Unknown separation tier: {tier}")
+    return tier
+
+def load_song(source_audio, dtype=DECODE_DTYPE):
     """
     Load an audio file, decoding any encoded characters in the file path.
 
+    The file is fetched from the storage backend if this node has no up-to-date local
+    copy. The decoded samples are kept in a memory-mapped sidecar, so only the first
+    load of an unchanged file pays for decoding and resampling.
+
     Parameters:
         source_audio (str): Path to the audio file.
+        dtype (numpy.dtype): Sample type of the decoded audio; analysis-only loads pass
+            ANALYSIS_DTYPE.
 
     Returns:
-        tuple: Tuple containing the loaded audio signal (ndarray) and sample rate (int).
+        tuple: Tuple containing the loaded audio signal (read-only ndarray view) and sample rate (int).
     """
     if "%23" in source_audio:
         source_audio = source_audio.replace("%23", "#")  # Replace encoded hash with actual hash symbol
-    audio, sample_rate = librosa.load(source_audio)
+    get_storage().ensure_local(source_audio)
+    audio, sample_rate = load_decoded(source_audio, dtype=dtype)
     return audio, sample_rate
 
-def analyze_song(audio, sample_rate, filename):
+def _features_and_key(audio, sample_rate):
+    features, audio_harmonic = extract_features(audio, sample_rate)
+    return features, get_key(audio, sample_rate, audio_harmonic)
+
+
+def _features_and_key_shared(handle, sample_rate):
+    # Runs in an audio pool process on the decoded song of the caller
+    shared = SharedAudio.attach(handle)
+    try:
+        return _features_and_key(shared.array, sample_rate)
+    finally:
+        shared.release()
+
+
+def analyze_song(audio, sample_rate, filename, shared=None, report=None):
     """
-    Analyze an audio file to determine its musical key and tempo (BPM).
+    Analyze an audio file to determine its musical key, tempo (BPM), beat grid and
+    spectral features.
+
+    The feature engine's STFT and harmonic/percussive split are reused for key detection,
+    so the song is transformed once for both. With a shared copy of the audio, features
+    and key are computed in the audio process pool while the tempo is estimated here.
 
     Parameters:
         audio (ndarray): The audio signal data.
         sample_rate (int): The sample rate of the audio file.
         filename (str): The name of the audio file (used to help get BPM).
+        shared (SharedAudio): Optional shared-memory copy of the audio.
+        report (TransferReport): Optional report counting the arrays passed by handle.
 
     Returns:
-        tuple: A tuple containing the detected key (str) and BPM (float).
+        tuple: A tuple containing the detected key (str), BPM (int), the beat
+               analysis (dict) with activations, beats, downbeats and tempo candidates,
+               and the feature summaries (dict).
+    """
+    if shared is None:
+        features, key = _features_and_key(audio, sample_rate)
+        beats = analyze_tempo(filename)
+        return key, beats["bpm"], beats, features
+
+    future = submit_shared(_features_and_key_shared, [shared], sample_rate, report=report)
+    try:
+        # madmom decodes the file itself, so the tempo needs no transfer
+        beats = analyze_tempo(filename)
+    except BaseException:
+        future.cancel()
+        raise
+    features, key = future.result()
+    return key, beats["bpm"], beats, features
+
+def _resolve_output(path, output_dir):
     """
-    key = get_key(audio, sample_rate)
-    bpm = get_bpm(filename)
-    return key, bpm
+    Resolve a file name returned by the separator to a path.
+
+    Parameters:
+        path (str): Path or file name returned by Separator.separate.
+        output_dir (str): Output directory of the separator, or None for the working directory.
 
-def separate_and_rename_stems(audio_file):
+    Returns:
+        str: Usable path to the file.
+    """
+    if output_dir and not os.path.isabs(path) and not os.path.exists(path):
+        return os.path.join(output_dir, path)
+    return path
+
+def separate_in_chunks(separator, audio_file, output_dir, progress, token=None):
+    """
+    Separate a long audio file chunk by chunk, crossfading the chunk boundaries.
+
+    Separating in chunks reports real sub-progress for the stage and keeps memory bounded
+    by the chunk length instead of the song length.
+
+    Parameters:
+        separator (Separator): Separator with a loaded model, writing to output_dir.
+        audio_file (str): Path to the audio file to be separated.
+        output_dir (str): Working directory for chunks and stitched stems.
+        progress (ProgressReporter): Reporter receiving the fraction of chunks done.
+        token (CancelToken): Checked before every chunk; a cancelled separation removes
+            its partial outputs.
+
+    Returns:
+        list: Paths to the stitched Instrumental and Vocals stems, named like the separator's output.
+    """
+    info = sf.info(audio_file)
+    in_rate, total = info.samplerate, info.frames
+    chunk = int(SEPARATION_CHUNK_SECONDS * in_rate)
+    overlap = int(SEPARATION_OVERLAP_SECONDS * in_rate)
+    starts = list(range(0, total, chunk))
+    base = os.path.splitext(os.path.basename(audio_file))[0]
+
+    token = token or CancelToken()
+    outputs, tails = {}, {}
+    completed = False
+    try:
+        for index, start in enumerate(starts):
+            token.check()
+            begin, end = max(0, start - overlap), min(total, start + chunk + overlap)
+            data, _ = sf.read(audio_file, start=begin, stop=end, always_2d=True)
+            chunk_path = os.path.join(output_dir, f"{base}_chunk{index}.wav")
+            sf.write(chunk_path, data, in_rate)
+
+            for path in separator.separate(chunk_path):
+                path = _resolve_output(path, output_dir)
+                label = "Vocals" if "(Vocals)" in os.path.basename(path) else "Instrumental"
+                stem, out_rate = sf.read(path, always_2d=True)
+                os.remove(path)
+
+                if label not in outputs:
+                    stitched_path = os.path.join(output_dir, f"{base}_({label}){STEM_EXTENSION}")
+                    outputs[label] = open_writer(stitched_path, out_rate, stem.shape[1])
+
+                tail = tails.pop(label, None)
+                if tail is not None:
+                    n = min(len(tail), len(stem))
+                    fade = np.linspace(0.0, 1.0, n)[:, None]
+                    stem[:n] = tail[:n] * (1 - fade) + stem[:n] * fade
+
+                if index < len(starts) - 1:
+                    # Hold back the region shared with the next chunk for the crossfade
+                    tail_length = int(round((end - (starts[index + 1] - overlap)) * out_rate / in_rate))
+                    if tail_length > 0:
+                        tails[label], stem = stem[-tail_length:], stem[:-tail_length]
+                outputs[label].write(stem)
+
+            os.remove(chunk_path)
+            progress.update((index + 1) / len(starts))
+        completed = True
+    finally:
+        for output in outputs.values():
+            output.close()
+        if not completed:
+            leftovers = [output.name for output in outputs.values()]
+            leftovers += [os.path.join(output_dir, name) for name in os.listdir(output_dir) if name.startswith(f"{base}_chunk")]
+            for path in leftovers:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return [outputs["Instrumental"].name, outputs["Vocals"].name]
+
+def separate_and_rename_stems(audio_file, progress=None, token=None, tier=HQ_TIER, output_dir=None):
     """
     Separate an audio file into vocal and instrumental stems, renaming them appropriately.
 
-    Uses a pre-trained model to separate the file and then renames the stems
-    (e.g., Vocals to Soprano) for standardized use.
+    Uses the pre-trained model of the given tier to separate the file and then renames
+    the stems (e.g., Vocals to Soprano) for standardized use; the names do not depend on
+    the model. When SEPARATION_CHUNK_SECONDS is set, longer songs are separated in chunks
+    so progress can be reported; the caller removes the SEPARATION_DIR working directory
+    once it has moved the stems.
 
     Parameters:
         audio_file (str): Path to the audio file to be separated.
+        progress (ProgressReporter): Optional reporter for sub-progress of the separation.
+        token (CancelToken): Optional token checked before loading the model and between chunks.
+        tier (str): FAST_TIER or HQ_TIER, selecting the model of SEPARATION_MODELS.
+        output_dir (str): Directory for the stems; by default the separator's working
+            directory, or SEPARATION_DIR next to the audio file for chunked separation.
 
     Returns:
         list: List of paths to the renamed separated stem files.
     """
-    separator = Separator()
-    separator.load_model()
-
-    output_files = separator.separate(audio_file)
+    from audio_separator.separator import Separator
+
+    progress = progress or NullProgress()
+    token = token or CancelToken()
+    chunked = 0 < SEPARATION_CHUNK_SECONDS * 1.5 < sf.info(audio_file).duration
+
+    if chunked and not output_dir:
+        output_dir = os.path.join(os.path.dirname(audio_file), SEPARATION_DIR)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    separator_options = {"output_format": SEPARATOR_FORMAT}
+    if output_dir:
+        separator_options["output_dir"] = output_dir
+    separator = Separator(**separator_options)
+    model_filename = SEPARATION_MODELS[tier]
+    separator.load_model(model_filename=model_filename)
+    token.check()
+
+    if chunked:
+        output_files = separate_in_chunks(separator, audio_file, output_dir, progress, token)
+    else:
+        output_files = [_resolve_output(path, output_dir) for path in separator.separate(audio_file)]
     renamed_files = []
 
     for file_path in output_files:
         dir_name, file_name = os.path.split(file_path)
         name, ext = os.path.splitext(file_name)
 
-        cleaned_name = re.sub(r"_model_.*", "", name)  # Remove model name
+        # Remove the model name
+        cleaned_name = name.replace(f"_{os.path.splitext(model_filename)[0]}", "")
+        cleaned_name = re.sub(r"_model_.*", "", cleaned_name)
         cleaned_name = re.sub(r"\((Instrumental|Vocals)\)", r"\1", cleaned_name)
         
         if "Vocals" in cleaned_name:
@@ -93,59 +321,137 @@ def separate_and_rename_stems(audio_file):
     
     return renamed_files
 
-def generate_vocal_parts(soprano_path):
+def generate_vocal_parts(soprano_path, key=None, voices=None, diatonic=False, token=None):
     """
-    Generate additional vocal parts (Alto and Tenor) based on the Soprano audio file.
+    Generate additional vocal parts (by default Alto and Tenor) based on the Soprano audio file.
 
-    Uses pitch shifting to create harmonized parts, shifting the Soprano down by
-    specified intervals to produce the Alto and Tenor parts.
+    Delegates to the harmony engine, which analyzes the Soprano once and renders every
+    voice in parallel, optionally snapping the voices to the song's key.
 
     Parameters:
         soprano_path (str): Path to the Soprano audio file.
+        key (str): Detected musical key of the song, used for diatonic voices.
+        voices (list): List of (name, interval) tuples. Defaults to Alto (+4) and Tenor (-5).
+        diatonic (bool): Whether to keep the voices within the scale of the key.
+        token (CancelToken): Optional token checked between voices.
 
     Returns:
-        tuple: Paths to the generated Alto and Tenor audio files.
+        dict: Paths to the generated audio files keyed by voice name.
     """
-    soprano_audio, sample_rate = load_song(soprano_path)
-
-    alto_path = soprano_path.replace("Soprano", "Alto")
-    tenor_path = soprano_path.replace("Soprano", "Tenor")
+    return harmonize(soprano_path, voices=voices, key=key, diatonic=diatonic, token=token)
 
-    alto_audio = librosa.effects.pitch_shift(soprano_audio, sr=sample_rate, n_steps=4)
-    tenor_audio = librosa.effects.pitch_shift(soprano_audio, sr=sample_rate, n_steps=-5)
-
-    sf.write(alto_path, alto_audio, sample_rate)
-    sf.write(tenor_path, tenor_audio, sample_rate)
-
-    return alto_path, tenor_path
-
-def analyze_and_process_audio(file_path, base_name, folder, is_solo):
+def analyze_and_process_audio(file_path, base_name, folder, is_solo, voices=None, diatonic=False, progress=None,
+                              token=None, lazy_harmony=LAZY_HARMONY, separation_tier=HQ_TIER, checkpoint=None):
     """
     Analyze and process an audio file by determining its key and BPM, extracting stems,
     and optionally generating additional vocal parts if the song is a solo.
 
+    With lazy_harmony, the vocal parts are not rendered: their paths are returned so the
+    song document can record them as virtual parts, rendered on first request.
+
+    Every stage is recorded in the checkpoint when it completes, and stages the
+    checkpoint already holds (with their files still in storage) are skipped, so a
+    retried ingest resumes after the last completed stage. The analysis is recorded
+    before the upload is renamed, and the rename is repeated on resume if it did not
+    happen.
+
     Parameters:
         file_path (str): Path to the original audio file.
         base_name (str): Base name for saving modified files.
         folder (str): Directory to save the processed files.
         is_solo (str): Indicates if the song is a solo ("True") or not.
+        voices (list): Harmony voices as (name, interval) tuples. Defaults to Alto and Tenor.
+        diatonic (bool): Whether to keep the harmony voices within the detected key.
+        progress (ProgressReporter): Optional reporter for the decode, analyze, separate
+            and harmonize stages.
+        token (CancelToken): Optional token checked between stages; raises Cancelled once
+            the job is abandoned.
+        lazy_harmony (bool): Whether to leave the vocal parts virtual instead of rendering them.
+        separation_tier (str): FAST_TIER or HQ_TIER model for the stems.
+        checkpoint (IngestCheckpoint): Optional record of completed stages to resume from.
 
     Returns:
         tuple: Contains the song's key (str), BPM (float), paths to the generated Soprano,
-               Alto, Tenor, and Instrumental stems, and the modified file path URL.
+               Alto, Tenor, and Instrumental stems, the modified file path URL, a dict
+               of every harmony voice path (rendered or virtual) keyed by name, the stored beat grid
+               summary (dict) and the spectral feature summaries (dict).
     """
-    audio, sample_rate = load_song(file_path)
-    key, bpm = analyze_song(audio, sample_rate, file_path)
-
-    modified_filename = f"{base_name}_KEY_{key}_BPM_{bpm}.wav"
-    modified_file_path, modified_file_path_url = update_key_in_path(os.path.join(folder, modified_filename), key)
-    os.rename(file_path, modified_file_path)
-
-    stem_files = separate_and_rename_stems(modified_file_path)
-    soprano_path, instrumental_path = move_stem_files(folder, *stem_files)
-
-    alto_path, tenor_path = ("", "")
-    if is_solo == "True":
-        alto_path, tenor_path = generate_vocal_parts(soprano_path)
-
-    return key, bpm, soprano_path, alto_path, tenor_path, instrumental_path, modified_file_path_url
\ No newline at end of file
+    progress = progress or NullProgress()
+    token = token or CancelToken()
+    checkpoint = checkpoint or NullCheckpoint()
+    report = TransferReport()
+    storage = get_storage()
+
+    analysis = checkpoint.result("analyze")
+    if analysis is None:
+        shared = None
+        with progress.stage("decode"):
+            audio, sample_rate = load_song(file_path, ANALYSIS_DTYPE)
+            if audio_pool() is not None:
+                shared = SharedAudio.from_array(audio, report)
+        checkpoint.complete("decode", {"file_path": file_path})
+        try:
+            token.check()
+            with progress.stage("analyze"):
+                key, bpm, beats, features = analyze_song(audio, sample_rate, file_path, shared, report)
+                beat_grid = save_beat_analysis(beat_analysis_path(folder), beats)
+        finally:
+            if shared is not None:
+                shared.release()
+                print(f"Decoded song passed through shared memory: {report.as_dict()}")
+        storage.publish(beat_analysis_path(folder))
+
+        token.check()
+        # The song keeps the container it was saved in, so files uploaded before a change of
+        # STEM_FORMAT are renamed in place
+        modified_filename = f"{base_name}_KEY_{key}_BPM_{bpm}{os.path.splitext(file_path)[1]}"
+        modified_file_path, modified_file_path_url = update_key_in_path(os.path.join(folder, modified_filename), key)
+        analysis = {"key": key, "bpm": bpm, "beat_grid": beat_grid, "features": features,
+                    "modified_file_path": modified_file_path, "modified_file_path_url": modified_file_path_url}
+        checkpoint.complete("analyze", analysis)
+    else:
+        progress.skip("decode")
+        progress.skip("analyze")
+    key, bpm, modified_file_path = analysis["key"], analysis["bpm"], analysis["modified_file_path"]
+
+    if file_path != modified_file_path and storage.ensure_local(file_path):
+        os.replace(file_path, modified_file_path)
+        invalidate_decoded(file_path)
+        storage.publish(modified_file_path)
+        storage.delete(file_path)
+
+    token.check()
+    stems = checkpoint.result("separate", "soprano_path", "instrumental_path")
+    if stems is None:
+        with progress.stage("separate"):
+            try:
+                stem_files = separate_and_rename_stems(modified_file_path, progress, token, separation_tier)
+                soprano_path, instrumental_path = move_stem_files(folder, *stem_files)
+            finally:
+                shutil.rmtree(os.path.join(os.path.dirname(modified_file_path), SEPARATION_DIR), ignore_errors=True)
+        stems = {"soprano_path": soprano_path, "instrumental_path": instrumental_path}
+        checkpoint.complete("separate", stems)
+    else:
+        progress.skip("separate")
+    soprano_path, instrumental_path = stems["soprano_path"], stems["instrumental_path"]
+
+    token.check()
+    harmony = checkpoint.result("harmonize")
+    if harmony is not None and (lazy_harmony or all(storage.exists(path) for path in harmony["harmony_parts"].values())):
+        harmony_parts = harmony["harmony_parts"]
+        progress.skip("harmonize")
+    else:
+        harmony_parts = {}
+        if is_solo == "True" and lazy_harmony:
+            harmony_parts = {name: voice_path_for(soprano_path, name) for name, _ in voices or DEFAULT_VOICES}
+            progress.skip("harmonize")
+        elif is_solo == "True":
+            with progress.stage("harmonize"):
+                harmony_parts = generate_vocal_parts(soprano_path, key, voices, diatonic, token)
+        else:
+            progress.skip("harmonize")
+        checkpoint.complete("harmonize", {"harmony_parts": harmony_parts})
+    alto_path, tenor_path = harmony_parts.get("Alto", ""), harmony_parts.get("Tenor", "")
+
+    return (key, bpm, soprano_path, alto_path, tenor_path, instrumental_path,
+            analysis["modified_file_path_url"], harmony_parts, analysis["beat_grid"], analysis["features"])
\ No newline at end of file
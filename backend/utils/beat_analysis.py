@@ -0,0 +1,314 @@
+"""
+Beat analysis module that keeps madmom's beat activations and beat grid for reuse.
+
+Running the RNN beat processor is the expensive part of tempo estimation. This module
+runs it once per song and stores, in a compact compressed `.npz` file next to the song:
+- The beat activation curve (float16, 100 frames per second).
+- Beat and downbeat times in seconds.
+- The top tempo candidates with their strengths.
+
+Verification of BPM-changed variants (key_bpm_utils.change_bpm) then works from the
+stored analysis without running the RNN again.
+
+With TEMPO_MODE=fast, only a few representative excerpts are analyzed and the result
+carries a confidence score; the full-track analysis runs only when the excerpts
+disagree. Fast analyses store the excerpt activations with the start time and frame
+count of every excerpt, so they are never read as one continuous curve. Both analyses
+run madmom's networks on BEAT_THREADS threads.
+
+Dependencies:
+    - os: File path operations.
+    - numpy: Compact array storage.
+    - madmom: Beat activations, tempo estimation and beat tracking.
+    - librosa: Song durations and onset envelopes of BPM-changed variants.
+    - lazy_loader: Defers importing madmom and librosa until first use.
+    - fft_backend.install_fft_backend: Installs librosa's FFT library before the onset envelope.
+
+Functions:
+    - analyze_beats: Run the beat RNN and derive tempo candidates and the beat grid.
+    - analyze_beats_fast: Estimate tempo from excerpts, falling back to analyze_beats.
+    - analyze_tempo: Run the analysis selected by TEMPO_MODE.
+    - save_beat_analysis / load_beat_analysis: Persist and restore an analysis.
+    - estimate_tempo: Estimate tempo candidates from an activation curve.
+    - verify_tempo_change: Check that a rendered variant follows the expected beat grid.
+"""
+
+import os
+import numpy as np
+import lazy_loader as lazy
+from .fft_backend import install_fft_backend
+
+madmom = lazy.load("madmom")
+librosa = lazy.load("librosa")
+
+ANALYSIS_DIR = ".analysis"
+BEAT_FPS = 100
+TEMPO_CANDIDATES = 5
+BEATS_PER_BAR = 4
+# Sample rate madmom's beat networks were trained on
+BEAT_SAMPLE_RATE = 44100
+
+TEMPO_MODE = os.getenv("TEMPO_MODE", "full")
+BEAT_THREADS = int(os.getenv("BEAT_THREADS", os.cpu_count() or 1))
+EXCERPT_SECONDS = 30.0
+EXCERPT_POSITIONS = (0.25, 0.5, 0.75)
+# Relative tempo difference under which two excerpts agree
+AGREEMENT_TOLERANCE = 0.04
+
+
+def beat_analysis_path(folder):
+    """
+    Build the path of a song's stored beat analysis.
+
+    Parameters:
+        folder (str): Upload folder of the song.
+
+    Returns:
+        str: Path of the `.npz` file.
+    """
+    return os.path.join(folder, ANALYSIS_DIR, "beats.npz")
+
+
+def estimate_tempo(activations, fps=BEAT_FPS):
+    """
+    Estimate tempo candidates from a beat activation curve.
+
+    Parameters:
+        activations (ndarray): Beat activation per frame.
+        fps (int): Frames per second of the activations.
+
+    Returns:
+        ndarray: Rows of (BPM, strength), strongest first, at most TEMPO_CANDIDATES rows.
+    """
+    tempo_estimator = madmom.features.tempo.TempoEstimationProcessor(fps=fps)
+    return tempo_estimator(np.asarray(activations, dtype=np.float32))[:TEMPO_CANDIDATES]
+
+
+def estimate_downbeats(activations, beats, fps=BEAT_FPS):
+    """
+    Estimate downbeats assuming a constant number of beats per bar.
+
+    Picks the bar phase whose beats carry the most activation. This avoids running the
+    separate downbeat network; it assumes BEATS_PER_BAR beats per bar.
+
+    Parameters:
+        activations (ndarray): Beat activation per frame.
+        beats (ndarray): Beat times in seconds.
+        fps (int): Frames per second of the activations.
+
+    Returns:
+        ndarray: Downbeat times in seconds.
+    """
+    if len(beats) < BEATS_PER_BAR:
+        return beats[:1]
+    frames = np.clip(np.round(beats * fps).astype(int), 0, len(activations) - 1)
+    strengths = [activations[frames[phase::BEATS_PER_BAR]].mean() for phase in range(BEATS_PER_BAR)]
+    return beats[int(np.argmax(strengths))::BEATS_PER_BAR]
+
+
+def analyze_beats(filename, num_threads=BEAT_THREADS):
+    """
+    Run the beat RNN over an audio file and derive tempo candidates and the beat grid.
+
+    Parameters:
+        filename (str): Path to the audio file.
+        num_threads (int): Threads used to run madmom's ensemble of networks.
+
+    Returns:
+        dict: Activations, fps, beats, downbeats, tempo_candidates, the rounded bpm,
+              the analysis mode and its confidence.
+    """
+    activations = madmom.features.beats.RNNBeatProcessor(num_threads=num_threads)(filename)
+    tempo_candidates = estimate_tempo(activations)
+    beats = madmom.features.beats.DBNBeatTrackingProcessor(fps=BEAT_FPS)(activations)
+
+    return {
+        "activations": activations,
+        "fps": BEAT_FPS,
+        "beats": beats,
+        "downbeats": estimate_downbeats(activations, beats),
+        "tempo_candidates": tempo_candidates,
+        "bpm": round(tempo_candidates[0][0]),
+        "mode": "full",
+        "confidence": 1.0,
+    }
+
+
+def excerpt_agreement(tempi):
+    """
+    Measure how well the tempi of several excerpts agree.
+
+    Parameters:
+        tempi (list): Strongest tempo of each excerpt in BPM.
+
+    Returns:
+        tuple: Median tempo (float) and the fraction of excerpts within AGREEMENT_TOLERANCE of it.
+    """
+    median = float(np.median(tempi))
+    agreeing = [abs(tempo - median) / median <= AGREEMENT_TOLERANCE for tempo in tempi]
+    return median, float(np.mean(agreeing))
+
+
+def analyze_beats_fast(filename, duration=None, num_threads=BEAT_THREADS):
+    """
+    Estimate tempo from a few representative excerpts instead of the whole track.
+
+    Each excerpt is resampled to BEAT_SAMPLE_RATE and runs through the beat RNN on its
+    own; when every excerpt agrees on the tempo, their activations and beats are returned
+    with a confidence of 1.0. Otherwise, or for songs too short to excerpt, the
+    full-track analysis runs instead.
+
+    Parameters:
+        filename (str): Path to the audio file.
+        duration (float): Length of the song in seconds, read from the file if omitted.
+        num_threads (int): Threads used to run madmom's ensemble of networks.
+
+    Returns:
+        dict: Same keys as analyze_beats; 'mode' is 'fast' or 'full' and 'confidence'
+              the fraction of excerpts that agreed. Fast results add 'segments', rows of
+              (start in seconds, frame count) of the excerpts in 'activations'.
+    """
+    if duration is None:
+        duration = librosa.get_duration(path=filename)
+    if duration < EXCERPT_SECONDS * len(EXCERPT_POSITIONS) * 1.5:
+        return analyze_beats(filename, num_threads)
+
+    processor = madmom.features.beats.RNNBeatProcessor(num_threads=num_threads)
+    tempi, candidates, activations, beats, downbeats, segments = [], [], [], [], [], []
+    for position in EXCERPT_POSITIONS:
+        start = max(0.0, position * duration - EXCERPT_SECONDS / 2)
+        signal = madmom.audio.signal.Signal(filename, sample_rate=BEAT_SAMPLE_RATE, num_channels=1,
+                                            start=start, stop=start + EXCERPT_SECONDS)
+        excerpt_activations = processor(signal)
+        candidates.append(estimate_tempo(excerpt_activations))
+        tempi.append(candidates[-1][0][0])
+        activations.append(excerpt_activations)
+        segments.append((start, len(excerpt_activations)))
+        excerpt_beats = madmom.features.beats.DBNBeatTrackingProcessor(fps=BEAT_FPS)(excerpt_activations)
+        beats.append(excerpt_beats + start)
+        downbeats.append(estimate_downbeats(excerpt_activations, excerpt_beats) + start)
+
+    tempo, confidence = excerpt_agreement(tempi)
+    if confidence < 1.0:
+        print(f"Excerpt tempi disagree ({[round(t, 1) for t in tempi]}), running full analysis")
+        analysis = analyze_beats(filename, num_threads)
+        analysis["confidence"] = confidence
+        return analysis
+
+    # Activations are stored back to back with their segments; beat times stay absolute.
+    # Tempo candidates come from the excerpt closest to the agreed tempo, since estimating
+    # them over the joined excerpts would read the joins as beats
+    closest = int(np.argmin([abs(t - tempo) for t in tempi]))
+    return {
+        "activations": np.concatenate(activations),
+        "segments": np.asarray(segments, dtype=np.float32),
+        "fps": BEAT_FPS,
+        "beats": np.concatenate(beats),
+        "downbeats": np.concatenate(downbeats),
+        "tempo_candidates": candidates[closest],
+        "bpm": round(tempo),
+        "mode": "fast",
+        "confidence": confidence,
+    }
+
+
+def analyze_tempo(filename, mode=None):
+    """
+    Analyze beats with the configured tempo mode.
+
+    Parameters:
+        filename (str): Path to the audio file.
+        mode (str): 'fast' or 'full'; defaults to TEMPO_MODE.
+
+    Returns:
+        dict: Result of analyze_beats_fast or analyze_beats.
+    """
+    if (mode or TEMPO_MODE) == "fast":
+        return analyze_beats_fast(filename)
+    return analyze_beats(filename)
+
+
+def save_beat_analysis(path, analysis):
+    """
+    Store a beat analysis compactly in a compressed `.npz` file.
+
+    Parameters:
+        path (str): Destination path.
+        analysis (dict): Result of analyze_beats.
+
+    Returns:
+        dict: Summary to store on the song document (path, fps, tempo candidates, counts).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(
+        path,
+        activations=np.asarray(analysis["activations"], dtype=np.float16),
+        beats=np.asarray(analysis["beats"], dtype=np.float32),
+        downbeats=np.asarray(analysis["downbeats"], dtype=np.float32),
+        tempo_candidates=np.asarray(analysis["tempo_candidates"], dtype=np.float32),
+        segments=np.asarray(analysis.get("segments", np.empty((0, 2))), dtype=np.float32),
+        fps=np.int32(analysis["fps"]),
+    )
+    return {
+        "path": path,
+        "mode": analysis.get("mode", "full"),
+        "confidence": round(float(analysis.get("confidence", 1.0)), 3),
+        "fps": int(analysis["fps"]),
+        "beat_count": int(len(analysis["beats"])),
+        "tempo_candidates": [[round(float(bpm), 2), round(float(strength), 4)]
+                             for bpm, strength in analysis["tempo_candidates"]],
+    }
+
+
+def load_beat_analysis(path):
+    """
+    Restore a stored beat analysis.
+
+    Parameters:
+        path (str): Path of the `.npz` file.
+
+    Returns:
+        dict: Activations (float32), fps, beats, downbeats, tempo candidates and the
+              excerpt segments (empty for full-track analyses).
+    """
+    with np.load(path) as stored:
+        return {
+            "activations": stored["activations"].astype(np.float32),
+            "segments": stored["segments"] if "segments" in stored.files else np.empty((0, 2), dtype=np.float32),
+            "fps": int(stored["fps"]),
+            "beats": stored["beats"],
+            "downbeats": stored["downbeats"],
+            "tempo_candidates": stored["tempo_candidates"],
+        }
+
+
+def verify_tempo_change(analysis, audio, sample_rate, ratio, tolerance=0.07):
+    """
+    Check that a tempo-changed variant follows the stored beat grid scaled by the ratio.
+
+    Compares the variant's onset envelope at the expected beat positions with its
+    average level, so no beat RNN runs on the variant.
+
+    Parameters:
+        analysis (dict): Stored beat analysis of the original song.
+        audio (ndarray): Audio of the variant.
+        sample_rate (int): Sampling rate of the variant.
+        ratio (float): Applied tempo ratio (new BPM / original BPM).
+        tolerance (float): Search window around each expected beat in seconds.
+
+    Returns:
+        float: Fraction of expected beats that fall on an above-average onset.
+    """
+    install_fft_backend()
+    hop_length = 512
+    envelope = librosa.onset.onset_strength(y=np.asarray(audio, dtype=np.float32), sr=sample_rate,
+                                            hop_length=hop_length)
+    expected = librosa.time_to_frames(np.asarray(analysis["beats"]) / ratio, sr=sample_rate, hop_length=hop_length)
+    expected = expected[expected < len(envelope)]
+    if len(expected) == 0:
+        return 0.0
+
+    window = max(1, int(tolerance * sample_rate / hop_length))
+    threshold = envelope.mean()
+    hits = [envelope[max(0, frame - window):frame + window + 1].max() > threshold for frame in expected]
+    return float(np.mean(hits))
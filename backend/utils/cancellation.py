@@ -0,0 +1,150 @@
+"""
+Cooperative cancellation module for pipeline stages, renders and transcription.
+
+Long-running work receives a CancelToken and checks it between units of work (pipeline
+stages, separation and transcription chunks, harmony voices, stems); ffmpeg subprocesses
+are polled and killed. A token is cancelled when:
+- Its client disconnects (every token is registered under the Socket.IO room of its job).
+- A newer job supersedes it (e.g. a re-upload of the same song).
+- Its deadline passes.
+
+Tokens live in a per-process registry, so cancelling a key reaches work running in
+threads of the same process; queue workers learn about cancellations through the job
+document (see JobModel.request_cancel).
+
+Dependencies:
+    - time: Deadlines.
+    - threading: Cancellation events and the registry lock.
+    - contextlib: Registration scope.
+
+Classes:
+    - Cancelled: Raised by CancelToken.check once a token is cancelled.
+    - CancelToken: Cancellation flag with an optional deadline.
+
+Functions:
+    - cancel_scope: Register a new token under some keys for the duration of a job.
+    - cancel: Cancel every token registered under a key.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+_active = {}
+_active_lock = threading.Lock()
+
+
+class Cancelled(Exception):
+    """
+    Raised when work is abandoned because its token was cancelled.
+
+    Attributes:
+        reason (str): Why the token was cancelled (e.g. 'client disconnected').
+        status_code (int): HTTP status for a request abandoned this way: 504 when its
+            deadline passed, 499 (client closed request) otherwise.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = 504 if reason == DEADLINE_EXCEEDED else 499
+
+
+class CancelToken:
+    """
+    Cancellation flag shared between a job and whoever may abandon it.
+
+    Attributes:
+        deadline (float): time.monotonic() value after which the token counts as
+            cancelled, or None for no deadline.
+        reason (str): Why the token was cancelled, or None.
+    """
+
+    def __init__(self, deadline_seconds=None):
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE_EXCEEDED)
+        return self._event.is_set()
+
+    def check(self):
+        """
+        Raise Cancelled if the token was cancelled or its deadline has passed.
+        """
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for a cancellation.
+
+        Returns:
+            bool: True if the token is cancelled.
+        """
+        if self.deadline is not None:
+            timeout = max(0.0, min(timeout, self.deadline - time.monotonic()))
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+@contextmanager
+def cancel_scope(keys, deadline_seconds=None, supersede=False):
+    """
+    Create a token and register it under some keys for the duration of a job.
+
+    Parameters:
+        keys (list): Keys to register under, e.g. the job's Socket.IO room or
+                     'ingest:<song_id>'; empty keys are ignored.
+        deadline_seconds (float): Seconds until the token expires, or None.
+        supersede (bool): Whether to cancel tokens already registered under the keys.
+
+    Yields:
+        CancelToken: The registered token.
+    """
+    keys = [key for key in keys if key]
+    token = CancelToken(deadline_seconds)
+    with _active_lock:
+        for key in keys:
+            tokens = _active.setdefault(key, set())
+            if supersede:
+                for previous in tokens:
+                    previous.cancel("superseded by a newer job")
+            tokens.add(token)
+    try:
+        yield token
+    finally:
+        with _active_lock:
+            for key in keys:
+                tokens = _active.get(key, set())
+                tokens.discard(token)
+                if not tokens:
+                    _active.pop(key, None)
+
+
+def cancel(key, reason="cancelled"):
+    """
+    Cancel every token registered under a key in this process.
+
+    Parameters:
+        key (str): Registration key, e.g. a Socket.IO room.
+        reason (str): Why the work is abandoned.
+
+    Returns:
+        int: Number of tokens cancelled.
+    """
+    with _active_lock:
+        tokens = list(_active.get(key, ()))
+    for token in tokens:
+        token.cancel(reason)
+    return len(tokens)
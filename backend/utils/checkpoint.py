@@ -0,0 +1,96 @@
+"""
+Stage checkpoints of the ingest pipeline.
+
+analyze_and_process_audio used to be all-or-nothing: a crash after a multi-minute
+separation threw the stems away, and the renamed upload left behind kept the retry from
+finding its input. The pipeline now asks an IngestCheckpoint which stages already
+completed and records each stage as it completes, with what later stages need (key,
+BPM, beat grid and features; the renamed upload; stem paths; harmony parts), so a retry
+resumes after the last completed stage. Checkpoints live in MongoDB, so a job retried on
+another worker resumes too.
+
+Dependencies:
+    - IngestCheckpointModel: Durable storage of the checkpoints (passed in).
+    - storage.get_storage: Checking that checkpointed files still exist.
+
+Classes:
+    - IngestCheckpoint: Completed stages of one song's ingest.
+    - NullCheckpoint: Checkpoint that records nothing, for callers without a database.
+"""
+
+from .storage import get_storage
+
+
+class IngestCheckpoint:
+    """
+    Completed stages of one song's ingest, loaded once and updated as stages complete.
+
+    Attributes:
+        model (IngestCheckpointModel): Storage of the checkpoint.
+        song_id (str): ID of the song being ingested.
+        stages (dict): Results of the completed stages keyed by stage name.
+        separation_tier (str): Tier recorded when the ingest started, or None.
+    """
+
+    def __init__(self, model, song_id):
+        self.model = model
+        self.song_id = song_id
+        document = model.find(song_id) or {}
+        self.stages = document.get("stages", {})
+        self.separation_tier = document.get("separation_tier")
+
+    def result(self, stage, *paths):
+        """
+        Result of a completed stage, if its files are still there.
+
+        Parameters:
+            stage (str): Name of the stage.
+            *paths: Keys of the result holding paths that must exist in storage.
+
+        Returns:
+            dict: The stage's result, or None if the stage has to run (again).
+        """
+        result = self.stages.get(stage)
+        if result is None:
+            return None
+        storage = get_storage()
+        if not all(result.get(key) and storage.exists(result[key]) for key in paths):
+            print(f"Checkpoint of stage {stage} for {self.song_id} lost its files, running it again")
+            return None
+        print(f"Resuming ingest of {self.song_id} after stage {stage}")
+        return result
+
+    def complete(self, stage, result=None):
+        """
+        Record a completed stage.
+
+        Parameters:
+            stage (str): Name of the stage.
+            result (dict): What later stages and resumes need from it.
+        """
+        self.stages[stage] = result or {}
+        self.model.complete_stage(self.song_id, stage, result)
+
+    def finish(self):
+        """
+        Drop the checkpoint once the song document is written; the document is now the
+        durable record of the ingest.
+        """
+        self.model.clear(self.song_id)
+
+
+class NullCheckpoint:
+    """
+    Checkpoint with the IngestCheckpoint interface that records nothing.
+    """
+
+    separation_tier = None
+
+    def result(self, stage, *paths):
+        return None
+
+    def complete(self, stage, result=None):
+        pass
+
+    def finish(self):
+        pass
@@ -0,0 +1,205 @@
+"""
+Feature extraction engine deriving every spectral feature of a song from one STFT.
+
+Key detection, loudness and timbre features used to each run their own transforms over
+the whole song. This module computes the STFT once and derives from it, in vectorized
+form:
+- A harmonic/percussive split on the STFT, whose harmonic part feeds key detection and
+  the chroma summary.
+- Integrated loudness in LUFS (ITU-R BS.1770 K-weighting applied in the frequency
+  domain, with absolute and relative gating over 400 ms blocks).
+- Spectral centroid and rolloff.
+- A mel spectrogram shared by onset strength and MFCCs.
+
+Each feature is summarized compactly (means, deviations, percentiles) for storage, and
+the time spent on each one is recorded alongside.
+
+Dependencies:
+    - time: Per-feature cost measurement.
+    - numpy: Vectorized summaries and loudness gating.
+    - librosa: STFT, HPSS and feature computation, imported on first use.
+    - scipy.signal: K-weighting filter design and frequency response, imported on first use.
+    - fft_backend.install_fft_backend: Installs librosa's FFT library before the first transform.
+
+Functions:
+    - k_weighting: Power response of the BS.1770 K-weighting filter at given frequencies.
+    - integrated_loudness: Gated integrated loudness from a power spectrogram.
+    - extract_features: Compute every feature from a single STFT.
+"""
+
+import time
+import numpy as np
+import lazy_loader as lazy
+from .fft_backend import install_fft_backend
+
+librosa = lazy.load("librosa")
+# Only the top-level package can be loaded lazily; lazy_loader imports the parent package
+# of a submodule right away. scipy loads its submodules on first attribute access.
+scipy = lazy.load("scipy")
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 13
+ROLLOFF_PERCENT = 0.85
+# BS.1770 gating: 400 ms blocks every 100 ms, -70 LUFS absolute and -10 LU relative gates
+LOUDNESS_BLOCK_SECONDS = 0.4
+LOUDNESS_STEP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+
+def k_weighting(frequencies, sample_rate):
+    """
+    Power response of the BS.1770 K-weighting filter (high shelf and high pass).
+
+    The filters are designed for the given sampling rate from their analog parameters,
+    so rates other than 48 kHz are weighted correctly.
+
+    Parameters:
+        frequencies (ndarray): Frequencies in Hz.
+        sample_rate (int): Sampling rate of the audio.
+
+    Returns:
+        ndarray: Squared magnitude response at each frequency.
+    """
+    # High shelf: +4 dB above ~1.5 kHz
+    gain, q, fc = 4.0, 1 / np.sqrt(2), 1500.0
+    a = 10 ** (gain / 40)
+    w0 = 2 * np.pi * fc / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    shelf_b = [a * ((a + 1) + (a - 1) * np.cos(w0) + 2 * np.sqrt(a) * alpha),
+               -2 * a * ((a - 1) + (a + 1) * np.cos(w0)),
+               a * ((a + 1) + (a - 1) * np.cos(w0) - 2 * np.sqrt(a) * alpha)]
+    shelf_a = [(a + 1) - (a - 1) * np.cos(w0) + 2 * np.sqrt(a) * alpha,
+               2 * ((a - 1) - (a + 1) * np.cos(w0)),
+               (a + 1) - (a - 1) * np.cos(w0) - 2 * np.sqrt(a) * alpha]
+    # High pass at 38 Hz
+    q, fc = 0.5, 38.0
+    w0 = 2 * np.pi * fc / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    pass_b = [(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2]
+    pass_a = [1 + alpha, -2 * np.cos(w0), 1 - alpha]
+
+    _, shelf = scipy.signal.freqz(shelf_b, shelf_a, worN=frequencies, fs=sample_rate)
+    _, high_pass = scipy.signal.freqz(pass_b, pass_a, worN=frequencies, fs=sample_rate)
+    return np.abs(shelf * high_pass) ** 2
+
+
+def integrated_loudness(power, sample_rate, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Integrated loudness (LUFS) of a single-channel signal from its power spectrogram.
+
+    The K-weighted mean square of every STFT frame follows from Parseval's theorem;
+    frames are averaged into 400 ms gating blocks.
+
+    Parameters:
+        power (ndarray): Power spectrogram |STFT|^2 with a Hann window.
+        sample_rate (int): Sampling rate of the audio.
+        n_fft (int): FFT size of the STFT.
+        hop_length (int): Hop length of the STFT.
+
+    Returns:
+        float: Integrated loudness in LUFS, or -inf for silence.
+    """
+    weights = k_weighting(librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft), sample_rate)
+    # One-sided spectrum: every bin except DC and Nyquist stands for two
+    weights[1:-1] *= 2
+    window_energy = np.sum(np.hanning(n_fft + 1)[:-1] ** 2)
+    frame_power = (weights @ power) / (n_fft * window_energy)
+
+    block = max(1, int(round(LOUDNESS_BLOCK_SECONDS * sample_rate / hop_length)))
+    step = max(1, int(round(LOUDNESS_STEP_SECONDS * sample_rate / hop_length)))
+    if len(frame_power) < block:
+        block_power = np.array([frame_power.mean()])
+    else:
+        cumulative = np.concatenate([[0.0], np.cumsum(frame_power)])
+        starts = np.arange(0, len(frame_power) - block + 1, step)
+        block_power = (cumulative[starts + block] - cumulative[starts]) / block
+
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+    gated = block_power[block_loudness > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return float("-inf")
+    relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = block_power[block_loudness > max(ABSOLUTE_GATE, relative)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "mean": round(float(values.mean()), 4),
+        "std": round(float(values.std()), 4),
+        "p10": round(float(np.percentile(values, 10)), 4),
+        "p90": round(float(np.percentile(values, 90)), 4),
+    }
+
+
+def extract_features(audio, sample_rate):
+    """
+    Compute every spectral feature of a song from a single STFT.
+
+    Parameters:
+        audio (ndarray): Mono audio signal.
+        sample_rate (int): Sampling rate of the audio.
+
+    Returns:
+        tuple: Feature summaries (dict, including per-feature 'costs' in seconds) and the
+               harmonic part of the audio (ndarray) for key detection.
+    """
+    install_fft_backend()
+    costs = {}
+    started = time.perf_counter()
+
+    def lap(name):
+        nonlocal started
+        now = time.perf_counter()
+        costs[name] = round(now - started, 4)
+        started = now
+
+    y = np.asarray(audio, dtype=np.float32)
+    stft = librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)
+    magnitude = np.abs(stft)
+    power = magnitude ** 2
+    lap("stft")
+
+    harmonic_stft, _ = librosa.decompose.hpss(stft)
+    harmonic = librosa.istft(harmonic_stft, hop_length=HOP_LENGTH, length=len(y))
+    lap("hpss")
+
+    chroma = librosa.feature.chroma_stft(S=np.abs(harmonic_stft) ** 2, sr=sample_rate)
+    chroma_mean = chroma.mean(axis=1)
+    lap("chroma")
+
+    loudness = integrated_loudness(power, sample_rate)
+    lap("loudness")
+
+    centroid = librosa.feature.spectral_centroid(S=magnitude, sr=sample_rate)[0]
+    rolloff = librosa.feature.spectral_rolloff(S=magnitude, sr=sample_rate, roll_percent=ROLLOFF_PERCENT)[0]
+    lap("spectral")
+
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sample_rate))
+    lap("mel")
+
+    onset = librosa.onset.onset_strength(S=mel_db, sr=sample_rate)
+    lap("onset")
+
+    mfcc = librosa.feature.mfcc(S=mel_db, n_mfcc=N_MFCC)
+    lap("mfcc")
+
+    features = {
+        "sample_rate": int(sample_rate),
+        "frames": int(stft.shape[1]),
+        "chroma": [round(float(value), 4) for value in chroma_mean / max(chroma_mean.max(), 1e-9)],
+        "loudness_lufs": round(loudness, 2) if np.isfinite(loudness) else None,
+        "spectral_centroid": _summary(centroid),
+        "spectral_rolloff": _summary(rolloff),
+        "onset_strength": {**_summary(onset), "max": round(float(onset.max()), 4)},
+        "mfcc": {
+            "mean": [round(float(value), 3) for value in mfcc.mean(axis=1)],
+            "std": [round(float(value), 3) for value in mfcc.std(axis=1)],
+        },
+        "costs": costs,
+    }
+    return features, harmonic
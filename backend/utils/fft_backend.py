@@ -0,0 +1,153 @@
+"""
+FFT backend of librosa's transforms, with a per-job thread count.
+
+Pitch shifts, time stretches, HPSS and chroma spend most of their time in FFTs, which
+librosa runs through numpy.fft on a single thread. FFT_BACKEND selects the library
+installed with librosa.set_fftlib:
+- scipy (default): scipy.fft (pocketfft), which takes a `workers` argument, so the FFTs
+  of one STFT are spread over several threads.
+- numpy: librosa's default numpy.fft, single-threaded.
+
+The thread count is per job: the code running a job enters fft_workers with the thread
+budget of that job (e.g. the cores left to it by the scheduler), and every librosa FFT
+made by that thread uses it. Threads started inside a job (parallel harmony renders)
+run their FFTs on one thread each, since they already run side by side. fft_workers only
+sets the budget: the backend is installed by install_fft_backend, which warm-up and the
+functions calling librosa's transforms run first, so a process that never renders
+(e.g. a web process serving files) never imports librosa.
+
+FFT sizes in this code base are fixed (2048-point STFTs, power-of-two constant-Q
+filters) and already efficient, so planning is done once per process: plan_fft_sizes
+runs every size once so pocketfft's plan cache holds their twiddle factors, and every
+later stem reuses them.
+
+Dependencies:
+    - os: Configuration.
+    - threading: Per-thread worker counts and one-time installation.
+    - numpy: Plan warm-up input.
+    - scipy.fft: Multithreaded FFTs, imported on first use.
+    - librosa: set_fftlib, imported on first use.
+
+Classes:
+    - ScipyFFT: numpy.fft-compatible view of scipy.fft passing the thread's worker count.
+
+Functions:
+    - install_fft_backend: Install FFT_BACKEND as librosa's FFT library.
+    - fft_workers: Run a block with a thread budget for its FFTs.
+    - current_workers: Worker count of the calling thread.
+    - plan_fft_sizes: Plan every FFT size used by the pipeline.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+import lazy_loader as lazy
+
+librosa = lazy.load("librosa")
+# Only the top-level package can be loaded lazily; lazy_loader imports the parent package
+# of a submodule right away. scipy loads its submodules on first attribute access.
+scipy = lazy.load("scipy")
+
+FFT_BACKEND = os.getenv("FFT_BACKEND", "scipy").lower()
+if FFT_BACKEND not in ("scipy", "numpy"):
+    raise ValueError(f"Unknown FFT_BACKEND: {FFT_BACKEND}")
+# Fixed FFT thread count; 0 uses the thread budget of each job
+FFT_WORKERS = int(os.getenv("FFT_WORKERS", "0"))
+# Transform sizes of the STFTs (librosa's default, features, fingerprints, streams)
+PLANNED_FFT_SIZES = (512, 1024, 2048, 4096)
+
+_local = threading.local()
+_installed = False
+_install_lock = threading.Lock()
+
+
+def current_workers():
+    """
+    FFT worker count of the calling thread.
+
+    Returns:
+        int: FFT_WORKERS if set, otherwise the budget of the enclosing fft_workers block, or 1.
+    """
+    return FFT_WORKERS or getattr(_local, "workers", 1)
+
+
+class ScipyFFT:
+    """
+    numpy.fft-compatible view of scipy.fft that passes the calling thread's worker count.
+
+    Transforms taking a `workers` argument are wrapped; everything else (fftfreq,
+    rfftfreq, ...) is scipy.fft's own.
+    """
+
+    THREADED = {"fft", "ifft", "rfft", "irfft", "fft2", "ifft2", "rfft2", "irfft2",
+                "fftn", "ifftn", "rfftn", "irfftn", "hfft", "ihfft"}
+
+    def __getattr__(self, name):
+        function = getattr(scipy.fft, name)
+        if name not in self.THREADED:
+            return function
+
+        def threaded(*args, **kwargs):
+            kwargs.setdefault("workers", current_workers())
+            return function(*args, **kwargs)
+        return threaded
+
+
+def install_fft_backend():
+    """
+    Install FFT_BACKEND as librosa's FFT library, once per process.
+
+    Returns:
+        str: Name of the installed backend.
+    """
+    global _installed
+    if not _installed:
+        with _install_lock:
+            if not _installed:
+                librosa.set_fftlib(ScipyFFT() if FFT_BACKEND == "scipy" else None)
+                _installed = True
+    return FFT_BACKEND
+
+
+@contextmanager
+def fft_workers(workers):
+    """
+    Run a block with a thread budget for the FFTs made by the calling thread.
+
+    Parameters:
+        workers (int): Number of threads per FFT; values below 1 mean 1.
+
+    Yields:
+        int: The worker count in effect.
+    """
+    previous = getattr(_local, "workers", None)
+    _local.workers = max(1, int(workers or 1))
+    try:
+        yield current_workers()
+    finally:
+        if previous is None:
+            del _local.workers
+        else:
+            _local.workers = previous
+
+
+def plan_fft_sizes(sizes=PLANNED_FFT_SIZES):
+    """
+    Run a real forward and inverse FFT of every size once, so the plans and twiddle
+    factors are cached before the first stem and reused by all later ones.
+
+    Parameters:
+        sizes (iterable): Transform sizes to plan.
+
+    Returns:
+        list: The planned sizes.
+    """
+    install_fft_backend()
+    fft = librosa.get_fftlib()
+    planned = []
+    for size in sizes:
+        frames = np.zeros((size, 2), dtype=np.float32)
+        fft.irfft(fft.rfft(frames, axis=0), n=size, axis=0)
+        planned.append(size)
+    return planned
@@ -3,19 +3,31 @@ File operations utility module for managing audio files, including saving, movin
 
 This module provides utilities for:
 - Validating allowed file types for upload.
-- Saving uploaded audio files, including conversion of MP3 files to WAV format.
+- Hashing uploads, to tell a re-upload of the same file from another file of the same name.
+- Saving uploaded audio files, converting them to the stem format (WAV or FLAC) if needed.
+- Copying local audio files into the upload folder for batch imports.
 - Moving separated audio stems (e.g., instrumental and vocal) to designated directories.
 - Deleting unwanted files in a directory while preserving specified files.
+- Discarding an uploaded file that will not be processed.
+
+Saved and moved files are published to the storage backend, and deletions remove them
+from it, so every node sees the same library.
 
 Dependencies:
     - os: File and directory path operations.
+    - hashlib: Digests of uploaded files.
     - shutil: High-level file operations such as moving files.
     - pydub.AudioSegment: Audio file manipulation, particularly for format conversion.
+    - audio_cache.invalidate_decoded: Removal of decoded sidecars for deleted files.
+    - storage.get_storage: Storage backend the files are published to.
 """
 
 import os
 import shutil
+import hashlib
 from pydub import AudioSegment
+from .audio_cache import invalidate_decoded
+from .storage import get_storage
 
 def allowed_file(filename):
     """
@@ -29,27 +41,72 @@ def allowed_file(filename):
     """
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'wav', 'mp3'}
 
+def upload_digest(file, chunk_size=1024 * 1024):
+    """
+    Computes the SHA-256 digest of an uploaded file and rewinds it for saving.
+
+    Parameters:
+        file (FileStorage): The uploaded file.
+        chunk_size (int): Bytes read at a time.
+
+    Returns:
+        str: Hexadecimal digest of the upload's bytes.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(chunk_size), b""):
+        digest.update(chunk)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
 def save_song_file(file, folder, filename, extension):
     """
-    Saves an uploaded audio file in the specified folder, converting it to WAV if necessary.
+    Saves an uploaded audio file in the specified folder, converting it if necessary.
 
-    If the uploaded file is an MP3, it will be converted to WAV format.
+    If the upload's format differs from the one named by filename (e.g. an MP3 saved as
+    WAV, or a WAV saved as FLAC), it is converted.
 
     Parameters:
         file (FileStorage): The file to be saved.
         folder (str): The directory where the file should be saved.
-        filename (str): The name for the saved file.
-        extension (str): The file extension (.mp3 or .wav).
+        filename (str): The name for the saved file; its extension selects the stored format.
+        extension (str): The file extension of the upload (.mp3 or .wav).
 
     Returns:
         str: The file path where the file is saved.
     """
     file_path = os.path.join(folder, filename)
-    if extension == '.mp3':
-        audio = AudioSegment.from_mp3(file)
-        audio.export(file_path, format="wav")
+    target_extension = os.path.splitext(filename)[1].lower()
+    if extension != target_extension:
+        audio = AudioSegment.from_file(file, format=extension.lstrip('.'))
+        audio.export(file_path, format=target_extension.lstrip('.'))
     else:
         file.save(file_path)
+    get_storage().publish(file_path)
+    return file_path
+
+def copy_song_file(source_path, folder, filename, extension):
+    """
+    Copies a local audio file into the specified folder, converting it if necessary.
+
+    Counterpart of save_song_file for files that are already on disk, such as batch imports.
+
+    Parameters:
+        source_path (str): Path to the audio file to import.
+        folder (str): The directory where the file should be saved.
+        filename (str): The name for the saved file; its extension selects the stored format.
+        extension (str): The file extension of the source (.mp3 or .wav).
+
+    Returns:
+        str: The file path where the file is saved.
+    """
+    file_path = os.path.join(folder, filename)
+    target_extension = os.path.splitext(filename)[1].lower()
+    if extension != target_extension:
+        audio = AudioSegment.from_file(source_path, format=extension.lstrip('.'))
+        audio.export(file_path, format=target_extension.lstrip('.'))
+    else:
+        shutil.copyfile(source_path, file_path)
+    get_storage().publish(file_path)
     return file_path
 
 def move_stem_files(dir_name, instrumental, vocal):
@@ -85,6 +142,10 @@ def move_stem_files(dir_name, instrumental, vocal):
     elif instrumental:
         print(f"File {instrumental_dest} already exists. Skipping.")
 
+    storage = get_storage()
+    for dest in (vocal_dest, instrumental_dest):
+        if os.path.exists(dest):
+            storage.publish(dest)
     return vocal_dest, instrumental_dest
 
 def delete_unwanted_files(directory, *args):
@@ -99,9 +160,10 @@ def delete_unwanted_files(directory, *args):
         None
     """
     # Get a set of base filenames to keep
-    keep_files = {os.path.basename(file) for file in args}
+    keep_files = {os.path.basename(file).replace("%23", "#") for file in args}
+    storage = get_storage()
 
-    for filename in os.listdir(directory):
+    for filename in storage.list(directory):
         # Construct the full file path
         file_path = os.path.join(directory, filename)
         
@@ -109,10 +171,27 @@ def delete_unwanted_files(directory, *args):
         if filename in keep_files:
             continue
         
-        # Check if it's a file and delete it
-        if os.path.isfile(file_path):
-            try:
-                os.remove(file_path)
-                print(f"Deleted: {file_path}")
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
+        # Delete the file locally and from the storage backend
+        try:
+            storage.delete(file_path)
+            invalidate_decoded(file_path)
+            print(f"Deleted: {file_path}")
+        except Exception as e:
+            print(f"Error deleting {file_path}: {e}")
+
+def discard_song_file(file_path, remove_folder=False):
+    """
+    Deletes an uploaded audio file that will not be processed, e.g. a near-duplicate.
+
+    Parameters:
+        file_path (str): Path of the saved upload.
+        remove_folder (bool): Whether to remove the song's whole folder, for songs
+                              that have no other files.
+
+    Returns:
+        None
+    """
+    if remove_folder:
+        shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
+    get_storage().delete(file_path)
+    invalidate_decoded(file_path)
@@ -0,0 +1,149 @@
+"""
+Landmark audio fingerprints for finding re-encodes, trims and other near-duplicates of a song.
+
+A fingerprint is a set of landmarks: pairs of prominent spectral peaks hashed as
+(anchor frequency, target frequency, time between them), each with the time of its
+anchor. Peak positions survive lossy re-encoding, bitrate changes and volume changes,
+and because every landmark carries its own time, a trimmed copy still shares most of
+its landmarks with the original at a constant time offset.
+
+Landmarks are stored in an inverted index keyed by hash (see FingerprintModel). A query
+looks up its hashes, and candidate songs are ranked by the largest number of matching
+landmarks that agree on one time offset, which rejects hashes that match by chance.
+
+Dependencies:
+    - collections.Counter: Offset histograms.
+    - numpy: Peak picking and landmark pairing.
+    - librosa: STFT, imported on first use.
+    - fft_backend.install_fft_backend: Installs librosa's FFT library before the first transform.
+
+Functions:
+    - find_peaks: Prominent local maxima of a spectrogram.
+    - landmarks: Hashed peak pairs of an audio signal.
+    - rank_matches: Rank indexed songs by offset-consistent landmark matches.
+"""
+
+import os
+from collections import Counter
+import numpy as np
+import lazy_loader as lazy
+from .fft_backend import install_fft_backend
+
+librosa = lazy.load("librosa")
+
+# Landmark frames and bins are defined at this rate; other rates are resampled first
+SAMPLE_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+# Peaks above this bin (~5.5 kHz) are too fragile under lossy encoding
+MAX_BIN = 512
+# Neighbourhood (bins, frames) a peak must dominate
+PEAK_NEIGHBOURHOOD = (15, 11)
+PEAKS_PER_SECOND = 8
+FAN_OUT = 5
+# Target zone of an anchor: frames after it and bins around it
+MAX_DELTA_FRAMES = 63
+MAX_DELTA_BINS = 96
+DUPLICATE_MIN_MATCHES = int(os.getenv("DUPLICATE_MIN_MATCHES", "25"))
+DUPLICATE_MIN_SCORE = float(os.getenv("DUPLICATE_MIN_SCORE", "0.05"))
+
+
+def find_peaks(log_magnitude, frames_per_second):
+    """
+    Find the strongest local maxima of a spectrogram, at most PEAKS_PER_SECOND on average.
+
+    Parameters:
+        log_magnitude (ndarray): Log-magnitude spectrogram (bins, frames).
+        frames_per_second (float): STFT frame rate.
+
+    Returns:
+        tuple: Frame indices and bin indices of the peaks, sorted by frame.
+    """
+    df, dt = PEAK_NEIGHBOURHOOD
+    padded = np.pad(log_magnitude, ((df // 2, df // 2), (dt // 2, dt // 2)), constant_values=-np.inf)
+    # The rectangular maximum filter is separable: bins first, then frames
+    windows = np.lib.stride_tricks.sliding_window_view
+    local_max = windows(windows(padded, df, axis=0).max(axis=-1), dt, axis=1).max(axis=-1)
+    floor = np.median(log_magnitude)
+    bins, frames = np.nonzero((log_magnitude == local_max) & (log_magnitude > floor))
+
+    budget = max(1, int(PEAKS_PER_SECOND * log_magnitude.shape[1] / frames_per_second))
+    if len(frames) > budget:
+        strongest = np.argsort(log_magnitude[bins, frames])[-budget:]
+        bins, frames = bins[strongest], frames[strongest]
+    order = np.lexsort((bins, frames))
+    return frames[order], bins[order]
+
+
+def landmarks(audio, sample_rate):
+    """
+    Compute the landmark fingerprint of an audio signal.
+
+    Parameters:
+        audio (ndarray): Mono audio signal.
+        sample_rate (int): Sampling rate of the audio.
+
+    Returns:
+        list: (hash, anchor frame) tuples; frames are HOP_LENGTH samples at SAMPLE_RATE.
+    """
+    install_fft_backend()
+    audio = np.asarray(audio, dtype=np.float32)
+    if sample_rate != SAMPLE_RATE:
+        audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=SAMPLE_RATE, res_type="soxr_qq")
+    magnitude = np.abs(librosa.stft(audio, n_fft=N_FFT, hop_length=HOP_LENGTH))
+    log_magnitude = np.log(magnitude[:MAX_BIN] + 1e-6)
+    frames, bins = find_peaks(log_magnitude, SAMPLE_RATE / HOP_LENGTH)
+
+    pairs = []
+    for i in range(len(frames)):
+        last = np.searchsorted(frames, frames[i] + MAX_DELTA_FRAMES, side="right")
+        targets = [j for j in range(i + 1, last)
+                   if frames[j] > frames[i] and abs(int(bins[j]) - int(bins[i])) <= MAX_DELTA_BINS]
+        for j in targets[:FAN_OUT]:
+            # 9 bits per frequency, 6 bits for the time difference
+            fingerprint_hash = (int(bins[i]) << 15) | (int(bins[j]) << 6) | int(frames[j] - frames[i])
+            pairs.append((fingerprint_hash, int(frames[i])))
+    return pairs
+
+
+def rank_matches(query, postings, min_matches=DUPLICATE_MIN_MATCHES, min_score=DUPLICATE_MIN_SCORE):
+    """
+    Rank indexed songs by the number of query landmarks matching at one time offset.
+
+    Offsets one frame apart are counted together, since re-encoding can move a peak by
+    a frame.
+
+    Parameters:
+        query (list): (hash, frame) landmarks of the query.
+        postings (iterable): Index entries with 'hash', 'song_id' and 'offset' keys.
+        min_matches (int): Minimum number of aligned landmarks of a candidate.
+        min_score (float): Minimum fraction of the query's landmarks that must align.
+
+    Returns:
+        list: Candidates as dicts with 'song_id', 'matches', 'score' (fraction of the
+              query's landmarks) and 'offset_seconds' (position of the query in the
+              candidate), best first.
+    """
+    query_frames = {}
+    for fingerprint_hash, frame in query:
+        query_frames.setdefault(fingerprint_hash, []).append(frame)
+
+    histogram = Counter()
+    for posting in postings:
+        for frame in query_frames.get(posting["hash"], ()):
+            histogram[(str(posting["song_id"]), posting["offset"] - frame)] += 1
+
+    best = {}
+    for (song_id, delta), count in histogram.items():
+        aligned = count + histogram.get((song_id, delta + 1), 0)
+        if aligned > best.get(song_id, (0, 0))[0]:
+            best[song_id] = (aligned, delta)
+
+    total = max(1, len(query))
+    candidates = [
+        {"song_id": song_id, "matches": aligned, "score": round(aligned / total, 3),
+         "offset_seconds": round(delta * HOP_LENGTH / SAMPLE_RATE, 2)}
+        for song_id, (aligned, delta) in best.items()
+        if aligned >= min_matches and aligned / total >= min_score
+    ]
+    return sorted(candidates, key=lambda candidate: candidate["matches"], reverse=True)
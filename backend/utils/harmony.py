@@ -0,0 +1,404 @@
+"""
+Harmony engine for generating any number of vocal parts from a single source stem.
+
+This module provides utilities for:
+- Describing harmony voices as (name, interval in semitones) pairs, e.g. SATB and beyond.
+- Optionally snapping each voice to the scale of the song's detected musical key, so a
+  nominal third becomes a major or minor third depending on the melody note.
+- Analyzing the source stem once and rendering all required pitch shifts in parallel,
+  sharing renders between voices that need the same shift. With AUDIO_PROCESSES set,
+  the renders run in the audio process pool, reading the source and writing their
+  results through shared memory instead of pickled arrays.
+
+Dependencies:
+    - os: File path operations and CPU count.
+    - re: Validation of voice names, which become part of file names.
+    - concurrent.futures: Parallel rendering of pitch-shifted signals.
+    - shared_audio: Process-pool renders with signals passed by shared-memory handle.
+    - numpy: Vectorized voice assembly.
+    - librosa: Pitch tracking and pitch shifting, imported on first use.
+    - fft_backend.install_fft_backend: Installs librosa's FFT library before the first transform.
+    - stem_format.write_audio: Writing the rendered voices in the format of the source stem.
+    - render_cache.atomic_output, single_flight: Atomic replacement of existing voice files and
+      coalesced first renders of virtual voices.
+
+Functions:
+    - parse_key: Convert a key label into a tonic pitch class and scale.
+    - parse_voices: Validate a voice list received from a request.
+    - render_voices: Render harmony voice signals for a source stem.
+    - harmonize: Render harmony voices for a source stem and save them next to it.
+    - materialize_voice: Render a virtual harmony voice on first use.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import lazy_loader as lazy
+from .render_cache import atomic_output, single_flight
+from .stem_format import write_audio
+from .fft_backend import install_fft_backend
+from .cancellation import CancelToken
+from .shared_audio import SharedAudio, TransferReport, audio_pool, submit_shared
+
+librosa = lazy.load("librosa")
+
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]
+MINOR_SCALE = [0, 2, 3, 5, 7, 8, 10]
+
+# Voices recorded at upload for solo songs
+DEFAULT_VOICES = [("Alto", 4), ("Tenor", -5)]
+
+# Voice names end up in file names next to the source stem, so they must be plain tokens
+VOICE_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,31}")
+
+ANALYSIS_HOP_LENGTH = 512
+CROSSFADE_SECONDS = 0.02
+
+
+def parse_key(key):
+    """
+    Convert a key label into its tonic pitch class and scale.
+
+    Accepts the labels used across the backend: 'C#' for majors, 'C#m' for minors and
+    the 'C# #'-style minor labels produced by key_finder.
+
+    Parameters:
+        key (str): Musical key label.
+
+    Returns:
+        tuple: Tonic pitch class index (int) and list of scale degrees in semitones.
+    """
+    label = key.strip()
+    is_minor = label.endswith("m") or label.endswith(" #")
+    root = label.split(" ")[0].rstrip("m")
+    return PITCH_CLASSES.index(root), MINOR_SCALE if is_minor else MAJOR_SCALE
+
+
+def parse_voices(voices):
+    """
+    Validate a voice list received from a request.
+
+    Parameters:
+        voices (list): Items of the form {"name": str, "interval": int} or (name, interval).
+
+    Returns:
+        list: List of (name, interval) tuples.
+
+    Raises:
+        ValueError: If an item is malformed, a name is not a plain token (letters,
+            digits, '_' and '-', up to 32 characters) or two voices share a name
+            (compared case-insensitively, as file names may be).
+    """
+    parsed = []
+    names = set()
+    for voice in voices:
+        if isinstance(voice, dict):
+            name, interval = voice.get("name"), voice.get("interval")
+        else:
+            name, interval = voice
+        if not name or interval is None:
+            raise ValueError(f"Invalid harmony voice: {voice}")
+        if not VOICE_NAME_PATTERN.fullmatch(str(name)):
+            raise ValueError(f"Invalid harmony voice name: {name!r}")
+        if str(name).casefold() in names:
+            raise ValueError(f"Duplicate harmony voice name: {name!r}")
+        names.add(str(name).casefold())
+        parsed.append((str(name), int(interval)))
+    return parsed
+
+
+def analyze_melody(audio, sample_rate):
+    """
+    Track the melody of a vocal stem as rounded MIDI notes per analysis frame.
+
+    Unvoiced frames hold the previous note so voices do not jump between phrases.
+
+    Parameters:
+        audio (ndarray): Audio time series of the source stem.
+        sample_rate (int): Sampling rate of the audio.
+
+    Returns:
+        ndarray: Rounded MIDI note per frame, NaN before the first voiced frame.
+    """
+    install_fft_backend()
+    f0 = librosa.yin(
+        audio, fmin=librosa.note_to_hz("C2"), fmax=librosa.note_to_hz("C6"),
+        sr=sample_rate, hop_length=ANALYSIS_HOP_LENGTH,
+    )
+    rms = librosa.feature.rms(y=audio, hop_length=ANALYSIS_HOP_LENGTH)[0][:len(f0)]
+    voiced = rms > 0.1 * np.max(rms) if rms.size and np.max(rms) > 0 else np.zeros(len(f0), dtype=bool)
+
+    notes = np.where(voiced, np.round(librosa.hz_to_midi(f0)), np.nan)
+    # Forward-fill unvoiced frames with the last voiced note
+    index = np.where(~np.isnan(notes), np.arange(len(notes)), 0)
+    np.maximum.accumulate(index, out=index)
+    return notes[index]
+
+
+def diatonic_shifts(notes, interval, key):
+    """
+    Compute the per-frame semitone shift that lands a voice on the key's scale.
+
+    The target of each frame is the melody note plus the nominal interval, snapped to the
+    nearest scale tone (ties resolve towards the melody).
+
+    Parameters:
+        notes (ndarray): Rounded MIDI note per frame.
+        interval (int): Nominal interval of the voice in semitones.
+        key (str): Musical key label of the song.
+
+    Returns:
+        ndarray: Integer semitone shift per frame.
+    """
+    tonic, scale = parse_key(key)
+    scale_classes = np.array([(tonic + degree) % 12 for degree in scale])
+
+    targets = np.nan_to_num(notes, nan=0.0) + interval
+    # Distance from each target to every scale tone, wrapped to [-6, 6)
+    offsets = (scale_classes[None, :] - targets[:, None] % 12 + 6) % 12 - 6
+    order = np.lexsort((np.sign(offsets) == np.sign(interval), np.abs(offsets)), axis=-1)
+    best = offsets[np.arange(len(targets)), order[:, 0]]
+
+    shifts = (interval + best).astype(int)
+    shifts[np.isnan(notes)] = interval
+    return shifts
+
+
+def voice_path_for(source_path, name):
+    """
+    Build the output path of a harmony voice next to its source stem.
+
+    Parameters:
+        source_path (str): Path to the source (Soprano) stem.
+        name (str): Name of the voice.
+
+    Returns:
+        str: Path of the voice file.
+
+    Raises:
+        ValueError: If the name is not a plain token, so it cannot leave the folder.
+    """
+    if not VOICE_NAME_PATTERN.fullmatch(str(name)):
+        raise ValueError(f"Invalid harmony voice name: {name!r}")
+    folder, filename = os.path.split(source_path)
+    if "Soprano" in filename:
+        return os.path.join(folder, filename.replace("Soprano", name))
+    base, ext = os.path.splitext(filename)
+    return os.path.join(folder, f"{base}_{name}{ext}")
+
+
+def _voice_from_renders(renders, frame_shifts, length, sample_rate):
+    """
+    Assemble a voice from shared renders, crossfading where the frame shift changes.
+
+    Parameters:
+        renders (dict): Rendered signals keyed by semitone shift.
+        frame_shifts (ndarray): Semitone shift per analysis frame.
+        length (int): Number of samples in the output.
+        sample_rate (int): Sampling rate of the renders.
+
+    Returns:
+        ndarray: Assembled voice signal.
+    """
+    distinct = np.unique(frame_shifts)
+    if len(distinct) == 1:
+        return renders[int(distinct[0])]
+
+    sample_shifts = np.repeat(frame_shifts, ANALYSIS_HOP_LENGTH)[:length]
+    sample_shifts = np.pad(sample_shifts, (0, length - len(sample_shifts)), mode="edge")
+
+    fade = np.hanning(max(3, int(CROSSFADE_SECONDS * sample_rate)))
+    fade /= fade.sum()
+
+    voice = np.zeros(length, dtype=np.float32)
+    for shift in distinct:
+        weight = np.convolve((sample_shifts == shift).astype(np.float32), fade, mode="same")
+        voice += weight * renders[int(shift)][:length]
+    return voice
+
+
+def _pitch_shift_shared(source_handle, output_handle, sample_rate, shift):
+    # Runs in an audio pool process: reads the source and writes the render in place
+    source, output = SharedAudio.attach(source_handle), SharedAudio.attach(output_handle)
+    try:
+        install_fft_backend()
+        output.array[...] = librosa.effects.pitch_shift(source.array, sr=sample_rate, n_steps=shift)
+    finally:
+        source.release()
+        output.release()
+
+
+def _render_in_processes(audio, sample_rate, shifts, token, report):
+    """
+    Render pitch shifts in the audio process pool through shared memory.
+
+    Parameters:
+        audio (ndarray): Source signal, copied once into a shared block.
+        sample_rate (int): Sampling rate of the source.
+        shifts (list): Non-zero semitone shifts to render.
+        token (CancelToken): Checked before each render and while waiting for them.
+        report (TransferReport): Counts the arrays passed by handle.
+
+    Returns:
+        dict: SharedAudio render per shift; the caller releases them.
+    """
+    source = SharedAudio.from_array(np.asarray(audio, dtype=np.float32), report)
+    outputs, futures = {}, []
+    try:
+        for shift in shifts:
+            token.check()
+            outputs[shift] = SharedAudio.allocate(source.array.shape, np.float32)
+            # The render writes its result into the block instead of returning it pickled
+            report.copied(outputs[shift].array.nbytes)
+            futures.append(submit_shared(_pitch_shift_shared, [source, outputs[shift]], sample_rate, shift,
+                                         report=report))
+        for future in futures:
+            token.check()
+            future.result()
+        return outputs
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        for output in outputs.values():
+            output.release()
+        raise
+    finally:
+        source.release()
+
+
+def render_voices(source_path, voices, key=None, diatonic=False, max_workers=None, token=None):
+    """
+    Render harmony voice signals for a source stem without writing them.
+
+    The source is loaded and pitch-tracked once; every distinct semitone shift needed by
+    any voice is rendered once, in parallel, and reused by all voices that need it.
+    Several shifts are rendered in the audio process pool when AUDIO_PROCESSES is set,
+    otherwise on threads.
+
+    Parameters:
+        source_path (str): Path to the source (Soprano) stem.
+        voices (list): List of (name, interval) tuples.
+        key (str): Musical key of the song, required when diatonic is True.
+        diatonic (bool): Whether to snap voices to the scale of the key.
+        max_workers (int): Maximum number of parallel renders.
+        token (CancelToken): Checked before each render; renders not yet started are
+            abandoned once it is cancelled.
+
+    Returns:
+        tuple: Voice signals keyed by voice name (dict) and their sampling rate (int).
+    """
+    # Imported here to avoid a circular import with audio_processing
+    from .audio_processing import load_song
+
+    token = token or CancelToken()
+    if diatonic and not key:
+        raise ValueError("A musical key is required for diatonic harmony")
+
+    audio, sample_rate = load_song(source_path)
+
+    if diatonic:
+        notes = analyze_melody(audio, sample_rate)
+        voice_shifts = {name: diatonic_shifts(notes, interval, key) for name, interval in voices}
+    else:
+        voice_shifts = {name: np.array([interval]) for name, interval in voices}
+
+    shifts = sorted({int(shift) for frame_shifts in voice_shifts.values() for shift in np.unique(frame_shifts)})
+    max_workers = max_workers or min(len(shifts), os.cpu_count() or 1)
+
+    pool_shifts = [shift for shift in shifts if shift != 0]
+    if audio_pool() is not None and len(pool_shifts) > 1:
+        report = TransferReport()
+        shared_renders = _render_in_processes(audio, sample_rate, pool_shifts, token, report)
+        try:
+            renders = {shift: shared.array for shift, shared in shared_renders.items()}
+            shared_ids = {id(render) for render in renders.values()}
+            if 0 in shifts:
+                renders[0] = np.asarray(audio, dtype=np.float32)
+            signals = {}
+            for name, _ in voices:
+                signal = _voice_from_renders(renders, voice_shifts[name], len(audio), sample_rate)
+                # A voice with a single shift is the render itself; it must outlive the block
+                signals[name] = signal.copy() if id(signal) in shared_ids else signal
+        finally:
+            renders = None
+            for shared in shared_renders.values():
+                shared.release()
+        print(f"Harmony renders passed through shared memory: {report.as_dict()}")
+        return signals, sample_rate
+
+    def render(shift):
+        token.check()
+        if shift == 0:
+            return np.asarray(audio, dtype=np.float32)
+        install_fft_backend()
+        return librosa.effects.pitch_shift(audio, sr=sample_rate, n_steps=shift)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        renders = dict(zip(shifts, executor.map(render, shifts)))
+
+    return {name: _voice_from_renders(renders, voice_shifts[name], len(audio), sample_rate)
+            for name, _ in voices}, sample_rate
+
+
+def harmonize(source_path, voices=None, key=None, diatonic=False, max_workers=None, token=None):
+    """
+    Render harmony voices for a source stem and save them next to it.
+
+    Parameters:
+        source_path (str): Path to the source (Soprano) stem.
+        voices (list): List of (name, interval) tuples. Defaults to Alto and Tenor.
+        key (str): Musical key of the song, required when diatonic is True.
+        diatonic (bool): Whether to snap voices to the scale of the key.
+        max_workers (int): Maximum number of parallel renders.
+        token (CancelToken): Checked before each render and before writing each voice.
+
+    Returns:
+        dict: Paths to the generated voices keyed by voice name.
+    """
+    source_path = source_path.replace("%23", "#")
+    voices = voices or DEFAULT_VOICES
+    token = token or CancelToken()
+    signals, sample_rate = render_voices(source_path, voices, key, diatonic, max_workers, token)
+
+    paths = {}
+    for name, _ in voices:
+        token.check()
+        voice_path = voice_path_for(source_path, name)
+        with atomic_output(voice_path) as tmp_path:
+            write_audio(tmp_path, signals[name], sample_rate)
+        paths[name] = voice_path
+
+    return paths
+
+
+def materialize_voice(source_path, name, interval, key=None, diatonic=False, token=None):
+    """
+    Render a virtual harmony voice on first use.
+
+    Songs record their default harmony voices at upload without rendering them; the
+    first request for a voice renders it once, even when several requests (or
+    processes) ask for it at the same time, and later requests find the file.
+
+    Parameters:
+        source_path (str): Path to the source (Soprano) stem.
+        name (str): Name of the voice.
+        interval (int): Interval of the voice in semitones.
+        key (str): Musical key of the song, required when diatonic is True.
+        diatonic (bool): Whether to snap the voice to the scale of the key.
+        token (CancelToken): Optional token checked before and during the render.
+
+    Returns:
+        str: Path of the voice file.
+    """
+    source_path = source_path.replace("%23", "#")
+    voice_path = voice_path_for(source_path, name)
+
+    def render(tmp_path):
+        signals, sample_rate = render_voices(source_path, [(name, interval)], key, diatonic, token=token)
+        write_audio(tmp_path, signals[name], sample_rate)
+
+    if single_flight(voice_path, render):
+        print(f"Virtual voice {name} rendered as: {voice_path}")
+    return voice_path
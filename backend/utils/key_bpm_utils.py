@@ -4,103 +4,199 @@ Audio processing module for analyzing, modifying, and calculating musical proper
 This module provides functions for:
 - Determining the musical key of an audio file.
 - Changing the pitch of an audio file to match a new key.
-- Estimating the beats-per-minute (BPM) of an audio file.
-- Modifying the BPM of an audio file.
+- Modifying the BPM of an audio file, and checking the result against the song's beat grid.
+- Rendering quick, lower-quality previews of a short region of a key or BPM change.
 - Calculating new musical keys based on transposition values.
 
 Dependencies:
-    - os: File and directory path operations.
-    - madmom: Tempo and beat detection.
+    - beat_analysis: The stored beat analysis used to verify BPM-changed renders.
     - ffmpeg: Audio manipulation, particularly for tempo adjustment.
     - librosa: Audio loading, harmonic-percussive separation, and pitch shifting.
-    - soundfile: Writing audio files in various formats.
+    - stem_format.write_audio: Writing variants in the format of their source stem.
+    - fft_backend.install_fft_backend: Installs librosa's FFT library before the first transform.
+    - lazy_loader: Defers importing ffmpeg and librosa until first use.
+    - render_cache.single_flight: Coalesced, atomically written variant renders.
+    - cancellation.CancelToken: Abandons renders whose client left or whose deadline passed.
+    - storage.get_storage: Fetches ffmpeg sources missing on this node.
+    - threading: Checks BPM-changed renders after the render, off the request.
+    - math: Rejecting non-finite preview lengths.
 """
 
 import os
-import madmom
-import ffmpeg
-import librosa
-import soundfile as sf
+import math
+import threading
+import lazy_loader as lazy
 from . import key_finder
+from .beat_analysis import beat_analysis_path, load_beat_analysis, verify_tempo_change
 from .path_utils import update_key_in_path, update_bpm_in_path, encode_special_chars
+from .render_cache import single_flight
+from .cancellation import CancelToken, Cancelled
+from .storage import get_storage
+from .stem_format import write_audio
+from .fft_backend import install_fft_backend
 
-def get_key(audio, sample_rate):
+ffmpeg = lazy.load("ffmpeg")
+librosa = lazy.load("librosa")
+
+PREVIEW_DIR = ".preview"
+PREVIEW_SECONDS = float(os.getenv("PREVIEW_SECONDS", "20"))
+# Fastest soxr quality; previews trade resampling accuracy for latency
+PREVIEW_RES_TYPE = "soxr_qq"
+# Seconds between cancellation checks while ffmpeg runs
+FFMPEG_POLL_SECONDS = 0.2
+# Fraction of expected beats a BPM-changed render must hit before a warning is logged
+TEMPO_CHECK_THRESHOLD = float(os.getenv("TEMPO_CHECK_THRESHOLD", "0.5"))
+TEMPO_CHECK_SAMPLE_RATE = 22050
+
+
+def run_ffmpeg(stream, token=None):
+    """
+    Run an ffmpeg command, killing it if the token is cancelled.
+
+    Parameters:
+        stream: ffmpeg-python output stream to run.
+        token (CancelToken): Optional token polled while ffmpeg runs.
+
+    Returns:
+        None
+
+    Raises:
+        Cancelled: If the token was cancelled; the process is killed first.
+        ffmpeg.Error: If ffmpeg exits with a non-zero status.
+    """
+    token = token or CancelToken()
+    token.check()
+    process = stream.global_args("-loglevel", "error").run_async()
+    while process.poll() is None:
+        if token.wait(FFMPEG_POLL_SECONDS):
+            process.kill()
+            process.wait()
+            raise Cancelled(token.reason)
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, None)
+
+def get_key(audio, sample_rate, audio_harmonic=None):
     """
     Determines the musical key of an audio file.
 
     Parameters:
         audio (ndarray): Audio time series data.
         sample_rate (int): Sampling rate of the audio file.
+        audio_harmonic (ndarray): Harmonic part of the audio if already separated (e.g. by
+            the feature engine); computed with HPSS otherwise.
 
     Returns:
         str: The estimated musical key of the audio.
     """
-    audio_harmonic, _ = librosa.effects.hpss(audio)
+    install_fft_backend()
+    if audio_harmonic is None:
+        audio_harmonic, _ = librosa.effects.hpss(audio)
     return key_finder.Tonal_Fragment(audio_harmonic, sample_rate).get_key()
 
-def change_key(audio, sample_rate, value, current_audio_path, new_key):
+def change_key(audio, sample_rate, value, current_audio_path, new_key, token=None):
     """
     Shifts the pitch of an audio file to a new key if it does not already exist.
 
+    Concurrent requests for the same stem and key share one render, and the output is
+    only visible once it has been completely written.
+
     Parameters:
         audio (ndarray): Audio time series data.
         sample_rate (int): Sampling rate of the audio.
         value (int): Number of semitones to shift the pitch.
         current_audio_path (str): Path to the original audio file.
         new_key (str): The target musical key after pitch shifting.
+        token (CancelToken): Optional token checked before and after the pitch shift.
 
     Returns:
         str: Path to the pitch-shifted audio file.
     """
     output_path, output_path_url = update_key_in_path(current_audio_path, new_key)
-    if os.path.exists(output_path):
-        print(f"File already exists: {output_path}")
-        return output_path_url
+    token = token or CancelToken()
 
-    # Perform pitch shifting
-    y_shifted = librosa.effects.pitch_shift(y=audio, sr=sample_rate, n_steps=value, bins_per_octave=12)
-    sf.write(output_path, y_shifted, sample_rate)
-    
-    print(f"Pitch-shifted audio saved as: {output_path}")
+    def render(tmp_path):
+        token.check()
+        install_fft_backend()
+        # Perform pitch shifting
+        y_shifted = librosa.effects.pitch_shift(y=audio, sr=sample_rate, n_steps=value, bins_per_octave=12)
+        token.check()
+        write_audio(tmp_path, y_shifted, sample_rate)
+
+    if single_flight(output_path, render):
+        print(f"Pitch-shifted audio saved as: {output_path}")
+    else:
+        print(f"File already exists: {output_path}")
     return output_path_url
 
-def get_bpm(filename):
+def check_tempo_change(source_path, rendered_path, value_bpm):
     """
-    Estimates the beats-per-minute (BPM) of an audio file.
+    Verify a BPM-changed render against the stored beat analysis of its song.
+
+    The stored beat grid is scaled to the target BPM and compared with the render's
+    onsets (beat_analysis.verify_tempo_change), so no beat RNN runs on the render.
 
     Parameters:
-        filename (str): Path to the audio file.
+        source_path (str): Path of the stem the render was made from; the analysis is
+            looked up in its folder.
+        rendered_path (str): Path of the rendered file.
+        value_bpm (int): Target BPM of the render.
 
     Returns:
-        int: The estimated BPM of the audio file.
+        float: Fraction of expected beats on an onset, or None without a stored analysis.
     """
-    tempo_estimator = madmom.features.tempo.TempoEstimationProcessor(fps=100)
-    beat_processor = madmom.features.beats.RNNBeatProcessor()(filename)
-    estimated_tempo = tempo_estimator(beat_processor)
-    return round(estimated_tempo[0][0])
+    analysis_path = beat_analysis_path(os.path.dirname(source_path))
+    if not get_storage().ensure_local(analysis_path):
+        return None
+    analysis = load_beat_analysis(analysis_path)
+    ratio = value_bpm / float(analysis["tempo_candidates"][0][0])
+    audio, sample_rate = librosa.load(rendered_path, sr=TEMPO_CHECK_SAMPLE_RATE, mono=True)
+    score = verify_tempo_change(analysis, audio, sample_rate, ratio)
+    if score < TEMPO_CHECK_THRESHOLD:
+        print(f"Warning: only {score:.0%} of the expected beats of {source_path} at {value_bpm} BPM fall on onsets")
+    else:
+        print(f"Tempo change of {source_path} to {value_bpm} BPM verified ({score:.0%} of expected beats)")
+    return score
 
-def change_bpm(current_audio_path, current_bpm, value_bpm):
+def change_bpm(current_audio_path, current_bpm, value_bpm, token=None, verify=False):
     """
     Changes the BPM of an audio file and saves it as a new file.
 
+    Concurrent requests for the same stem and BPM share one render, and the output is
+    only visible once it has been completely written.
+
     Parameters:
         current_audio_path (str): Path to the original audio file.
         current_bpm (int): The current BPM of the audio file.
         value_bpm (int): The target BPM for the modified audio.
+        token (CancelToken): Optional token; ffmpeg is killed once it is cancelled.
+        verify (bool): Whether to check a new render against the song's stored beat grid
+            (see check_tempo_change). The check runs in a background thread once the
+            render is published, so neither the caller nor waiters on the render cache
+            lock wait for it; the result is logged.
 
     Returns:
         str: Path to the BPM-modified audio file.
     """
     current_audio_path, output_path = update_bpm_in_path(current_audio_path, value_bpm)
+    tempo_change = round((value_bpm / current_bpm), 4)
 
-    if os.path.exists(output_path):
-        print(f"File already exists: {output_path}")
-        return encode_special_chars(output_path)
+    def render(tmp_path):
+        get_storage().ensure_local(current_audio_path)
+        run_ffmpeg(ffmpeg.input(current_audio_path).filter('atempo', tempo_change).output(tmp_path).overwrite_output(),
+                   token)
 
-    tempo_change = round((value_bpm / current_bpm), 4)
-    ffmpeg.input(current_audio_path).filter('atempo', tempo_change).output(output_path).overwrite_output().run()
-    
-    print(f"Modified audio saved as '{output_path}'")
+    def verify_render():
+        try:
+            check_tempo_change(current_audio_path, output_path, value_bpm)
+        except Exception as e:
+            print(f"Tempo check of {output_path} failed: {e}")
+
+    if single_flight(output_path, render):
+        print(f"Modified audio saved as '{output_path}'")
+        if verify:
+            threading.Thread(target=verify_render, daemon=True).start()
+    else:
+        print(f"File already exists: {output_path}")
     return encode_special_chars(output_path)
 
 
@@ -123,4 +219,125 @@ def calculate_new_key(current_key, value):
         return minor_key_list[new_index]
     else:
         new_index = (major_key_list.index(current_key) + value) % 12
-        return major_key_list[new_index]
\ No newline at end of file
+        return major_key_list[new_index]
+
+
+def preview_length(seconds=None):
+    """
+    Parse the requested length of a preview, clamped to [1, 2 * PREVIEW_SECONDS].
+
+    Parameters:
+        seconds: Requested length in seconds (number or numeric string), or None for
+            PREVIEW_SECONDS.
+
+    Returns:
+        float: Length of the preview in seconds.
+
+    Raises:
+        ValueError: If the length is not a finite number.
+    """
+    if seconds is None or seconds == "":
+        return PREVIEW_SECONDS
+    try:
+        length = float(seconds)
+    except (TypeError, ValueError):
+        length = math.nan
+    if not math.isfinite(length):
+        raise ValueError(f"Invalid preview length: {seconds!r}")
+    return min(max(length, 1.0), 2 * PREVIEW_SECONDS)
+
+
+def preview_window(duration, playhead=None, seconds=PREVIEW_SECONDS):
+    """
+    Choose the region of a song to preview.
+
+    Previews start at the beginning of the song, or a little before the playhead so the
+    listener hears the change from where they are.
+
+    Parameters:
+        duration (float): Length of the song in seconds.
+        playhead (float): Current playback position in seconds, or None.
+        seconds (float): Length of the preview in seconds.
+
+    Returns:
+        tuple: Start and length of the preview in whole seconds.
+    """
+    start = 0
+    if playhead:
+        start = int(max(0.0, min(float(playhead) - 2.0, duration - seconds)))
+    return start, int(seconds)
+
+
+def preview_path(output_path, start, seconds):
+    """
+    Derive the path of a preview from the path of the full render.
+
+    Parameters:
+        output_path (str): Path of the full-quality render.
+        start (int): Start of the preview in seconds.
+        seconds (int): Length of the preview in seconds.
+
+    Returns:
+        str: Path of the preview in the song's preview folder.
+    """
+    folder, filename = os.path.split(output_path)
+    base, ext = os.path.splitext(filename)
+    os.makedirs(os.path.join(folder, PREVIEW_DIR), exist_ok=True)
+    return os.path.join(folder, PREVIEW_DIR, f"{base}_{start}s_{seconds}s{ext}")
+
+
+def change_key_preview(audio, sample_rate, value, current_audio_path, new_key, start, seconds):
+    """
+    Pitch-shift a short region of an audio file with a fast, lower-quality resampler.
+
+    Parameters:
+        audio (ndarray): Audio time series data of the whole stem.
+        sample_rate (int): Sampling rate of the audio.
+        value (int): Number of semitones to shift the pitch.
+        current_audio_path (str): Path to the original audio file.
+        new_key (str): The target musical key after pitch shifting.
+        start (int): Start of the preview in seconds.
+        seconds (int): Length of the preview in seconds.
+
+    Returns:
+        str: URL-encoded path to the preview.
+    """
+    output_path, _ = update_key_in_path(current_audio_path, new_key)
+    path = preview_path(output_path, start, seconds)
+    region = audio[start * sample_rate:(start + seconds) * sample_rate]
+
+    def render(tmp_path):
+        install_fft_backend()
+        y_shifted = librosa.effects.pitch_shift(y=region, sr=sample_rate, n_steps=value, bins_per_octave=12,
+                                                res_type=PREVIEW_RES_TYPE)
+        write_audio(tmp_path, y_shifted, sample_rate)
+
+    single_flight(path, render)
+    return encode_special_chars(path)
+
+
+def change_bpm_preview(current_audio_path, current_bpm, value_bpm, start, seconds):
+    """
+    Change the BPM of a short region of an audio file.
+
+    Parameters:
+        current_audio_path (str): Path to the original audio file.
+        current_bpm (int): The current BPM of the audio file.
+        value_bpm (int): The target BPM for the modified audio.
+        start (int): Start of the preview in seconds of the original audio.
+        seconds (int): Length of the original region in seconds.
+
+    Returns:
+        str: URL-encoded path to the preview.
+    """
+    current_audio_path, output_path = update_bpm_in_path(current_audio_path, value_bpm)
+    path = preview_path(output_path, start, seconds)
+    tempo_change = round((value_bpm / current_bpm), 4)
+
+    def render(tmp_path):
+        get_storage().ensure_local(current_audio_path)
+        run_ffmpeg(ffmpeg.input(current_audio_path, ss=start, t=seconds)
+                   .filter('atempo', tempo_change).output(tmp_path).overwrite_output())
+
+    single_flight(path, render)
+    return encode_special_chars(path)
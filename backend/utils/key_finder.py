@@ -10,9 +10,11 @@
 #     sr: sampling rate of the mp3, which can be obtained when the file is read with librosa
 #     tstart and tend: the range in seconds of the file to be analyzed; default to the beginning and end of file if not specified
 
-import librosa
+import lazy_loader as lazy
 import numpy as np
 
+librosa = lazy.load("librosa")
+
 class Tonal_Fragment(object):
     def __init__(self, waveform, sr, tstart=None, tend=None):
         self.waveform = waveform
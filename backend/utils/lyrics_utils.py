@@ -3,22 +3,63 @@ Lyrics extraction module using Whisper for automatic transcription.
 
 This module provides utilities for:
 - Transcribing audio files to text, using Whisper's speech recognition capabilities.
+- Reporting transcription progress chunk by chunk.
 - Formatting extracted text into a readable lyrics format with line breaks.
 
 Dependencies:
     - re: Regular expressions for splitting text by sentence boundaries.
-    - whisper: Whisper ASR model for transcription of audio files to text.
+    - whisper: Whisper ASR model for transcription of audio files to text, imported on first use.
     - textwrap: Text formatting to limit line width.
+    - storage.get_storage: Fetches the audio file if this node has no local copy.
 
 Functions:
+    - transcribe_in_chunks: Transcribes audio chunk by chunk with progress reporting.
     - extract_lyrics: Transcribes an audio file and formats the extracted text into structured lyrics.
 """
 
 import re
-import whisper
 import textwrap
+import lazy_loader as lazy
+from .progress import NullProgress
+from .cancellation import CancelToken
+from .storage import get_storage
 
-def extract_lyrics(path):
+whisper = lazy.load("whisper")
+
+TRANSCRIPTION_CHUNK_SECONDS = 120
+PROMPT_CHARACTERS = 200
+
+def transcribe_in_chunks(model, path, progress, token=None):
+    """
+    Transcribes an audio file chunk by chunk, reporting the fraction of audio done.
+
+    Each chunk is prompted with the end of the previous chunk's text so the model keeps
+    its context across chunk boundaries.
+
+    Parameters:
+        model: Loaded Whisper model.
+        path (str): The file path of the audio file to transcribe.
+        progress (ProgressReporter): Reporter receiving the fraction of chunks done.
+        token (CancelToken): Checked before every chunk.
+
+    Returns:
+        str: Raw transcribed text.
+    """
+    token = token or CancelToken()
+    audio = whisper.load_audio(path)
+    chunk = TRANSCRIPTION_CHUNK_SECONDS * whisper.audio.SAMPLE_RATE
+    starts = range(0, len(audio), chunk)
+
+    texts = []
+    for index, start in enumerate(starts):
+        token.check()
+        prompt = texts[-1][-PROMPT_CHARACTERS:] if texts else None
+        texts.append(model.transcribe(audio[start:start + chunk], initial_prompt=prompt).get('text', '').strip())
+        progress.update((index + 1) / len(starts))
+
+    return " ".join(text for text in texts if text)
+
+def extract_lyrics(path, progress=None, token=None):
     """
     Transcribes an audio file to extract lyrics, and formats them with line breaks for readability.
 
@@ -27,12 +68,17 @@ def extract_lyrics(path):
 
     Parameters:
         path (str): The file path of the audio file to transcribe.
+        progress (ProgressReporter): Optional reporter for the transcription progress.
+        token (CancelToken): Optional token checked between transcription chunks.
 
     Returns:
         str: Formatted lyrics as a string, with line breaks at appropriate sentence boundaries.
     """
+    progress = progress or NullProgress()
     model = whisper.load_model("turbo")
-    result = model.transcribe(path).get('text')
+    with progress.stage("transcribe"):
+        get_storage().ensure_local(path)
+        result = transcribe_in_chunks(model, path.replace("%23", "#"), progress, token)
     
     # Split by punctuation (., !, ?) to maintain sentence structure
     sentences = re.split(r'(?<=[.!?]) +', result)
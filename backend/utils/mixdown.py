@@ -0,0 +1,164 @@
+"""
+Stem mixdown module for serving a song as one compressed stream with per-stem gains.
+
+Instead of sending every stem to the client and mixing there, the stems are mixed on
+the server in a single streaming pass and encoded to OGG Vorbis or MP3:
+- Stems are read block by block, so memory stays bounded by the block size.
+- Stems at a different sampling rate (e.g. harmony voices rendered at the analysis rate)
+  are resampled on the fly with a streaming resampler.
+- Gains are quantized to GAIN_STEP, so slider positions map to a small set of mixes and
+  the encoded result can be cached on disk by its parameters.
+
+Dependencies:
+    - os: File path operations.
+    - numpy: Vectorized mixing of audio blocks.
+    - soundfile (sf): Block-wise reading and compressed encoding.
+    - soxr: Streaming resampling of stems at a different sampling rate.
+    - render_cache.single_flight: Coalesced, atomically written mix renders.
+    - storage.get_storage: Fetches stems this node has no local copy of.
+
+Functions:
+    - quantize_gain: Snap a requested gain to the cacheable grid.
+    - mix_cache_path: Derive the cache path of a mix from its parameters.
+    - mix_stems: Mix stems with gains into a compressed file in one streaming pass.
+    - render_mix: Render a mix once and reuse it for identical requests.
+"""
+
+import os
+import numpy as np
+import soundfile as sf
+import lazy_loader as lazy
+from .render_cache import single_flight
+from .storage import get_storage
+
+soxr = lazy.load("soxr")
+
+MIX_DIR = ".mix"
+GAIN_STEP = 0.05
+MAX_GAIN = 2.0
+MIX_BLOCK_FRAMES = 65536
+# Output format name -> (soundfile format, subtype, MIME type)
+MIX_FORMATS = {
+    "ogg": ("OGG", "VORBIS", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", "audio/mpeg"),
+}
+
+
+def quantize_gain(gain):
+    """
+    Clamp a gain to [0, MAX_GAIN] and snap it to the nearest multiple of GAIN_STEP.
+
+    Parameters:
+        gain (float): Requested linear gain.
+
+    Returns:
+        float: Quantized gain.
+    """
+    steps = round(min(max(float(gain), 0.0), MAX_GAIN) / GAIN_STEP)
+    return round(steps * GAIN_STEP, 2)
+
+
+def mix_cache_path(folder, gains, key_shift=0, bpm=None, fmt="ogg"):
+    """
+    Derive the cache path of a mix from its parameter tuple.
+
+    Parameters:
+        folder (str): Upload folder of the song.
+        gains (dict): Quantized gain per stem name.
+        key_shift (int): Semitone shift applied to every stem.
+        bpm (int): Target BPM, or None for the original tempo.
+        fmt (str): Output format, a key of MIX_FORMATS.
+
+    Returns:
+        str: Path of the cached mix.
+    """
+    gain_part = "_".join(f"{name}{round(gain / GAIN_STEP)}" for name, gain in sorted(gains.items()))
+    return os.path.join(folder, MIX_DIR, f"mix_{gain_part}_k{key_shift}_b{bpm or 0}.{fmt}")
+
+
+def _stem_blocks(path, sample_rate, block_frames):
+    """
+    Yield a stem as 2D float32 blocks of block_frames frames at the given sampling rate.
+
+    Parameters:
+        path (str): Path to the stem.
+        sample_rate (int): Sampling rate of the yielded blocks.
+        block_frames (int): Frames per yielded block; the last block may be shorter.
+    """
+    with sf.SoundFile(path) as stem:
+        resampler = None
+        if stem.samplerate != sample_rate:
+            resampler = soxr.ResampleStream(stem.samplerate, sample_rate, stem.channels, dtype="float32")
+        read_frames = block_frames if resampler is None else int(block_frames * stem.samplerate / sample_rate) + 1
+
+        pending = np.zeros((0, stem.channels), dtype=np.float32)
+        while True:
+            block = stem.read(read_frames, dtype="float32", always_2d=True)
+            last = len(block) < read_frames
+            if resampler is not None:
+                chunk = block if stem.channels > 1 else block[:, 0]
+                block = resampler.resample_chunk(chunk, last=last).reshape(-1, stem.channels)
+            pending = np.concatenate([pending, block])
+            while len(pending) >= block_frames:
+                yield pending[:block_frames]
+                pending = pending[block_frames:]
+            if last:
+                break
+        if len(pending):
+            yield pending
+
+
+def mix_stems(stems, output_path, fmt="ogg", block_frames=MIX_BLOCK_FRAMES):
+    """
+    Mix stems with per-stem gains into one compressed stereo file in a single pass.
+
+    Stems are mixed at the highest sampling rate among them; mono stems are spread to
+    both channels and shorter stems are padded with silence.
+
+    Parameters:
+        stems (list): (path, gain) tuples; stems with a gain of 0 are not read.
+        output_path (str): Path of the encoded mix.
+        fmt (str): Output format, a key of MIX_FORMATS.
+        block_frames (int): Frames mixed per block.
+    """
+    audible = [(path, gain) for path, gain in stems if gain > 0] or stems[:1]
+    for path, _ in audible:
+        get_storage().ensure_local(path)
+    sample_rate = max(sf.info(path).samplerate for path, _ in audible)
+    sources = [(_stem_blocks(path, sample_rate, block_frames), gain) for path, gain in audible]
+    file_format, subtype, _ = MIX_FORMATS[fmt]
+
+    with sf.SoundFile(output_path, "w", samplerate=sample_rate, channels=2,
+                      format=file_format, subtype=subtype) as output:
+        while sources:
+            mixed = np.zeros((block_frames, 2), dtype=np.float32)
+            length = 0
+            for source in list(sources):
+                blocks, gain = source
+                block = next(blocks, None)
+                if block is None:
+                    sources.remove(source)
+                    continue
+                # Mono blocks broadcast to both channels, multichannel blocks use the first two
+                mixed[:len(block)] += gain * block[:, :2]
+                length = max(length, len(block))
+            if length:
+                output.write(np.clip(mixed[:length], -1.0, 1.0))
+
+
+def render_mix(stems, output_path, fmt="ogg"):
+    """
+    Render a mix to its cache path unless it already exists or is being rendered.
+
+    Parameters:
+        stems (list): (path, gain) tuples.
+        output_path (str): Cache path derived by mix_cache_path.
+        fmt (str): Output format, a key of MIX_FORMATS.
+
+    Returns:
+        str: Path of the cached mix.
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if single_flight(output_path, lambda tmp_path: mix_stems(stems, tmp_path, fmt)):
+        print(f"Mix saved as: {output_path}")
+    return output_path
@@ -0,0 +1,216 @@
+"""
+Progress reporting module for long-running jobs such as uploads and transcription.
+
+Progress is computed from the stages a job actually completes, weighted by how long each
+stage historically takes for a song of the same length, and is emitted only to the
+Socket.IO room of the job, so concurrent uploads never see each other's progress.
+
+This module provides utilities for:
+- Tracking stages and sub-progress within a stage (e.g., separated chunks).
+- Estimating the remaining time from stored stage rates and the current stage's speed.
+- Throttling Socket.IO emissions.
+- Recording measured stage durations for future estimates.
+- Notifying a job's room when a background render finishes.
+
+Dependencies:
+    - time: Measuring stage durations and throttling emissions.
+    - contextlib: Stage context manager.
+
+Classes:
+    - ProgressReporter: Emits progress and ETA for one job.
+    - NullProgress: No-op reporter for code paths without a listener.
+
+Functions:
+    - notify_complete: Emit the result of a finished background job to its room.
+"""
+
+import time
+from contextlib import contextmanager
+
+INGEST_STAGES = ["save", "fingerprint", "decode", "analyze", "separate", "harmonize", "persist"]
+LYRICS_STAGES = ["transcribe"]
+
+# Seconds of processing per second of audio, used until real timings are stored
+DEFAULT_STAGE_RATES = {
+    "save": 0.01,
+    "fingerprint": 0.01,
+    "decode": 0.02,
+    "analyze": 0.15,
+    "separate": 0.6,
+    "separate:fast": 0.15,
+    "separate:hq": 1.0,
+    "harmonize": 0.3,
+    "persist": 0.005,
+    "transcribe": 0.3,
+}
+
+MIN_EMIT_INTERVAL = 0.5
+
+
+class ProgressReporter:
+    """
+    Emits progress events with an ETA for one job to its Socket.IO room.
+
+    Attributes:
+        job_id (str): ID of the job, also used as the Socket.IO room name.
+        stages (list): Ordered names of the job's stages.
+        expected (dict): Expected duration of each stage in seconds.
+    """
+
+    def __init__(self, socketio, job_id, stages, audio_seconds, timing_model=None,
+                 min_interval=MIN_EMIT_INTERVAL, stage_keys=None):
+        """
+        Initialize the reporter and estimate the duration of every stage.
+
+        Parameters:
+            socketio (SocketIO): Socket.IO server or emitter, or None to only record timings.
+            job_id (str): ID of the job and name of its room.
+            stages (list): Ordered names of the job's stages.
+            audio_seconds (float): Length of the processed audio in seconds.
+            timing_model (StageTimingModel): Store of historical stage rates.
+            min_interval (float): Minimum time between two emissions in seconds.
+            stage_keys (dict): Timing keys of stages whose rate depends on how they run,
+                e.g. {'separate': 'separate:fast'}; other stages use their own name.
+        """
+        self.socketio = socketio
+        self.job_id = job_id
+        self.stages = list(stages)
+        self.audio_seconds = max(float(audio_seconds or 0), 1.0)
+        self.timing_model = timing_model
+        self.min_interval = min_interval
+
+        self.stage_keys = {stage: (stage_keys or {}).get(stage, stage) for stage in self.stages}
+        keys = list(self.stage_keys.values())
+        rates = {**DEFAULT_STAGE_RATES, **(timing_model.get_rates(keys) if timing_model else {})}
+        self.expected = {stage: rates.get(key, 0.1) * self.audio_seconds for stage, key in self.stage_keys.items()}
+        self.total_expected = sum(self.expected.values()) or 1.0
+
+        self.completed = set()
+        self.current = None
+        self.current_started = None
+        self.fraction = 0.0
+        self.last_emit = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Track a stage of the job, recording its duration when it completes.
+
+        Parameters:
+            name (str): Name of the stage.
+        """
+        self.current, self.current_started, self.fraction = name, time.perf_counter(), 0.0
+        self._emit(force=True)
+        yield self
+        elapsed = time.perf_counter() - self.current_started
+        self.completed.add(name)
+        self.current, self.fraction = None, 0.0
+        if self.timing_model is not None:
+            self.timing_model.record(self.stage_keys.get(name, name), elapsed, self.audio_seconds)
+        self._emit(force=True)
+
+    def skip(self, name):
+        """
+        Mark a stage as not needed for this job.
+
+        Parameters:
+            name (str): Name of the stage.
+        """
+        self.completed.add(name)
+        self._emit()
+
+    def update(self, fraction):
+        """
+        Report sub-progress within the current stage.
+
+        Parameters:
+            fraction (float): Completed fraction of the current stage, between 0 and 1.
+        """
+        self.fraction = min(max(fraction, 0.0), 1.0)
+        self._emit()
+
+    def percent(self):
+        """
+        Compute the completed percentage of the job.
+
+        Returns:
+            float: Percentage between 0 and 100.
+        """
+        done = sum(self.expected[stage] for stage in self.completed if stage in self.expected)
+        if self.current in self.expected:
+            done += self.expected[self.current] * self.fraction
+        return min(100.0, 100.0 * done / self.total_expected)
+
+    def eta_seconds(self):
+        """
+        Estimate the remaining time of the job.
+
+        The current stage uses its observed speed once it has made some progress; the
+        remaining stages use their historical rates.
+
+        Returns:
+            float: Estimated remaining seconds.
+        """
+        remaining = sum(self.expected[stage] for stage in self.stages
+                        if stage not in self.completed and stage != self.current)
+        if self.current in self.expected:
+            elapsed = time.perf_counter() - self.current_started
+            if self.fraction > 0.05:
+                remaining += elapsed * (1 - self.fraction) / self.fraction
+            else:
+                remaining += max(self.expected[self.current] - elapsed, 0.0)
+        return remaining
+
+    def finish(self):
+        """
+        Emit the final 100% event.
+        """
+        self.completed.update(self.stages)
+        self._emit(force=True)
+
+    def _emit(self, force=False):
+        now = time.perf_counter()
+        if self.socketio is None or (not force and now - self.last_emit < self.min_interval):
+            return
+        self.last_emit = now
+        self.socketio.emit("progress", {
+            "job_id": self.job_id,
+            "percent": round(self.percent(), 1),
+            "stage": self.current,
+            "eta_seconds": round(self.eta_seconds(), 1),
+        }, to=self.job_id)
+
+
+class NullProgress:
+    """
+    Reporter with the ProgressReporter interface that does nothing.
+    """
+
+    @contextmanager
+    def stage(self, name):
+        yield self
+
+    def skip(self, name):
+        pass
+
+    def update(self, fraction):
+        pass
+
+    def finish(self):
+        pass
+
+
+def notify_complete(socketio, job_id, job_type, result):
+    """
+    Emit the result of a finished background job, e.g. the full-quality render that
+    replaces a preview, to the job's Socket.IO room.
+
+    Parameters:
+        socketio (SocketIO): Socket.IO server or emitter, or None.
+        job_id (str): Room the client joined for the job.
+        job_type (str): Type of the finished job (e.g. 'change_key').
+        result (dict): Result of the job.
+    """
+    if socketio is None or not job_id:
+        return
+    socketio.emit("job_complete", {"job_id": job_id, "type": job_type, "result": result}, to=job_id)
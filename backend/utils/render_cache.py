@@ -0,0 +1,142 @@
+"""
+Render coordination module for key, tempo and harmony variants written to disk.
+
+A variant's output path is derived from its source stem and transform (e.g. the new key
+or BPM in the file name), so the path identifies the render. This module makes sure that:
+- Concurrent identical requests in one process wait on a single computation.
+- Concurrent identical requests in different processes (web workers, CPU pool, queue
+  workers) are serialized by a file lock next to the output.
+- Outputs are written to a temporary file and atomically renamed, so a reader never
+  sees a truncated file at the final path.
+- Finished outputs are published to the storage backend, and a render already published
+  by another node is fetched instead of being computed again.
+
+Dependencies:
+    - os: File path operations and atomic renames.
+    - threading: In-process single-flight bookkeeping.
+    - contextlib: Temporary output context manager.
+    - filelock: Cross-process file locks.
+    - storage.get_storage: Publishing and fetching of outputs shared between nodes.
+
+Functions:
+    - atomic_output: Context manager yielding a temporary path renamed into place on success.
+    - claim_render: Context manager holding the render of an output, for renders that
+      cannot run as one call (e.g. streamed variants).
+    - single_flight: Render an output once, sharing the result between concurrent callers.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from filelock import FileLock
+from .cancellation import Cancelled
+from .storage import get_storage
+
+LOCK_DIR = ".locks"
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+@contextmanager
+def atomic_output(output_path):
+    """
+    Yield a temporary path in the output's folder, move it into place on success and
+    publish it to the storage backend.
+
+    The temporary name keeps the output's extension so writers can infer the format,
+    and starts with a dot so it never matches the song's stem names.
+
+    Parameters:
+        output_path (str): Final path of the output file.
+    """
+    folder, filename = os.path.split(output_path)
+    base, ext = os.path.splitext(filename)
+    tmp_path = os.path.join(folder, f".{base}.{os.getpid()}.{threading.get_ident()}.tmp{ext}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+        get_storage().publish(output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _lock_path(output_path):
+    folder, filename = os.path.split(output_path)
+    lock_folder = os.path.join(folder, LOCK_DIR)
+    os.makedirs(lock_folder, exist_ok=True)
+    return os.path.join(lock_folder, f"{filename}.lock")
+
+
+@contextmanager
+def claim_render(output_path):
+    """
+    Claim the render of an output file for the duration of the context.
+
+    Yields the temporary path to render to (see atomic_output) while holding the
+    in-process flight and the cross-process file lock of the output, or None if the
+    output already exists or was rendered by a concurrent caller. Concurrent callers wait
+    for the holder and re-check the output when it releases the claim, so a render that
+    was cancelled or abandoned (e.g. a stream whose client left) is taken over.
+
+    Parameters:
+        output_path (str): Final path of the output, identifying the (stem, transform) render.
+    """
+    storage = get_storage()
+    while True:
+        if storage.ensure_local(output_path):
+            yield None
+            return
+
+        with _inflight_lock:
+            flight = _inflight.get(output_path)
+            leader = flight is None
+            if leader:
+                flight = _inflight[output_path] = {"done": threading.Event(), "error": None}
+
+        if leader:
+            break
+        flight["done"].wait()
+        if flight["error"] is not None and not isinstance(flight["error"], Cancelled):
+            raise flight["error"]
+
+    try:
+        with FileLock(_lock_path(output_path)):
+            # Another process may have finished the render while we waited for the lock
+            if storage.ensure_local(output_path):
+                yield None
+                return
+            with atomic_output(output_path) as tmp_path:
+                yield tmp_path
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        flight["done"].set()
+        with _inflight_lock:
+            _inflight.pop(output_path, None)
+
+
+def single_flight(output_path, render):
+    """
+    Render an output file once, even when many callers ask for it at the same time.
+
+    The first caller in a process renders while holding a cross-process file lock; other
+    callers in the same process wait for it, and callers in other processes wait on the
+    lock and then find the finished file. If the first caller's render is cancelled, a
+    waiting caller takes over instead of failing with it.
+
+    Parameters:
+        output_path (str): Final path of the output, identifying the (stem, transform) render.
+        render (callable): Writes the output to the temporary path it is given.
+
+    Returns:
+        bool: True if this call rendered the file, False if it already existed or was
+              rendered by a concurrent caller.
+    """
+    with claim_render(output_path) as tmp_path:
+        if tmp_path is None:
+            return False
+        render(tmp_path)
+        return True
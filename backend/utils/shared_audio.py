@@ -0,0 +1,253 @@
+"""
+Shared-memory transport of audio arrays between processes.
+
+Handing a decoded stem to a process pool pickles it: the array is serialized into the
+pipe and deserialized on the other side, two copies of a possibly multi-hundred-MB
+signal per task, plus the same again for every returned signal. This module instead
+keeps arrays in `multiprocessing.shared_memory` blocks and passes small handles (block
+name, shape and dtype) between processes; both sides map the same pages.
+
+Lifetime is reference-counted in the process that created a block: it holds one
+reference, every task it shares the block with holds another until the task finishes,
+and the block is unlinked when the last reference is released. Other processes only
+attach and detach; they never unlink.
+
+With AUDIO_PROCESSES > 0, the decode, key and harmony (pitch-shift) stages use a pool of
+that many processes: the decoded song goes into one block, key detection runs in a pool
+process on it while tempo is estimated here, and harmony renders read the soprano and
+write their pitch-shifted signals through blocks. Every transfer is counted in a
+TransferReport, which shows the bytes that were not copied.
+
+Dependencies:
+    - os: Configuration.
+    - threading: Reference counts and lazy pool creation.
+    - multiprocessing.shared_memory: Shared blocks.
+    - concurrent.futures: Process pool of the audio stages.
+    - numpy: Array views on shared blocks.
+
+Classes:
+    - AudioHandle: Picklable reference to a shared block.
+    - SharedAudio: Array in a shared-memory block with reference-counted lifetime.
+    - TransferReport: Bytes passed by handle instead of by value.
+
+Functions:
+    - audio_pool: Process pool of the audio stages, or None when disabled.
+    - submit_shared: Run a function in the pool with shared blocks passed by handle.
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+AUDIO_PROCESSES = int(os.getenv("AUDIO_PROCESSES", "0"))
+# Copies a pickled array costs on its way through a pool: serialization and deserialization
+PICKLE_COPIES = 2
+
+AudioHandle = namedtuple("AudioHandle", ["name", "shape", "dtype"])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class TransferReport:
+    """
+    Counts the arrays passed by handle and the copies this saved.
+
+    Attributes:
+        arrays (int): Arrays passed to or returned from pool processes by handle.
+        bytes_shared (int): Size of those arrays.
+        bytes_copied (int): Bytes copied into shared blocks (the one copy still paid).
+    """
+
+    def __init__(self):
+        self.arrays = 0
+        self.bytes_shared = 0
+        self.bytes_copied = 0
+        self._lock = threading.Lock()
+
+    def shared(self, nbytes):
+        with self._lock:
+            self.arrays += 1
+            self.bytes_shared += nbytes
+
+    def copied(self, nbytes):
+        with self._lock:
+            self.bytes_copied += nbytes
+
+    def as_dict(self):
+        """
+        Summary of the transfers.
+
+        Returns:
+            dict: 'arrays', 'bytes_shared', 'bytes_copied' and 'bytes_not_copied', the
+                  pickling copies avoided minus the copies into shared memory.
+        """
+        with self._lock:
+            return {
+                "arrays": self.arrays,
+                "bytes_shared": self.bytes_shared,
+                "bytes_copied": self.bytes_copied,
+                "bytes_not_copied": PICKLE_COPIES * self.bytes_shared - self.bytes_copied,
+            }
+
+
+class SharedAudio:
+    """
+    Array in a shared-memory block, with reference-counted lifetime in its creating process.
+
+    Attributes:
+        array (ndarray): View of the block; no copy.
+        handle (AudioHandle): Picklable reference for other processes.
+        owner (bool): Whether this process created the block and unlinks it.
+    """
+
+    def __init__(self, block, shape, dtype, owner):
+        self.block = block
+        self.owner = owner
+        self.handle = AudioHandle(block.name, tuple(shape), np.dtype(dtype).str)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        self._references = 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def allocate(cls, shape, dtype=np.float32):
+        """
+        Create an uninitialized shared array, e.g. for a pool process to write its result into.
+
+        Parameters:
+            shape (tuple): Shape of the array.
+            dtype (numpy.dtype): Sample type.
+
+        Returns:
+            SharedAudio: Block owned by this process, with one reference.
+        """
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return cls(shared_memory.SharedMemory(create=True, size=nbytes), shape, dtype, owner=True)
+
+    @classmethod
+    def from_array(cls, array, report=None):
+        """
+        Copy an array into a new shared block.
+
+        Parameters:
+            array (ndarray): Signal to share, e.g. a decoded song.
+            report (TransferReport): Optional report counting the copy.
+
+        Returns:
+            SharedAudio: Block owned by this process, with one reference.
+        """
+        shared = cls.allocate(array.shape, array.dtype)
+        shared.array[...] = array
+        if report is not None:
+            report.copied(array.nbytes)
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Map a block created by another process.
+
+        Parameters:
+            handle (AudioHandle): Handle received from the owner.
+
+        Returns:
+            SharedAudio: Attached block; close it when done, the owner unlinks it.
+        """
+        # Pool processes share the owner's resource tracker, so attaching registers the
+        # block a second time with the same tracker, and only the owner's unlink unregisters it
+        block = shared_memory.SharedMemory(name=handle.name)
+        return cls(block, handle.shape, handle.dtype, owner=False)
+
+    def acquire(self):
+        """
+        Take a reference, e.g. for a task the block is shared with.
+
+        Returns:
+            AudioHandle: Handle to send to the task.
+        """
+        with self._lock:
+            if self._references <= 0:
+                raise ValueError(f"Shared block {self.handle.name} was already released")
+            self._references += 1
+        return self.handle
+
+    def release(self):
+        """
+        Drop a reference; the last one detaches the block and, in the owner, unlinks it.
+        """
+        with self._lock:
+            self._references -= 1
+            if self._references > 0:
+                return
+        self.close()
+
+    def close(self):
+        self.array = None
+        try:
+            self.block.close()
+        except BufferError:
+            # Views handed out are still alive; the mapping goes with the last of them
+            pass
+        if self.owner:
+            try:
+                self.block.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def audio_pool():
+    """
+    Process pool of the audio stages, created on first use.
+
+    Returns:
+        ProcessPoolExecutor: Pool of AUDIO_PROCESSES spawned processes, or None if
+                             AUDIO_PROCESSES is 0.
+    """
+    global _pool
+    if AUDIO_PROCESSES <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=AUDIO_PROCESSES,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def submit_shared(function, shared_arrays, *args, report=None):
+    """
+    Run a function in the audio pool, passing shared blocks by handle.
+
+    Each block gets a reference for the duration of the task, so it outlives the task
+    even if the caller releases its own reference first.
+
+    Parameters:
+        function (callable): Module-level function; receives the handles followed by args.
+        shared_arrays (list): SharedAudio blocks to pass.
+        *args: Further picklable arguments.
+        report (TransferReport): Optional report counting the arrays passed by handle.
+
+    Returns:
+        Future: Future of the function's result.
+    """
+    handles = [shared.acquire() for shared in shared_arrays]
+    if report is not None:
+        for shared in shared_arrays:
+            report.shared(shared.array.nbytes)
+    future = audio_pool().submit(function, *handles, *args)
+
+    def release(_):
+        for shared in shared_arrays:
+            shared.release()
+    future.add_done_callback(release)
+    return future
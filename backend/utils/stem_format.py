@@ -0,0 +1,145 @@
+"""
+Storage format of uploaded songs, separated stems and rendered variants.
+
+Stems used to be uncompressed WAV files, some of them float, which multiplies disk
+usage, page-cache pressure and transfer size. STEM_FORMAT selects the container of every
+file written from now on:
+- wav (default): 16-bit PCM WAV, as before.
+- flac: lossless FLAC, typically about half the size of 16-bit WAV.
+
+The container is recorded in the file extension, so existing WAV files keep working
+next to FLAC files: librosa, soundfile, ffmpeg and the browser decode both, and variants
+of a stem inherit its extension. Analysis-only loads can additionally keep their decoded
+sidecars in half precision (see audio_cache.ANALYSIS_DTYPE).
+
+Dependencies:
+    - os: Configuration, file sizes and extensions.
+    - time: Decode timings of converted files.
+    - soundfile (sf): Writing and converting audio files.
+    - render_cache.atomic_output: Atomic replacement of converted files.
+
+Functions:
+    - audio_format: soundfile format and subtype for a path.
+    - write_audio: Write a whole signal in the format of its path.
+    - open_writer: Open a block writer in the format of its path.
+    - convert_audio: Convert an audio file to another format, reporting size and decode cost.
+"""
+
+import os
+import time
+import soundfile as sf
+from .render_cache import atomic_output
+
+# soundfile container and default subtype per extension
+AUDIO_FORMATS = {".wav": ("WAV", "PCM_16"), ".flac": ("FLAC", "PCM_16")}
+AUDIO_EXTENSIONS = tuple(AUDIO_FORMATS)
+STEM_FORMAT = os.getenv("STEM_FORMAT", "wav").lower()
+if f".{STEM_FORMAT}" not in AUDIO_FORMATS:
+    raise ValueError(f"Unknown STEM_FORMAT: {STEM_FORMAT}")
+STEM_EXTENSION = f".{STEM_FORMAT}"
+# Output format name understood by audio_separator
+SEPARATOR_FORMAT = STEM_FORMAT.upper()
+# Subtype of converted files whose source has more than 16 bits (e.g. float separator output)
+HIGH_RESOLUTION_SUBTYPE = "PCM_24"
+CONVERT_BLOCK_FRAMES = 1 << 18
+
+
+def audio_format(path, subtype=None):
+    """
+    soundfile format and subtype of the container named by a path's extension.
+
+    Parameters:
+        path (str): Path of the file to write; temporary names keep the final extension.
+        subtype (str): Subtype to use instead of the container's default.
+
+    Returns:
+        tuple: Format and subtype, or (None, subtype) to let soundfile decide for
+               unknown extensions.
+    """
+    file_format, default_subtype = AUDIO_FORMATS.get(os.path.splitext(path)[1].lower(), (None, None))
+    return file_format, subtype or default_subtype
+
+
+def write_audio(path, data, sample_rate, subtype=None):
+    """
+    Write a signal in the format of its path, e.g. a rendered variant of a FLAC stem as FLAC.
+
+    Parameters:
+        path (str): Output path.
+        data (ndarray): Audio signal, mono or (frames, channels).
+        sample_rate (int): Sampling rate of the signal.
+        subtype (str): Optional subtype overriding the container's default.
+    """
+    file_format, subtype = audio_format(path, subtype)
+    sf.write(path, data, sample_rate, format=file_format, subtype=subtype)
+
+
+def open_writer(path, sample_rate, channels, subtype=None):
+    """
+    Open a block writer in the format of its path.
+
+    Parameters:
+        path (str): Output path.
+        sample_rate (int): Sampling rate of the written blocks.
+        channels (int): Number of channels.
+        subtype (str): Optional subtype overriding the container's default.
+
+    Returns:
+        SoundFile: File opened for writing.
+    """
+    file_format, subtype = audio_format(path, subtype)
+    return sf.SoundFile(path, "w", samplerate=sample_rate, channels=channels, format=file_format, subtype=subtype)
+
+
+def _decode_seconds(path, block_frames):
+    started = time.perf_counter()
+    frames = 0
+    with sf.SoundFile(path) as source:
+        for block in source.blocks(blocksize=block_frames, dtype="float32"):
+            frames += len(block)
+    return frames, time.perf_counter() - started
+
+
+def convert_audio(source_path, output_path, block_frames=CONVERT_BLOCK_FRAMES):
+    """
+    Convert an audio file block by block, keeping its precision.
+
+    16-bit sources stay 16-bit; deeper and float sources are stored with
+    HIGH_RESOLUTION_SUBTYPE. The converted file is decoded again to check its length,
+    which also measures its decode cost against the source's.
+
+    Parameters:
+        source_path (str): Path of the file to convert.
+        output_path (str): Path of the converted file; its extension selects the format.
+        block_frames (int): Frames converted per block.
+
+    Returns:
+        dict: 'bytes_before', 'bytes_after', and 'source_decode_seconds' and
+              'decode_seconds' for decoding the whole source and converted file.
+
+    Raises:
+        ValueError: If the converted file does not have the source's length.
+    """
+    with sf.SoundFile(source_path) as source:
+        subtype = "PCM_16" if source.subtype in ("PCM_16", "PCM_U8", "PCM_S8") else HIGH_RESOLUTION_SUBTYPE
+        source_seconds = 0.0
+        with atomic_output(output_path) as tmp_path, \
+                open_writer(tmp_path, source.samplerate, source.channels, subtype) as output:
+            while True:
+                started = time.perf_counter()
+                block = source.read(block_frames, dtype="float32", always_2d=True)
+                source_seconds += time.perf_counter() - started
+                if not len(block):
+                    break
+                output.write(block)
+            output.close()
+            frames, decode_seconds = _decode_seconds(tmp_path, block_frames)
+            if frames != source.frames:
+                raise ValueError(f"Converted {source_path} has {frames} frames instead of {source.frames}")
+
+    return {
+        "bytes_before": os.path.getsize(source_path),
+        "bytes_after": os.path.getsize(output_path),
+        "source_decode_seconds": round(source_seconds, 3),
+        "decode_seconds": round(decode_seconds, 3),
+    }
@@ -0,0 +1,475 @@
+"""
+Pluggable storage for uploaded songs, stems and rendered variants.
+
+Songs are identified by their paths under the upload folder (e.g.
+`uploads/<song_id>/<file>.wav`), as stored in the song documents. Where the bytes live
+depends on the backend selected with STORAGE_BACKEND:
+- local (default): the upload folder is the storage; every node needs the same disk.
+- gridfs: files are published to a GridFS bucket in the song database, and the upload
+  folder becomes a per-node cache filled on first use, so several API nodes and workers
+  share one library without a network filesystem. Every local copy records the GridFS
+  revision it holds, so a file that another node re-published or deleted is fetched
+  again or dropped instead of being served stale.
+
+Processing still reads and writes local files (librosa, ffmpeg and the separator need
+paths): writers publish a file once it is complete, and readers call ensure_local before
+opening one. Both backends serve chunked and byte-range reads for streaming.
+
+Dependencies:
+    - os: File path operations.
+    - re: Prefix queries on GridFS file names.
+    - datetime: GridFS upload dates of files without a recorded revision.
+    - threading: Lazy creation of the process-wide backend.
+    - gridfs, pymongo: GridFS bucket of the gridfs backend, imported on first use.
+
+Classes:
+    - LocalStorage: Files only in the upload folder.
+    - GridFSStorage: Files in a GridFS bucket, cached in the upload folder.
+
+Functions:
+    - storage_key: Storage key of a path in the upload folder.
+    - parse_range: Parse an HTTP Range header.
+    - get_storage: Process-wide storage backend.
+"""
+
+import os
+import re
+import threading
+from datetime import timezone
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+UPLOAD_ROOT = os.getenv("UPLOAD_FOLDER", "uploads")
+GRIDFS_BUCKET = os.getenv("GRIDFS_BUCKET", "stems")
+STREAM_CHUNK_BYTES = 256 * 1024
+# GridFS chunk size; reads of a byte range fetch only the chunks it covers
+GRIDFS_CHUNK_BYTES = 1024 * 1024
+# Folder next to the local copies holding the GridFS revision of each one
+REVISION_DIR = ".revisions"
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/musicnalyzer"
+
+_storage = None
+_storage_lock = threading.Lock()
+# Default of arguments whose value has not been looked up yet (None is a valid value)
+_UNKNOWN = object()
+
+
+def storage_key(path, root=UPLOAD_ROOT):
+    """
+    Storage key of a path in the upload folder.
+
+    Parameters:
+        path (str): Path of the file, possibly with an encoded '#' ('%23').
+        root (str): Upload folder.
+
+    Returns:
+        str: Key relative to the upload folder with '/' separators, or None for paths
+             outside of it.
+    """
+    relative = os.path.relpath(os.path.abspath(path.replace("%23", "#")), os.path.abspath(root))
+    if relative.startswith(os.pardir):
+        return None
+    return relative.replace(os.sep, "/")
+
+
+def parse_range(range_header, size):
+    """
+    Parse a single-range HTTP Range header.
+
+    Parameters:
+        range_header (str): Header value such as 'bytes=0-1023', 'bytes=500-' or 'bytes=-500'.
+        size (int): Size of the file in bytes.
+
+    Returns:
+        tuple: Inclusive (start, end) byte positions, or None if the header is absent or
+               not a single byte range.
+
+    Raises:
+        ValueError: If the range lies outside the file.
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1
+    if start > end or start >= size:
+        raise ValueError(f"Range {range_header} not satisfiable for {size} bytes")
+    return start, end
+
+
+def _read_file(path, start, end, chunk_size):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class LocalStorage:
+    """
+    Storage backend keeping files only in the upload folder.
+
+    Attributes:
+        root (str): Upload folder.
+        shared (bool): Whether files are visible to other nodes without a shared disk.
+    """
+
+    shared = False
+
+    def __init__(self, root=UPLOAD_ROOT):
+        self.root = root
+
+    def publish(self, path):
+        """
+        Make a completely written local file available to every node.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+        """
+
+    def ensure_local(self, path):
+        """
+        Make sure a file is present in the local upload folder.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+
+        Returns:
+            bool: True if the file is available locally.
+        """
+        return os.path.exists(path.replace("%23", "#"))
+
+    def exists(self, path):
+        return os.path.exists(path.replace("%23", "#"))
+
+    def stat(self, path):
+        """
+        Describe a file for a conditional or range request with a single lookup.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+
+        Returns:
+            dict: 'size' in bytes, 'mtime' (POSIX timestamp) and 'etag' identifying the
+                  file's content, plus backend details for read_range; None if the file
+                  does not exist.
+        """
+        try:
+            info = os.stat(path.replace("%23", "#"))
+        except FileNotFoundError:
+            return None
+        return {"size": info.st_size, "mtime": info.st_mtime, "etag": f"{info.st_mtime_ns:x}-{info.st_size:x}"}
+
+    def size(self, path):
+        """
+        Size of a file in bytes.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return os.path.getsize(path.replace("%23", "#"))
+
+    def read_range(self, path, start=0, end=None, chunk_size=STREAM_CHUNK_BYTES, info=None):
+        """
+        Read a file, or a byte range of it, in chunks.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+            start (int): First byte to read.
+            end (int): Last byte to read (inclusive), or None for the end of the file.
+            chunk_size (int): Maximum bytes per yielded chunk.
+            info (dict): Result of stat for the same request, so the file is not looked
+                up again.
+
+        Yields:
+            bytes: Consecutive chunks of the range.
+        """
+        path = path.replace("%23", "#")
+        end = os.path.getsize(path) - 1 if end is None else end
+        yield from _read_file(path, start, end, chunk_size)
+
+    def list(self, folder):
+        """
+        Names of the files directly in a folder of the upload folder.
+
+        Parameters:
+            folder (str): Path of the folder.
+
+        Returns:
+            set: File names.
+        """
+        if not os.path.isdir(folder):
+            return set()
+        return {name for name in os.listdir(folder) if os.path.isfile(os.path.join(folder, name))}
+
+    def delete(self, path):
+        """
+        Delete a file.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+        """
+        path = path.replace("%23", "#")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class GridFSStorage(LocalStorage):
+    """
+    Storage backend keeping files in a GridFS bucket and caching them in the upload folder.
+
+    A file's GridFS name is its storage key. Local copies are downloaded on first use and
+    renamed into place once complete, like rendered variants.
+
+    The GridFS ID of every local copy is recorded in REVISION_DIR when it is downloaded or
+    published. Before a local copy is used, it is checked against the latest revision
+    (once per request when the caller passes the result of stat to read_range):
+    a copy of an older revision is fetched again, and a copy of a file deleted from
+    GridFS is removed. Local files without a recorded revision have not been published
+    by this node; they are used unless GridFS holds a revision uploaded after they were
+    written.
+
+    Attributes:
+        mongo_uri (str): Connection string of the database holding the bucket.
+        bucket_name (str): Name of the GridFS bucket.
+    """
+
+    shared = True
+
+    def __init__(self, mongo_uri, bucket_name=GRIDFS_BUCKET, root=UPLOAD_ROOT):
+        super().__init__(root)
+        self.mongo_uri = mongo_uri
+        self.bucket_name = bucket_name
+        self._database = None
+        self._bucket = None
+
+    def _connect(self):
+        # Connected on first use so forked and spawned processes get their own client
+        if self._bucket is None:
+            import gridfs
+            from pymongo import MongoClient
+            self._database = MongoClient(self.mongo_uri).get_default_database()
+            self._bucket = gridfs.GridFSBucket(self._database, self.bucket_name,
+                                               chunk_size_bytes=GRIDFS_CHUNK_BYTES)
+
+    @property
+    def bucket(self):
+        self._connect()
+        return self._bucket
+
+    @property
+    def files(self):
+        self._connect()
+        return self._database[f"{self.bucket_name}.files"]
+
+    def _latest(self, key):
+        import gridfs
+        try:
+            return self.bucket.open_download_stream_by_name(key)
+        except gridfs.errors.NoFile:
+            return None
+
+    def _latest_revision(self, key):
+        return self.files.find_one({"filename": key}, {"_id": 1, "uploadDate": 1, "length": 1},
+                                   sort=[("uploadDate", -1)])
+
+    @staticmethod
+    def _revision_path(local_path):
+        folder, filename = os.path.split(local_path)
+        return os.path.join(folder, REVISION_DIR, filename)
+
+    def _local_revision(self, local_path):
+        try:
+            with open(self._revision_path(local_path)) as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _record_revision(self, local_path, file_id):
+        revision_path = self._revision_path(local_path)
+        os.makedirs(os.path.dirname(revision_path), exist_ok=True)
+        with open(revision_path, "w") as file:
+            file.write(str(file_id))
+
+    def _drop_local(self, local_path):
+        for stale_path in (local_path, self._revision_path(local_path)):
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+
+    def _local_copy(self, path, latest=_UNKNOWN):
+        """
+        Check that the local copy of a file is its latest revision.
+
+        Parameters:
+            path (str): Path of the file in the upload folder.
+            latest (dict): Latest revision of the file (or None), if already looked up.
+
+        Returns:
+            bool: True if the local copy can be used; a stale copy is removed first.
+        """
+        local_path = path.replace("%23", "#")
+        if not os.path.exists(local_path):
+            return False
+        key = storage_key(path, self.root)
+        if key is None:
+            return True
+        if latest is _UNKNOWN:
+            latest = self._latest_revision(key)
+        revision = self._local_revision(local_path)
+        if revision is not None:
+            fresh = latest is not None and revision == str(latest["_id"])
+        elif latest is None:
+            # Never published, e.g. a variant rendered on this node
+            fresh = True
+        else:
+            # Written here and not yet published, unless another node published it since
+            uploaded = latest["uploadDate"].replace(tzinfo=timezone.utc).timestamp()
+            fresh = os.path.getmtime(local_path) >= uploaded
+        if not fresh:
+            print(f"Local copy of {key} is {'stale' if latest is not None else 'deleted'}, dropping it")
+            self._drop_local(local_path)
+        return fresh
+
+    def publish(self, path):
+        key = storage_key(path, self.root)
+        if key is None:
+            return
+        local_path = path.replace("%23", "#")
+        with open(local_path, "rb") as file:
+            file_id = self.bucket.upload_from_stream(key, file)
+        self._record_revision(local_path, file_id)
+        # Drop older revisions only once the new one is complete
+        for previous in self.bucket.find({"filename": key, "_id": {"$ne": file_id}}):
+            self.bucket.delete(previous._id)
+
+    def ensure_local(self, path):
+        local_path = path.replace("%23", "#")
+        if self._local_copy(path):
+            return True
+        key = storage_key(path, self.root)
+        grid_out = self._latest(key) if key else None
+        if grid_out is None:
+            return False
+
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        folder, filename = os.path.split(local_path)
+        tmp_path = os.path.join(folder, f".{filename}.{os.getpid()}.{threading.get_ident()}.download")
+        try:
+            with open(tmp_path, "wb") as file:
+                for chunk in iter(lambda: grid_out.read(STREAM_CHUNK_BYTES), b""):
+                    file.write(chunk)
+            os.replace(tmp_path, local_path)
+            self._record_revision(local_path, grid_out._id)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        print(f"Fetched {key} from GridFS")
+        return True
+
+    def exists(self, path):
+        if self._local_copy(path):
+            return True
+        key = storage_key(path, self.root)
+        return key is not None and self._latest_revision(key) is not None
+
+    def stat(self, path):
+        key = storage_key(path, self.root)
+        if key is None:
+            info = super().stat(path)
+            if info is not None:
+                info["local"] = True
+            return info
+        # One revision lookup serves the freshness check, the validators and the read
+        latest = self._latest_revision(key)
+        local = self._local_copy(path, latest)
+        if local:
+            info = super().stat(path)
+        elif latest is not None:
+            info = {"size": latest["length"]}
+        else:
+            return None
+        published = latest is not None and (
+            not local or self._local_revision(path.replace("%23", "#")) == str(latest["_id"]))
+        if published:
+            # The same on every node, unlike the modification time of local copies
+            info["etag"] = str(latest["_id"])
+            info["mtime"] = latest["uploadDate"].replace(tzinfo=timezone.utc).timestamp()
+        info["local"] = local
+        info["file_id"] = latest["_id"] if latest is not None else None
+        return info
+
+    def size(self, path):
+        if self._local_copy(path):
+            return super().size(path)
+        return self._latest(storage_key(path, self.root)).length
+
+    def read_range(self, path, start=0, end=None, chunk_size=STREAM_CHUNK_BYTES, info=None):
+        local = info["local"] if info is not None else self._local_copy(path)
+        if local:
+            yield from super().read_range(path, start, end, chunk_size)
+            return
+        if info is not None:
+            grid_out = self.bucket.open_download_stream(info["file_id"])
+        else:
+            grid_out = self._latest(storage_key(path, self.root))
+        end = grid_out.length - 1 if end is None else end
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = grid_out.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def list(self, folder):
+        names = super().list(folder)
+        key = storage_key(folder, self.root)
+        if key is not None:
+            prefix = f"{key}/"
+            query = {"filename": {"$regex": f"^{re.escape(prefix)}[^/]+$"}}
+            published = {name[len(prefix):] for name in self.files.distinct("filename", query)}
+            # Local copies of a published revision that is gone were deleted by another node
+            names = {name for name in names
+                     if name in published or self._local_revision(os.path.join(folder, name)) is None}
+            names.update(published)
+        return names
+
+    def delete(self, path):
+        super().delete(path)
+        self._drop_local(path.replace("%23", "#"))
+        key = storage_key(path, self.root)
+        if key is not None:
+            for grid_out in self.bucket.find({"filename": key}):
+                self.bucket.delete(grid_out._id)
+
+
+def get_storage():
+    """
+    Return the storage backend of this process, created from STORAGE_BACKEND on first use.
+
+    Returns:
+        LocalStorage: LocalStorage or GridFSStorage instance.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "gridfs":
+                    _storage = GridFSStorage(os.getenv("MONGO_URI", DEFAULT_MONGO_URI))
+                elif STORAGE_BACKEND == "local":
+                    _storage = LocalStorage()
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
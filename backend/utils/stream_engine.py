@@ -0,0 +1,278 @@
+"""
+Streaming pitch and tempo engine for serving key and BPM variants while they render.
+
+`change_key` and `change_bpm` render a whole stem before the client can fetch any of it.
+This module instead transforms a stem block by block:
+- A phase vocoder with overlap-add stretches time frame by frame, keeping only the
+  samples and spectra needed for the next output frames.
+- A streaming soxr resampler turns the stretched audio back into the original
+  duration for pitch shifts.
+- Blocks are encoded as 16-bit PCM behind a WAV header of unknown length, so they can
+  be sent over a chunked HTTP response as soon as they are computed.
+- The same blocks are written to a cache of their own (STREAM_DIR in the song folder,
+  always 16-bit WAV) through the render cache, so later requests are served from disk.
+  Streamed variants never take the cache path of change_key/change_bpm renders, whose
+  higher-quality output they would otherwise replace.
+
+Memory stays constant in the length of the song.
+
+Dependencies:
+    - struct: WAV header encoding.
+    - numpy: Vectorized FFTs and overlap-add across channels.
+    - soundfile (sf): Block-wise reading of the source.
+    - stem_format.open_writer: Writing the cached variant in the format of its source stem.
+    - soxr: Streaming resampling for pitch shifts, imported on first use.
+    - render_cache.claim_render: Single render per variant across threads and processes,
+      written to a temporary file renamed into place when complete.
+    - storage.get_storage: Fetches the source stem if this node has no local copy.
+
+Classes:
+    - PhaseVocoderStream: Block-based phase vocoder time stretching.
+    - PitchTempoStream: Pitch shift and tempo change of a block stream.
+
+Functions:
+    - stream_cache_path: Cache path of a streamed variant.
+    - wav_stream_header: WAV header for a stream of unknown length.
+    - stream_transform: Yield a transformed stem as WAV bytes while caching it.
+"""
+
+import os
+import struct
+import numpy as np
+import soundfile as sf
+import lazy_loader as lazy
+from .render_cache import claim_render
+from .storage import get_storage
+from .stem_format import open_writer
+
+soxr = lazy.load("soxr")
+
+STREAM_DIR = ".stream"
+STREAM_BLOCK_FRAMES = 16384
+# Bytes per read when a variant rendered meanwhile is sent from the cache
+CACHED_CHUNK_BYTES = 256 * 1024
+N_FFT = 2048
+HOP_LENGTH = 512
+# Size field of the RIFF and data chunks when the length is not known in advance
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+class PhaseVocoderStream:
+    """
+    Stretches audio in time by a constant rate, one block at a time.
+
+    Output frames are taken at fractional analysis positions spaced by `rate`; each
+    interpolates the magnitudes of the two neighbouring analysis frames and advances
+    the phase by their measured phase difference. Frames are windowed and overlap-added.
+
+    Attributes:
+        rate (float): Stretch rate; above 1 speeds up, below 1 slows down.
+        total_in (int): Input frames received so far.
+        total_out (int): Output frames returned so far.
+    """
+
+    def __init__(self, rate, channels, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        self.rate = rate
+        self.n_fft = n_fft
+        self.hop = hop_length
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        # Overlap-add gain of the squared window at this hop
+        self.norm = float((self.window ** 2).sum() / hop_length)
+        self.advance = 2 * np.pi * hop_length * np.arange(n_fft // 2 + 1) / n_fft
+
+        # Input is centered like librosa's STFT: half a frame of leading zeros
+        self.input = np.zeros((channels, n_fft // 2), dtype=np.float32)
+        self.base = 0
+        self.columns = {}
+        self.time = 0.0
+        self.phase = None
+        self.output = np.zeros((channels, n_fft), dtype=np.float32)
+        self.trim = n_fft // 2
+        self.total_in = 0
+        self.total_out = 0
+
+    def _column(self, index):
+        if index not in self.columns:
+            start = index * self.hop - self.base
+            frame = self.input[:, start:start + self.n_fft] * self.window
+            self.columns[index] = np.fft.rfft(frame, axis=-1)
+        return self.columns[index]
+
+    def process(self, block, last=False):
+        """
+        Stretch the next block of audio.
+
+        Parameters:
+            block (ndarray): Input frames as a (frames, channels) array.
+            last (bool): Whether this is the final block; flushes the remaining output.
+
+        Returns:
+            ndarray: Output frames as a (frames, channels) float32 array.
+        """
+        self.total_in += len(block)
+        parts = [self.input, np.asarray(block, dtype=np.float32).T]
+        if last:
+            parts.append(np.zeros((self.input.shape[0], self.n_fft), dtype=np.float32))
+        self.input = np.concatenate(parts, axis=1)
+
+        chunks = []
+        while True:
+            index = int(self.time)
+            if (index + 1) * self.hop + self.n_fft > self.base + self.input.shape[1]:
+                break
+            current, following = self._column(index), self._column(index + 1)
+            alpha = self.time - index
+            magnitude = (1 - alpha) * np.abs(current) + alpha * np.abs(following)
+            if self.phase is None:
+                self.phase = np.angle(current)
+
+            frame = np.fft.irfft(magnitude * np.exp(1j * self.phase), n=self.n_fft, axis=-1) * self.window
+            deviation = np.angle(following) - np.angle(current) - self.advance
+            self.phase = self.phase + self.advance + (np.mod(deviation + np.pi, 2 * np.pi) - np.pi)
+
+            self.output += frame.astype(np.float32)
+            chunks.append(self.output[:, :self.hop] / self.norm)
+            self.output = np.concatenate(
+                [self.output[:, self.hop:], np.zeros((self.output.shape[0], self.hop), dtype=np.float32)], axis=1)
+            self.time += self.rate
+
+            # Drop samples and spectra no later frame needs
+            keep_from = int(self.time)
+            self.columns = {i: column for i, column in self.columns.items() if i >= keep_from}
+            consumed = keep_from * self.hop - self.base
+            if consumed > 0:
+                self.input = self.input[:, consumed:]
+                self.base += consumed
+
+        if last:
+            chunks.append(self.output / self.norm)
+        out = np.concatenate(chunks, axis=1) if chunks else np.zeros((self.input.shape[0], 0), np.float32)
+
+        if self.trim:
+            dropped = min(self.trim, out.shape[1])
+            out, self.trim = out[:, dropped:], self.trim - dropped
+
+        # Never return more than the stretched length; pad the final block up to it
+        target = int(round(self.total_in / self.rate)) - self.total_out
+        if last and out.shape[1] < target:
+            out = np.pad(out, ((0, 0), (0, target - out.shape[1])))
+        out = out[:, :max(0, target)]
+        self.total_out += out.shape[1]
+        return out.T
+
+
+class PitchTempoStream:
+    """
+    Shifts the pitch and changes the tempo of a stream of audio blocks.
+
+    The pitch shift stretches time by the pitch ratio and resamples back, like
+    librosa.effects.pitch_shift; the tempo change is folded into the same stretch.
+    """
+
+    def __init__(self, sample_rate, channels, n_steps=0, tempo_rate=1.0):
+        """
+        Parameters:
+            sample_rate (int): Sampling rate of input and output.
+            channels (int): Number of channels.
+            n_steps (float): Semitones to shift the pitch by.
+            tempo_rate (float): New tempo divided by the original tempo.
+        """
+        self.channels = channels
+        pitch_rate = 2.0 ** (-float(n_steps) / 12)
+        stretch = tempo_rate * pitch_rate
+        self.vocoder = PhaseVocoderStream(stretch, channels) if stretch != 1.0 else None
+        self.resampler = None
+        if n_steps:
+            self.resampler = soxr.ResampleStream(sample_rate / pitch_rate, sample_rate, channels, dtype="float32")
+
+    def process(self, block, last=False):
+        """
+        Transform the next block of audio.
+
+        Parameters:
+            block (ndarray): Input frames as a (frames, channels) array.
+            last (bool): Whether this is the final block.
+
+        Returns:
+            ndarray: Output frames as a (frames, channels) float32 array.
+        """
+        out = self.vocoder.process(block, last) if self.vocoder else np.asarray(block, dtype=np.float32)
+        if self.resampler is not None:
+            chunk = out if self.channels > 1 else out[:, 0]
+            out = self.resampler.resample_chunk(np.ascontiguousarray(chunk), last=last).reshape(-1, self.channels)
+        return out
+
+
+def stream_cache_path(output_path):
+    """
+    Derive the cache path of a streamed variant from the path of the full render.
+
+    Parameters:
+        output_path (str): Path of the variant rendered by change_key/change_bpm.
+
+    Returns:
+        str: Path of the streamed WAV in the song's stream folder.
+    """
+    folder, filename = os.path.split(output_path)
+    base, _ = os.path.splitext(filename)
+    os.makedirs(os.path.join(folder, STREAM_DIR), exist_ok=True)
+    return os.path.join(folder, STREAM_DIR, f"{base}.wav")
+
+
+def wav_stream_header(sample_rate, channels):
+    """
+    Build a 16-bit PCM WAV header whose sizes mark the length as unknown.
+
+    Parameters:
+        sample_rate (int): Sampling rate of the stream.
+        channels (int): Number of channels.
+
+    Returns:
+        bytes: The 44-byte header.
+    """
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", UNKNOWN_SIZE, b"WAVE", b"fmt ", 16, 1, channels,
+                       sample_rate, sample_rate * channels * 2, channels * 2, 16, b"data", UNKNOWN_SIZE)
+
+
+def stream_transform(source_path, output_path, n_steps=0, tempo_rate=1.0, block_frames=STREAM_BLOCK_FRAMES):
+    """
+    Yield a pitch- and/or tempo-changed stem as WAV bytes while writing it to the cache.
+
+    The render is claimed through the render cache, so concurrent requests for the same
+    variant wait for one render and then read the cached file. The cached file only
+    appears at output_path once the whole stem was rendered; if the client disconnects
+    early, the partial render is discarded and a waiting request renders it instead.
+
+    Parameters:
+        source_path (str): Path to the original stem.
+        output_path (str): Cache path of the streamed variant (see stream_cache_path).
+        n_steps (float): Semitones to shift the pitch by.
+        tempo_rate (float): New tempo divided by the original tempo.
+        block_frames (int): Source frames transformed per block.
+
+    Yields:
+        bytes: The WAV header, then 16-bit PCM blocks.
+    """
+    with claim_render(output_path) as tmp_path:
+        if tmp_path is None:
+            # Rendered by a concurrent request while this one waited
+            with open(output_path, "rb") as cached:
+                yield from iter(lambda: cached.read(CACHED_CHUNK_BYTES), b"")
+            return
+
+        get_storage().ensure_local(source_path)
+        with sf.SoundFile(source_path) as source:
+            sample_rate, channels = source.samplerate, source.channels
+            engine = PitchTempoStream(sample_rate, channels, n_steps, tempo_rate)
+            yield wav_stream_header(sample_rate, channels)
+
+            with open_writer(tmp_path, sample_rate, channels, "PCM_16") as cache:
+                while True:
+                    block = source.read(block_frames, dtype="float32", always_2d=True)
+                    last = len(block) < block_frames
+                    pcm = (np.clip(engine.process(block, last), -1.0, 1.0) * 32767).astype("<i2")
+                    cache.write(pcm)
+                    yield pcm.tobytes()
+                    if last:
+                        break
+    print(f"Streamed variant saved as: {output_path}")
@@ -0,0 +1,209 @@
+"""
+Warm-up of the librosa code paths behind renders and analysis, and first-request metrics.
+
+The first pitch shift, HPSS or constant-Q chroma in a fresh process pays for importing
+librosa, numba compiling its kernels and soxr setting up its resamplers, which adds
+seconds to the first request after every deploy or scale-up. Processes that run audio
+work therefore call warm_up at start: it runs every such path once on a short synthetic
+signal, so the first real request finds them compiled.
+
+numba keeps the kernels it compiled in NUMBA_CACHE_DIR (librosa compiles them with
+cache=True), so later processes load them from disk instead of compiling them again.
+configure_jit_cache must run before numba is imported, i.e. before the first librosa call.
+
+The latency of the first request of each job type in a process is recorded, with
+whether the process was warmed up, so `GET /warmup` can compare cold and warm starts.
+
+Dependencies:
+    - os: Configuration and the JIT cache folder.
+    - sys: Checking whether numba was already imported.
+    - time: Warm-up and first-request timings.
+    - threading: Guarding the per-process first-request bookkeeping.
+    - numpy: The synthetic warm-up signal.
+    - librosa: Rendering and analysis paths to warm up, imported on first use.
+    - key_bpm_utils.PREVIEW_RES_TYPE: Resampler quality of previews.
+    - fft_backend: Installing the FFT backend and planning its transform sizes.
+
+Functions:
+    - configure_jit_cache: Point numba's on-disk cache at NUMBA_CACHE_DIR.
+    - synthetic_signal: Short harmonic test signal with note onsets.
+    - warm_up: Run every warmed path once and report the time spent per step.
+    - warmup_status: Warm-up report of this process.
+    - first_request: Measure the first request of a job type in this process.
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+import lazy_loader as lazy
+from .key_bpm_utils import PREVIEW_RES_TYPE
+from .fft_backend import install_fft_backend, plan_fft_sizes
+
+librosa = lazy.load("librosa")
+
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+WARMUP_SECONDS = float(os.getenv("WARMUP_SECONDS", "2"))
+WARMUP_SAMPLE_RATE = int(os.getenv("WARMUP_SAMPLE_RATE", "44100"))
+DEFAULT_NUMBA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "musicnalyzer", "numba")
+
+_status = {"state": "cold" if WARMUP else "disabled"}
+_first_requests = {}
+_lock = threading.Lock()
+
+
+def configure_jit_cache(cache_dir=None):
+    """
+    Point numba's on-disk compilation cache at a persistent folder.
+
+    The folder is exported through the environment, so spawned pool processes share it.
+
+    Parameters:
+        cache_dir (str): Cache folder; NUMBA_CACHE_DIR or DEFAULT_NUMBA_CACHE_DIR by default.
+
+    Returns:
+        str: The cache folder, or None if it is not writable.
+    """
+    cache_dir = cache_dir or os.getenv("NUMBA_CACHE_DIR") or DEFAULT_NUMBA_CACHE_DIR
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        print(f"JIT cache disabled, cannot create {cache_dir}: {e}")
+        return None
+    if "numba" in sys.modules and type(sys.modules["numba"]).__name__ != "_LazyModule":
+        print("numba was imported before its cache folder was configured; set NUMBA_CACHE_DIR instead")
+    os.environ["NUMBA_CACHE_DIR"] = cache_dir
+    return cache_dir
+
+
+def synthetic_signal(seconds=WARMUP_SECONDS, sample_rate=WARMUP_SAMPLE_RATE):
+    """
+    Build a short test signal: a rising sequence of harmonic notes with noise, so that
+    onset, chroma and HPSS paths see realistic content instead of silence.
+
+    Parameters:
+        seconds (float): Length of the signal.
+        sample_rate (int): Sampling rate of the signal.
+
+    Returns:
+        ndarray: Mono float32 signal.
+    """
+    times = np.arange(int(seconds * sample_rate)) / sample_rate
+    notes = 220.0 * 2 ** (np.floor(times * 4) / 12)
+    phase = 2 * np.pi * np.cumsum(notes) / sample_rate
+    envelope = np.exp(-6 * (times % 0.25))
+    signal = sum(np.sin(harmonic * phase) / harmonic for harmonic in (1, 2, 3)) * envelope
+    noise = np.random.default_rng(0).standard_normal(len(times)) * 0.01
+    return (0.3 * signal + noise).astype(np.float32)
+
+
+def _steps(audio, sample_rate):
+    # The paths of key/BPM renders, previews, key detection, features and fingerprints
+    install_fft_backend()
+    stft = librosa.stft(audio)
+    return [
+        ("fft_plans", plan_fft_sizes),
+        ("pitch_shift", lambda: librosa.effects.pitch_shift(y=audio, sr=sample_rate, n_steps=2, bins_per_octave=12)),
+        ("pitch_shift_preview", lambda: librosa.effects.pitch_shift(y=audio, sr=sample_rate, n_steps=2,
+                                                                     bins_per_octave=12, res_type=PREVIEW_RES_TYPE)),
+        ("time_stretch", lambda: librosa.effects.time_stretch(audio, rate=1.1)),
+        ("hpss", lambda: librosa.effects.hpss(audio)),
+        ("hpss_stft", lambda: librosa.decompose.hpss(stft)),
+        ("chroma_cqt", lambda: librosa.feature.chroma_cqt(y=audio, sr=sample_rate, bins_per_octave=24)),
+        ("chroma_stft", lambda: librosa.feature.chroma_stft(S=np.abs(stft) ** 2, sr=sample_rate)),
+        ("mfcc", lambda: librosa.feature.mfcc(y=audio, sr=sample_rate, n_mfcc=13)),
+        ("onset_strength", lambda: librosa.onset.onset_strength(y=audio, sr=sample_rate)),
+        ("resample", lambda: librosa.resample(audio, orig_sr=sample_rate, target_sr=11025, res_type=PREVIEW_RES_TYPE)),
+    ]
+
+
+def warm_up(seconds=WARMUP_SECONDS, sample_rate=WARMUP_SAMPLE_RATE):
+    """
+    Run the rendering and analysis paths once on a synthetic signal.
+
+    A failing step is reported and skipped; warm-up never keeps a process from starting.
+
+    Parameters:
+        seconds (float): Length of the synthetic signal.
+        sample_rate (int): Sampling rate of the synthetic signal.
+
+    Returns:
+        dict: 'state', total 'seconds', seconds per step and the JIT cache folder.
+    """
+    with _lock:
+        if _status["state"] in ("running", "done"):
+            return dict(_status)
+        _status.update(state="running")
+
+    started = time.perf_counter()
+    steps = {}
+    try:
+        audio = synthetic_signal(seconds, sample_rate)
+        import_started = time.perf_counter()
+        named_steps = _steps(audio, sample_rate)
+        steps["import"] = round(time.perf_counter() - import_started, 3)
+        for name, step in named_steps:
+            step_started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                print(f"Warm-up step {name} failed: {e}")
+            steps[name] = round(time.perf_counter() - step_started, 3)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+    report = {"state": "done", "seconds": round(time.perf_counter() - started, 3), "steps": steps,
+              "jit_cache": os.getenv("NUMBA_CACHE_DIR")}
+    with _lock:
+        _status.clear()
+        _status.update(report)
+    print(f"Warm-up finished in {report['seconds']:.2f}s")
+    return report
+
+
+def warmup_status():
+    """
+    Warm-up report and first-request latencies of this process.
+
+    Returns:
+        dict: Warm-up state (cold, running, done or disabled) with its timings, and the
+              first-request seconds per job type.
+    """
+    with _lock:
+        return {**_status, "first_requests": dict(_first_requests)}
+
+
+@contextmanager
+def first_request(job_type, timing_model=None, process="web"):
+    """
+    Measure a request if it is the first of its job type in this process.
+
+    Parameters:
+        job_type (str): Task handler name of the request.
+        timing_model (FirstRequestModel): Optional model persisting the measurement.
+        process (str): Kind of process serving the request ('web', 'pool' or 'worker').
+
+    Yields:
+        None
+    """
+    with _lock:
+        first = job_type not in _first_requests
+        if first:
+            _first_requests[job_type] = None
+        warmed = _status["state"] == "done"
+    if not first:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = round(time.perf_counter() - started, 3)
+        with _lock:
+            _first_requests[job_type] = seconds
+        print(f"First {job_type} request took {seconds:.2f}s ({'warm' if warmed else 'cold'} process)")
+        if timing_model is not None:
+            timing_model.record(job_type, seconds, warmed, process)
@@ -0,0 +1,173 @@
+"""
+Standalone worker that runs ingest and render jobs from the MongoDB work queue.
+
+Start any number of workers, on any number of machines that share the upload folder and
+database; each claims one job at a time under a lease, heartbeats while it runs, and
+records the result. Jobs left behind by a crashed worker are reclaimed once their lease
+expires.
+
+Usage:
+    python worker.py [--lease-seconds 60] [--types ingest change_key ...]
+
+Dependencies:
+    - pymongo: Direct database connection outside of Flask.
+    - flask_socketio.SocketIO: External emitter publishing progress through the message queue.
+    - JobModel: Lease-based job queue.
+    - tasks.run_task: Job handlers.
+    - cancellation.CancelToken: Abandoning jobs cancelled through the job document.
+    - warmup: JIT cache, warm-up at start and first-request latency per job type.
+    - fft_backend.fft_workers: FFT threads of the jobs, one job running at a time.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import traceback
+from types import SimpleNamespace
+from pymongo import MongoClient
+from flask_socketio import SocketIO
+from controllers.song_controller import SongController
+from models.job_model import JobModel
+from models.first_request_model import FirstRequestModel
+from tasks import TASKS, run_task, INGEST_DEADLINE_SECONDS, RENDER_DEADLINE_SECONDS
+from utils.cancellation import CancelToken, Cancelled
+from utils.warmup import configure_jit_cache, warm_up, first_request, WARMUP
+from utils.fft_backend import fft_workers
+
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/musicnalyzer"
+
+
+class Heartbeat(threading.Thread):
+    """
+    Background thread that keeps extending the lease of the job being processed.
+
+    The job's token is cancelled when the lease is lost (another worker took over) or
+    when a cancellation is requested on the job document.
+
+    Attributes:
+        lost (threading.Event): Set when the worker no longer holds the lease.
+        token (CancelToken): Token passed to the job's handler.
+    """
+
+    def __init__(self, job_model, job_id, worker_id, lease_seconds, token=None):
+        super().__init__(daemon=True)
+        self.job_model = job_model
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.token = token or CancelToken()
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            try:
+                if not self.job_model.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                    print(f"Lease lost for job {self.job_id}")
+                    self.lost.set()
+                    self.token.cancel("lease lost")
+                    return
+                reason = self.job_model.cancel_reason(self.job_id)
+                if reason:
+                    print(f"Cancelling job {self.job_id}: {reason}")
+                    self.token.cancel(reason)
+            except Exception as e:
+                # A transient database error should not kill the job; the next beat retries
+                print(f"Heartbeat failed for job {self.job_id}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def process_next(job_model, controller, worker_id, lease_seconds, job_types=None, socketio=None,
+                 first_request_model=None, fft_threads=1):
+    """
+    Claim and run a single job.
+
+    Parameters:
+        job_model (JobModel): Job queue.
+        controller (SongController): Controller used by the task handlers.
+        worker_id (str): Identifier of this worker.
+        lease_seconds (float): Lease duration of claimed jobs.
+        job_types (list): Job types this worker accepts, or None for all.
+        socketio: Optional Socket.IO emitter for progress events.
+        first_request_model (FirstRequestModel): Optional store of first-request latencies.
+        fft_threads (int): Threads per FFT of the job.
+
+    Returns:
+        bool: True if a job was claimed, False if the queue was empty.
+    """
+    job = job_model.claim(worker_id, lease_seconds, job_types)
+    if job is None:
+        return False
+
+    print(f"Claimed job {job['_id']} ({job['type']}, attempt {job['attempts']})")
+    deadline = INGEST_DEADLINE_SECONDS if job["type"] == "ingest" else RENDER_DEADLINE_SECONDS
+    heartbeat = Heartbeat(job_model, job["_id"], worker_id, lease_seconds, CancelToken(deadline))
+    heartbeat.start()
+    try:
+        with fft_workers(fft_threads), first_request(job["type"], first_request_model, "worker"):
+            result = run_task(controller, job["type"], job["payload"], socketio, heartbeat.token)
+        heartbeat.stop()
+        if heartbeat.token.cancelled and result.get("status_code") in (499, 504):
+            # Render handlers report cancellation as an error result instead of raising
+            job_model.cancel(job["_id"], worker_id, heartbeat.token.reason)
+        elif not job_model.complete(job["_id"], worker_id, result):
+            print(f"Job {job['_id']} was reclaimed by another worker, result discarded")
+    except Cancelled as e:
+        heartbeat.stop()
+        print(f"Job {job['_id']} cancelled: {e.reason}")
+        job_model.cancel(job["_id"], worker_id, e.reason)
+    except Exception as e:
+        heartbeat.stop()
+        traceback.print_exc()
+        job_model.fail(job["_id"], worker_id, str(e))
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run jobs from the Musicnalyzer work queue.")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", DEFAULT_MONGO_URI))
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    parser.add_argument("--lease-seconds", type=float, default=60.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--types", nargs="*", choices=sorted(TASKS), help="Job types to accept (default: all).")
+    parser.add_argument("--message-queue", default=os.getenv("SOCKETIO_MESSAGE_QUEUE"),
+                        help="Socket.IO message queue used to publish progress events.")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+    parser.add_argument("--fft-threads", type=int, default=os.cpu_count() or 1,
+                        help="Threads per FFT; lower it when several workers share a machine.")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", default=WARMUP,
+                        help="Skip the warm-up of the audio code paths at start.")
+    args = parser.parse_args(argv)
+
+    # Before anything imports numba, so compiled kernels are shared between processes
+    configure_jit_cache()
+
+    mongo = SimpleNamespace(db=MongoClient(args.mongo_uri).get_default_database())
+    job_model = JobModel(mongo, max_attempts=args.max_attempts)
+    job_model.ensure_indexes()
+    # The job queue lets ingest jobs enqueue the background re-separation of fast-tier songs
+    controller = SongController(mongo, job_model)
+    socketio = SocketIO(message_queue=args.message_queue) if args.message_queue else None
+    first_request_model = FirstRequestModel(mongo)
+    if args.warmup:
+        warm_up()
+
+    print(f"Worker {args.worker_id} waiting for jobs")
+    while True:
+        job_model.expire_exhausted()
+        if process_next(job_model, controller, args.worker_id, args.lease_seconds, args.types, socketio,
+                        first_request_model, args.fft_threads):
+            continue
+        if args.once:
+            return 0
+        time.sleep(args.poll_interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,10 +33,10 @@
 
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useRouter } from "next/navigation";
 import { parseBlob } from "music-metadata-browser";
-import { io } from "socket.io-client"; 
+import { io, Socket } from "socket.io-client"; 
 import { ClipLoader } from "react-spinners";
 
 interface UploadStatus {
@@ -44,6 +44,13 @@ interface UploadStatus {
   message: string;
 }
 
+interface ProgressEvent {
+  job_id: string;
+  percent: number;
+  stage: string | null;
+  eta_seconds: number;
+}
+
 export default function FileUpload() {
   const [uploadedFile, setUploadedFile] = useState<File | null>(null);
   const [isSolo, setIsSolo] = useState(false);
@@ -52,22 +59,25 @@ export default function FileUpload() {
     message: "",
   });
   const [progress, setProgress] = useState(0);  // Track upload progress
+  const [eta, setEta] = useState<number | null>(null);  // Estimated seconds remaining
+  const socketRef = useRef<Socket | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const router = useRouter();
 
   // Initialize Socket.IO connection
   useEffect(() => {
-    const socket = io("http://localhost:5000");  // Connect to backend
+    // Websocket-only transport keeps each client on one server worker without sticky sessions
+    const socket = io("http://localhost:5000", { transports: ["websocket"] });
+    socketRef.current = socket;
 
     socket.on("connect", () => {
       console.log("Connected to WebSocket!");
     });
 
-    // Listen for "progress" events
-    socket.on("progress", (percent: number) => {
-      console.log("Got progress update:", percent);
-      setProgress(percent);
-      // console.log("Progress:", progress);
+    // Listen for "progress" events of the job room joined before uploading
+    socket.on("progress", (event: ProgressEvent) => {
+      setProgress(Math.round(event.percent));
+      setEta(event.percent < 100 ? Math.round(event.eta_seconds) : null);
     });
 
     socket.on("disconnect", () => {
@@ -95,18 +105,37 @@ export default function FileUpload() {
     try {
       const metadata = await extractSongMetadata(file);
 
+      // Join this upload's progress room before the server starts emitting
+      const jobId = crypto.randomUUID();
+      socketRef.current?.emit("join", { job_id: jobId });
+
       const formData = new FormData();
+      formData.append("jobId", jobId);
       formData.append("file", file);
       formData.append("song", metadata?.title || "Unknown Title");
       formData.append("artist", metadata?.artist || "Unknown Artist");
       formData.append("duration", metadata?.duration.toString() || "0");
       formData.append("isSolo", isSolo.toString());
 
-      const response = await fetch("http://localhost:5000/insert", {
+      let response = await fetch("http://localhost:5000/insert", {
         method: "POST",
         body: formData,
       });
 
+      // A near-duplicate of a song already in the library can reuse its stems and analysis
+      if (response.status === 409) {
+        const { candidate } = await response.json();
+        const reuse = window.confirm(
+          `This looks like "${candidate.song}" by ${candidate.artist || "Unknown Artist"}, which is already ` +
+          "in the library. Reuse its stems and analysis instead of processing the file again?"
+        );
+        formData.append("duplicate", reuse ? "reuse" : "ignore");
+        response = await fetch("http://localhost:5000/insert", {
+          method: "POST",
+          body: formData,
+        });
+      }
+
       if (!response.ok) throw new Error("Failed to upload file.");
 
       const data = await response.json();
@@ -249,7 +278,7 @@ export default function FileUpload() {
               xxs:text-sm
               lg:text-lg
               absolute inset-0 flex items-center justify-center text-md font-semibold text-white">
-                {progress}%
+                {progress}%{eta !== null && ` · ~${eta}s left`}
               </span>
             </div>
           )}
@@ -15,7 +15,8 @@ originalBpm: The original BPM of the track before modifications.
 stems: Object containing URLs for each audio stem (e.g., soprano, alto, tenor, instrumentals).
 
 Functional Components:
-handleChange: Sends a request to change either the key or BPM on the server.
+handleChange: Sends a request to change either the key or BPM on the server. The server answers
+with a quick preview of the first seconds and pushes the full render over Socket.IO when done.
 handleBpmInputChange: Handles BPM input changes and updates the track accordingly.
 handleReset: Resets the key and BPM to their original values.
 getDynamicKeyList: Generates a dynamically sorted list of musical keys with the current key in the center.
@@ -42,8 +43,11 @@ stems={audioStems}
 
 
 import { useState, useEffect, useRef } from "react";
+import { io, Socket } from "socket.io-client";
 
 const MUSICAL_KEYS = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"];
+// Stop waiting for a full render that never announces itself (no Socket.IO emitter, lost event)
+const FULL_RENDER_TIMEOUT_MS = 120000;
 
 interface AudioStems {
     soprano: string;
@@ -70,6 +74,14 @@ interface ChangeParams {
     currentBPM: number;
     songId: string;
     currentAudioStems: AudioStems;
+    preview?: boolean;
+    jobId?: string;
+}
+
+interface JobCompleteEvent {
+    job_id: string;
+    type: string;
+    result: { soprano: string; alto?: string; tenor?: string; instrumental: string; error?: string };
 }
 
 export default function KeyBpmControl({
@@ -88,6 +100,41 @@ export default function KeyBpmControl({
     const [dropdownOpen, setDropdownOpen] = useState(false);
     const dropdownRef = useRef(null);
     const [tempBpm, setTempBpm] = useState(bpm);
+    const socketRef = useRef<Socket | null>(null);
+    const pendingJobRef = useRef<string | null>(null);  // Full render replacing the current preview
+    const pendingTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+    const onKeyChangeRef = useRef(onKeyChange);
+    onKeyChangeRef.current = onKeyChange;
+
+    const clearPendingJob = () => {
+        pendingJobRef.current = null;
+        if (pendingTimeoutRef.current) {
+            clearTimeout(pendingTimeoutRef.current);
+            pendingTimeoutRef.current = null;
+        }
+    };
+
+    // Receive full-quality renders that replace the previews
+    useEffect(() => {
+        const socket = io("http://localhost:5000", { transports: ["websocket"] });
+        socketRef.current = socket;
+
+        socket.on("job_complete", (event: JobCompleteEvent) => {
+            if (event.job_id !== pendingJobRef.current) return;
+            clearPendingJob();
+            if (event.result.error) {
+                console.error("Full render failed:", event.result.error);
+                return;
+            }
+            const { soprano, alto, tenor, instrumental } = event.result;
+            onKeyChangeRef.current({ soprano, alto, tenor, instrumentals: instrumental }, {});
+        });
+
+        return () => {
+            clearPendingJob();
+            socket.disconnect();
+        };
+    }, []);
 
 
     useEffect(() => {
@@ -166,7 +213,17 @@ export default function KeyBpmControl({
         value: number,
         // event: React.MouseEvent
     ) => {
+        // The next change is applied to the full render, so wait until it has arrived
+        if (pendingJobRef.current) return;
         const url = type === "key" ? "/change_key" : "/change_bpm";
+        const jobId = crypto.randomUUID();
+        pendingJobRef.current = jobId;
+        pendingTimeoutRef.current = setTimeout(() => {
+            if (pendingJobRef.current !== jobId) return;
+            console.error(`Full render of ${type} change did not arrive, keeping the preview`);
+            clearPendingJob();
+        }, FULL_RENDER_TIMEOUT_MS);
+        socketRef.current?.emit("join", { job_id: jobId });
         try {
             const response = await changeOnServer(
                 `http://localhost:5000${url}`,
@@ -175,12 +232,21 @@ export default function KeyBpmControl({
                     currentKey: musicalKey,
                     currentBPM: parseInt(bpm),
                     songId: songId as string,
-                    currentAudioStems: stems
+                    currentAudioStems: stems,
+                    preview: true,
+                    jobId
                 }
             );
+            // Without an accepted request (network error, 429, ...) no full render will follow
+            if (!response || !response.ok) {
+                clearPendingJob();
+                console.error(`Error changing ${type}: request failed`);
+                return;
+            }
             await handleResponse(response, type);
         } catch (error) {
-            console.error("Error changing ${type}:", error);
+            clearPendingJob();
+            console.error(`Error changing ${type}:`, error);
         }
     };
 